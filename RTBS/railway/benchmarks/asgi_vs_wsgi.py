@@ -0,0 +1,130 @@
+"""
+Requests/sec of the read-heavy endpoints under uvicorn (async views) versus
+gunicorn (sync views).
+
+    pip install uvicorn gunicorn
+    python benchmarks/asgi_vs_wsgi.py --source ADI --destination MMCT --train 12934
+
+Both servers run against the database configured in settings, so point
+DJANGO_SETTINGS_MODULE at a copy if you don't want the benchmark's sessions
+written to your working database. Each server gets the same worker count and
+the same client load: --concurrency threads issuing --requests GETs per path.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+SERVERS = {
+    "wsgi (gunicorn, sync views)": lambda port, workers, threads: [
+        sys.executable, "-m", "gunicorn", "railway.wsgi:application",
+        "--bind", f"127.0.0.1:{port}", "--workers", str(workers), "--threads", str(threads),
+        "--log-level", "warning",
+    ],
+    "asgi (uvicorn, async views)": lambda port, workers, threads: [
+        sys.executable, "-m", "uvicorn", "railway.asgi:application",
+        "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers),
+        "--log-level", "warning",
+    ],
+}
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except urllib.error.HTTPError:
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server at {url} did not start")
+
+
+def fetch(url):
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=30) as response:
+            response.read()
+            ok = response.status < 400
+    except urllib.error.HTTPError as exc:
+        ok = exc.code < 400
+    return time.perf_counter() - started, ok
+
+
+def run_load(base, paths, requests, concurrency):
+    results = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for path in paths:
+            urls = [base + path] * requests
+            started = time.perf_counter()
+            samples = list(pool.map(fetch, urls))
+            elapsed = time.perf_counter() - started
+            latencies = sorted(s for s, _ in samples)
+            results[path] = {
+                "rps": requests / elapsed,
+                "p50_ms": statistics.median(latencies) * 1000,
+                "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+                "errors": sum(1 for _, ok in samples if not ok),
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", required=True, help="source station code")
+    parser.add_argument("--destination", required=True, help="destination station code")
+    parser.add_argument("--train", required=True, help="train number for availability/fare")
+    parser.add_argument("--berth", default="SL")
+    parser.add_argument("--requests", type=int, default=500, help="requests per path")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=4, help="gunicorn threads per worker")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    day = (date.today() + timedelta(days=3)).isoformat()
+    paths = [
+        f"/api/search/?source={args.source}&destination={args.destination}&date={day}",
+        f"/api/availability/?train={args.train}&date={day}",
+        f"/api/fare/?train={args.train}&source={args.source}&destination={args.destination}&berth={args.berth}",
+        "/search/",
+    ]
+
+    report = {}
+    for name, command in SERVERS.items():
+        env = dict(os.environ)
+        env.setdefault("DJANGO_SETTINGS_MODULE", "railway.settings")
+        env.pop("RAILWAY_ASYNC_VIEWS", None)  # railway/asgi.py switches it on for uvicorn
+        process = subprocess.Popen(command(args.port, args.workers, args.threads), cwd=PROJECT_DIR, env=env)
+        try:
+            base = f"http://127.0.0.1:{args.port}"
+            wait_until_up(base + "/search/")
+            run_load(base, paths, min(args.requests, 50), args.concurrency)  # warm caches
+            report[name] = run_load(base, paths, args.requests, args.concurrency)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    for path in paths:
+        print(path)
+        for name, results in report.items():
+            r = results[path]
+            print(
+                f"  {name:30s} {r['rps']:8.1f} req/s  p50 {r['p50_ms']:7.1f} ms  "
+                f"p95 {r['p95_ms']:7.1f} ms  errors {r['errors']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Booking throughput under concurrent writers and readers, with SQLite's
+defaults (RAILWAY_SQLITE_TUNED=0) versus the tuned mode (WAL, IMMEDIATE
+transactions, busy timeout and retry, replica reads).
+
+    python benchmarks/booking_concurrency.py --source ADI --destination MMCT --train 12934
+
+Each mode runs on a fresh copy of the configured database. --writers
+processes each book --bookings tickets (book + mock payment, through the
+views with Django's test client, so no web server is involved) while
+--readers processes run searches for the same route. Reported: confirmed
+bookings per second, failed bookings ("database is locked" separately) and
+search latency.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+MODES = {"sqlite defaults": "0", "tuned (WAL, retry, replica)": "1"}
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[max(int(len(samples) * p) - 1, 0)] * 1000 if samples else 0.0
+
+
+# ---- worker processes ----
+def worker(args):
+    sys.path.insert(0, str(PROJECT_DIR))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "railway.settings")
+    import django
+
+    django.setup()
+    from django.conf import settings
+    from django.contrib.auth import get_user_model
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from django.utils import timezone
+
+    from bookings import database, schedule
+    from bookings.models import Train
+
+    setup_test_environment()  # lets the test client's host through
+    settings.PDF_WORKERS = 0  # don't render tickets
+    train = Train.objects.get(number=args.train)
+    berth = train.berths.select_related("berth_type").first().berth_type.code
+    today = timezone.localdate()
+    days = sorted(
+        d for _, d in schedule.running_dates(today + timedelta(days=1), today + timedelta(days=30), [train.pk])
+    )
+    user, _ = get_user_model().objects.get_or_create(username=f"bench-{args.role}-{args.index}")
+    client = Client(raise_request_exception=False)
+    client.force_login(user)
+
+    while time.time() < args.start_at:
+        time.sleep(0.01)
+    stats = {"ok": 0, "locked": 0, "failed": 0, "latencies": []}
+
+    def failed(response):
+        if response.status_code < 500:
+            return False
+        exc = getattr(response, "exc_info", None)
+        stats["locked" if exc and database.is_busy(exc[1]) else "failed"] += 1
+        return True
+
+    started = time.perf_counter()
+    for i in range(args.count):
+        day = days[(args.index + i) % len(days)].isoformat()
+        t0 = time.perf_counter()
+        if args.role == "read":
+            response = client.post(
+                "/search/", {"source": args.source, "destination": args.destination, "date": day}
+            )
+            if not failed(response):
+                stats["ok"] += 1
+            stats["latencies"].append(time.perf_counter() - t0)
+            continue
+        response = client.post(
+            f"/book/{train.pk}/",
+            {
+                "source": args.source,
+                "destination": args.destination,
+                "date": day,
+                "berth_code": berth,
+                "form-TOTAL_FORMS": "1",
+                "form-INITIAL_FORMS": "0",
+                "form-MIN_NUM_FORMS": "0",
+                "form-MAX_NUM_FORMS": "5",
+                "form-0-name": "Bench",
+                "form-0-age": "30",
+                "form-0-gender": "M",
+            },
+        )
+        if failed(response):
+            continue
+        location = response.get("Location", "")
+        if "/preview/" not in location:
+            stats["failed"] += 1  # sold out, or rejected
+            continue
+        booking_id = location.rstrip("/").split("/")[-1]
+        if not failed(client.post(f"/mock-pay/{booking_id}/")):
+            stats["ok"] += 1
+        stats["latencies"].append(time.perf_counter() - t0)
+    stats["elapsed"] = time.perf_counter() - started
+    print(json.dumps(stats))
+
+
+# ---- driver ----
+def run_mode(args, tuned, db_path):
+    env = dict(os.environ, RAILWAY_SQLITE_TUNED=tuned, RAILWAY_DB_PATH=str(db_path))
+    env.setdefault("DJANGO_SETTINGS_MODULE", "railway.settings")
+    subprocess.run([sys.executable, "manage.py", "migrate", "-v0"], cwd=PROJECT_DIR, env=env, check=True)
+    start_at = time.time() + args.warmup
+    common = [
+        "--worker", "--train", args.train, "--source", args.source,
+        "--destination", args.destination, "--start-at", str(start_at),
+    ]
+    procs = [
+        (role, subprocess.Popen(
+            [sys.executable, __file__, *common, "--role", role, "--index", str(i), "--count", str(count)],
+            cwd=PROJECT_DIR, env=env, stdout=subprocess.PIPE, text=True,
+        ))
+        for role, n, count in (("write", args.writers, args.bookings), ("read", args.readers, args.searches))
+        for i in range(n)
+    ]
+    results = {"write": [], "read": []}
+    for role, proc in procs:
+        out, _ = proc.communicate()
+        if proc.returncode:
+            raise RuntimeError(f"{role} worker failed")
+        results[role].append(json.loads(out.strip().splitlines()[-1]))
+    writes, reads = results["write"], results["read"]
+    wall = max(w["elapsed"] for w in writes)
+    return {
+        "bookings_per_s": sum(w["ok"] for w in writes) / wall,
+        "confirmed": sum(w["ok"] for w in writes),
+        "locked": sum(w["locked"] for w in writes),
+        "failed": sum(w["failed"] for w in writes),
+        "book_p95_ms": percentile([s for w in writes for s in w["latencies"]], 0.95),
+        "search_p50_ms": percentile([s for r in reads for s in r["latencies"]], 0.5),
+        "search_p95_ms": percentile([s for r in reads for s in r["latencies"]], 0.95),
+        "search_errors": sum(r["locked"] + r["failed"] for r in reads),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", required=True, help="source station code")
+    parser.add_argument("--destination", required=True, help="destination station code")
+    parser.add_argument("--train", required=True, help="train number to book")
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--bookings", type=int, default=25, help="bookings per writer")
+    parser.add_argument("--searches", type=int, default=100, help="searches per reader")
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds for workers to start")
+    # worker side
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--role", help=argparse.SUPPRESS)
+    parser.add_argument("--index", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--count", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--start-at", type=float, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        return worker(args)
+
+    source_db = Path(os.environ.get("RAILWAY_DB_PATH", PROJECT_DIR / "db.sqlite3"))
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, tuned in MODES.items():
+            db_path = Path(tmp) / f"bench-{tuned}.sqlite3"
+            shutil.copy(source_db, db_path)
+            report[name] = run_mode(args, tuned, db_path)
+
+    print(f"{args.writers} writers x {args.bookings} bookings, {args.readers} readers x {args.searches} searches")
+    for name, r in report.items():
+        print(
+            f"  {name:30s} {r['bookings_per_s']:7.1f} bookings/s ({r['confirmed']} confirmed, "
+            f"{r['locked']} locked, {r['failed']} failed)  booking p95 {r['book_p95_ms']:7.1f} ms  "
+            f"search p50 {r['search_p50_ms']:6.1f} ms p95 {r['search_p95_ms']:6.1f} ms "
+            f"({r['search_errors']} errors)"
+        )
+
+
+if __name__ == "__main__":
+    main()
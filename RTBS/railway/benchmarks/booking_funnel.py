@@ -0,0 +1,324 @@
+"""
+The booking funnel (search -> book -> pay) under many simulated users
+against a local server, checked afterwards for oversold trains and seats
+sold twice.
+
+    pip install gunicorn        # uvicorn for --server asgi
+    RAILWAY_DB_PATH=/tmp/bench.sqlite3 python manage.py generate_synthetic_data
+    RAILWAY_DB_PATH=/tmp/bench.sqlite3 python benchmarks/booking_funnel.py --users 50 --journeys 20
+
+The server runs on a fresh copy of the configured database, in the tuned
+SQLite mode unless RAILWAY_SQLITE_TUNED says otherwise. Each user is a
+thread with its own session: it logs in, then --rounds times picks one of
+--journeys journeys (few journeys for many users means contention for the
+same seats), posts the search, books 1-4 passengers and pays, following the
+redirects like a browser. Reported: latency percentiles per step,
+completed bookings and requests per second, failures by kind, and the
+inventory check over every train/class/date the run booked:
+
+* oversold: more passengers on a route segment than the class has seats;
+* double-booked: one seat held by two live bookings on overlapping segments;
+* seat map drift: the stored seat map differs from the seats the live
+  bookings hold (leaked or lost holds).
+"""
+import argparse
+import http.cookiejar
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from asgi_vs_wsgi import SERVERS, wait_until_up
+from hot_paths import journeys
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+SERVER_NAMES = {"wsgi": "wsgi (gunicorn, sync views)", "asgi": "asgi (uvicorn, async views)"}
+STEPS = ("search", "book", "pay")
+PASSWORD = "funnel-bench"
+# messages book_train shows when it can't hold the seats
+BOOK_ERRORS = (("seats available", "sold out"), ("being booked heavily", "inventory busy (CAS retries ran out)"))
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[max(int(len(samples) * p) - 1, 0)] * 1000 if samples else 0.0
+
+
+# ---- simulated users ----
+class User:
+    def __init__(self, base, username):
+        self.base = base
+        self.username = username
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+
+    def csrf_token(self):
+        return next((c.value for c in self.cookies if c.name == "csrftoken"), "")
+
+    def request(self, path, data=None):
+        """(final path after redirects, status, body); OSError if the server is unreachable."""
+        body = None
+        if data is not None:
+            body = urllib.parse.urlencode({**data, "csrfmiddlewaretoken": self.csrf_token()}).encode()
+        try:
+            with self.opener.open(self.base + path, body, timeout=60) as response:
+                body = response.read().decode(errors="replace")
+                return urllib.parse.urlparse(response.url).path, response.status, body
+        except urllib.error.HTTPError as exc:
+            return path, exc.code, exc.read().decode(errors="replace")
+
+    def login(self):
+        self.request("/login/")
+        path, status, _ = self.request("/login/", {"username": self.username, "password": PASSWORD})
+        if path.startswith("/login/"):
+            raise RuntimeError(f"login failed for {self.username} ({status})")
+
+
+def simulate(user, trips, rounds, think, rng, stats):
+    try:
+        user.login()
+        for _ in range(rounds):
+            funnel(user, trips, rng, stats)
+            if think:
+                time.sleep(rng.expovariate(1 / think))
+    except (OSError, RuntimeError) as exc:
+        stats.fail(f"user gave up: {type(exc).__name__}", {})
+
+
+def funnel(user, trips, rng, stats):
+    """One search -> book -> pay round."""
+    trip = rng.choice(trips)
+    timings = {}
+
+    started = time.perf_counter()
+    _, status, _ = user.request(
+        "/search/", {"source": trip["source"], "destination": trip["destination"], "date": trip["date"]}
+    )
+    timings["search"] = time.perf_counter() - started
+    if status >= 400:
+        stats.fail(f"search HTTP {status}", timings)
+        return
+
+    size = rng.choices((1, 2, 3, 4), (55, 25, 12, 8))[0]
+    form = {
+        "source": trip["source"], "destination": trip["destination"], "date": trip["date"],
+        "berth_code": trip["berth"], "form-TOTAL_FORMS": str(size), "form-INITIAL_FORMS": "0",
+        "form-MIN_NUM_FORMS": "0", "form-MAX_NUM_FORMS": "5",
+    }
+    for i in range(size):
+        form.update({f"form-{i}-name": f"Traveller {i + 1}", f"form-{i}-age": str(rng.randint(5, 80)),
+                     f"form-{i}-gender": rng.choice("MF")})
+    started = time.perf_counter()
+    path, status, body = user.request(f"/book/{trip['train']}/", form)
+    timings["book"] = time.perf_counter() - started
+    if status >= 400:
+        stats.fail(f"book HTTP {status}", timings)
+        return
+    if not path.startswith("/preview/"):
+        # the form came back with a message
+        stats.fail(next((kind for text, kind in BOOK_ERRORS if text in body), "book rejected"), timings)
+        return
+
+    booking_id = path.rstrip("/").split("/")[-1]
+    started = time.perf_counter()
+    path, status, _ = user.request(f"/mock-pay/{booking_id}/", {})
+    timings["pay"] = time.perf_counter() - started
+    if status >= 400 or not path.startswith("/ticket/"):
+        stats.fail(f"pay HTTP {status}" if status >= 400 else "payment rejected", timings)
+        return
+    stats.done(timings)
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.failures = Counter()
+        self.completed = 0
+        self.requests = 0
+
+    def record(self, timings):
+        for step, seconds in timings.items():
+            self.latencies[step].append(seconds)
+        self.requests += len(timings)
+
+    def done(self, timings):
+        with self.lock:
+            self.record(timings)
+            self.completed += 1
+
+    def fail(self, kind, timings):
+        with self.lock:
+            self.record(timings)
+            self.failures[kind] += 1
+
+
+# ---- setup and checks, in this process against the benchmark's database copy ----
+def prepare(args):
+    """Bench users and the journeys to book, as (usernames, trips)."""
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.hashers import make_password
+
+    from bookings.models import Station, TrainBerthAvailability
+
+    User = get_user_model()
+    names = [f"funnel{i:05d}" for i in range(args.users)]
+    User.objects.filter(username__in=names).delete()
+    password = make_password(PASSWORD)  # hashed once for all users
+    User.objects.bulk_create(User(username=n, password=password) for n in names)
+
+    rng = random.Random(args.seed)
+    sample = journeys(args.journeys, args.seed)
+    codes = dict(Station.objects.filter(pk__in={s for _, a, b, _ in sample for s in (a, b)}).values_list("pk", "code"))
+    classes = defaultdict(list)
+    for train_id, code in TrainBerthAvailability.objects.filter(
+        train_id__in={t for t, _, _, _ in sample}
+    ).values_list("train_id", "berth_type__code"):
+        classes[train_id].append(code)
+    trips = [
+        {"train": t, "source": codes[a], "destination": codes[b], "date": d.isoformat(),
+         "berth": rng.choice(classes[t])}
+        for t, a, b, d in sample
+        if classes[t]
+    ]
+    return names, trips
+
+
+def check_inventory(since):
+    """Violation counts over the (train, class, date) groups booked since `since`."""
+    from bookings import inventory
+    from bookings.models import Booking, DailyTrainAvailability, Passenger, TrainBerthAvailability
+
+    groups = set(
+        Booking.objects.filter(created_at__gte=since).values_list("train_id", "berth_type_id", "date_of_journey")
+    )
+    live = Booking.objects.filter(status__in=("PENDING", "CONFIRMED"))
+    capacity = {
+        (t, b): c for t, b, c in TrainBerthAvailability.objects.values_list("train_id", "berth_type_id", "capacity")
+    }
+    found = Counter()
+    for train_id, berth_type_id, day in sorted(groups):
+        segments = inventory.segment_count(train_id)
+        seats = capacity.get((train_id, berth_type_id), 0)
+        spans = {
+            pk: (seg_from or 0, segments if seg_to is None else seg_to)
+            for pk, seg_from, seg_to in live.filter(
+                train_id=train_id, berth_type_id=berth_type_id, date_of_journey=day
+            ).values_list("pk", "seg_from", "seg_to")
+        }
+        expected = inventory.SeatMap(segments, seats)
+        load = [0] * segments
+        for booking_id, seat in Passenger.objects.filter(booking_id__in=spans).values_list("booking_id", "seat_index"):
+            start, end = spans[booking_id]
+            for s in range(start, end):
+                load[s] += 1
+            if seat is None:
+                continue
+            if expected.occupied(start, end) >> seat & 1:
+                found["double-booked seats"] += 1
+            expected.take([seat], start, end)
+        if any(n > seats for n in load):
+            found["oversold train/class/dates"] += 1
+        dta = DailyTrainAvailability.objects.filter(
+            train_id=train_id, berth_type_id=berth_type_id, date=day
+        ).first()
+        if dta is None or inventory.load(dta, seats, segments).rows != expected.rows:
+            found["seat map drift"] += 1
+    return len(groups), found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50, help="concurrent simulated users")
+    parser.add_argument("--rounds", type=int, default=10, help="search -> book -> pay rounds per user")
+    parser.add_argument("--journeys", type=int, default=20, help="distinct journeys the users pick from")
+    parser.add_argument("--think", type=float, default=0.0, help="mean seconds between a user's rounds")
+    parser.add_argument("--server", choices=SERVER_NAMES, default="wsgi")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=8, help="gunicorn threads per worker")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    source_db = Path(os.environ.get("RAILWAY_DB_PATH", PROJECT_DIR / "db.sqlite3"))
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "funnel.sqlite3"
+        shutil.copy(source_db, db_path)
+        env = dict(os.environ, RAILWAY_DB_PATH=str(db_path), PDF_CACHE_DIR=str(Path(tmp) / "pdf"))
+        env.setdefault("DJANGO_SETTINGS_MODULE", "railway.settings")
+        env.setdefault("RAILWAY_SQLITE_TUNED", "1")  # as deployed; the copy may switch to WAL
+        env.pop("RAILWAY_ASYNC_VIEWS", None)  # railway/asgi.py switches it on for uvicorn
+        subprocess.run([sys.executable, "manage.py", "migrate", "-v0"], cwd=PROJECT_DIR, env=env, check=True)
+
+        os.environ.update(RAILWAY_DB_PATH=str(db_path), DJANGO_SETTINGS_MODULE=env["DJANGO_SETTINGS_MODULE"])
+        sys.path.insert(0, str(PROJECT_DIR))
+        import django
+
+        django.setup()
+        from django.db import connections
+        from django.utils import timezone
+
+        names, trips = prepare(args)
+        connections.close_all()
+
+        command = SERVERS[SERVER_NAMES[args.server]](args.port, args.workers, args.threads)
+        server = subprocess.Popen(command, cwd=PROJECT_DIR, env=env)
+        try:
+            base = f"http://127.0.0.1:{args.port}"
+            wait_until_up(base + "/login/")
+            since = timezone.now()
+            stats = Stats()
+            users = [
+                threading.Thread(
+                    target=simulate,
+                    args=(User(base, name), trips, args.rounds, args.think, random.Random(args.seed + i), stats),
+                )
+                for i, name in enumerate(names)
+            ]
+            started = time.perf_counter()
+            for user in users:
+                user.start()
+            for user in users:
+                user.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+        checked, violations = check_inventory(since)
+
+    print(
+        f"{args.users} users x {args.rounds} rounds over {len(trips)} journeys, "
+        f"{SERVER_NAMES[args.server]} with {args.workers} workers, in {elapsed:.1f}s"
+    )
+    for step in STEPS:
+        samples = stats.latencies[step]
+        print(
+            f"  {step:7s} {len(samples):6d} requests  p50 {percentile(samples, 0.5):7.1f} ms  "
+            f"p95 {percentile(samples, 0.95):7.1f} ms  p99 {percentile(samples, 0.99):7.1f} ms"
+        )
+    print(
+        f"  {stats.completed} bookings completed ({stats.completed / elapsed:.1f}/s), "
+        f"{stats.requests / elapsed:.1f} funnel requests/s"
+    )
+    for kind, n in stats.failures.most_common():
+        print(f"  {kind}: {n}")
+    print(f"  inventory check over {checked} train/class/dates:")
+    for kind in ("oversold train/class/dates", "double-booked seats", "seat map drift"):
+        print(f"    {kind}: {violations[kind]}")
+    if any(violations.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
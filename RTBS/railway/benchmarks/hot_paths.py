@@ -0,0 +1,179 @@
+"""
+Micro-benchmarks of the booking hot paths: fare calculation, route lookup
+and availability reads.
+
+    RAILWAY_DB_PATH=/tmp/bench.sqlite3 python manage.py generate_synthetic_data
+    RAILWAY_DB_PATH=/tmp/bench.sqlite3 python benchmarks/hot_paths.py --save baseline.json
+    ... change something ...
+    RAILWAY_DB_PATH=/tmp/bench.sqlite3 python benchmarks/hot_paths.py --compare baseline.json
+
+Every case runs in-process against the configured database (it only reads).
+Inputs are real journeys from the route index (station pairs a train runs
+between, on days it runs), cycled so the caches see more than one key. Each
+case is timed like timeit: enough calls for ~0.2s, best of --repeat runs,
+reported per call. "cold" availability cases clear the search cache before
+every call, "warm" ones read through it. --compare exits with status 1 when a
+case got slower than the baseline by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+from datetime import timedelta
+from itertools import cycle
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+def journeys(count, seed):
+    """[(train_id, src_station_id, dst_station_id, date)] sampled from the route index."""
+    from django.utils import timezone
+
+    from bookings import schedule
+    from bookings.routes import route_index
+
+    rng = random.Random(seed)
+    today = timezone.localdate()
+    running = sorted(schedule.running_dates(today + timedelta(days=1), today + timedelta(days=14)))
+    if not running:
+        raise SystemExit("No trains run in the next two weeks; populate the database first.")
+    picked = []
+    for train_id, day in rng.sample(running, min(count, len(running))):
+        stops = route_index.stops(train_id)
+        if len(stops) < 2:
+            continue
+        i, j = sorted(rng.sample(range(len(stops)), 2))
+        picked.append((train_id, stops[i][0], stops[j][0], day))
+    return picked
+
+
+def cases(args):
+    from bookings import caching, inventory, search
+    from bookings.models import BerthType, Station, TrainBerthAvailability
+    from bookings.routes import route_index
+    from bookings.utils import calculate_fare, calculate_fares
+
+    route_index.rebuild()
+    sample = journeys(args.journeys, args.seed)
+    stations = Station.objects.in_bulk([s for _, a, b, _ in sample for s in (a, b)])
+    prices = [b.price_per_km for b in BerthType.objects.all()]
+    matches = [route_index.match(t, a, b) for t, a, b, _ in sample]
+    # a busy search's worth of (distance, price) pairs
+    fare_pairs = [(m.distance, prices[i % len(prices)]) for i, m in enumerate(matches)][:60]
+    capacities = dict(
+        ((t, b), c) for t, b, c in TrainBerthAvailability.objects.values_list("train_id", "berth_type_id", "capacity")
+    )
+    cache = caching.search_cache()
+
+    def rotate(items):
+        it = cycle(items)
+        return lambda: next(it)
+
+    next_match = rotate(matches)
+    next_journey = rotate(sample)
+    next_price = rotate(prices)
+
+    def fare():
+        m = next_match()
+        calculate_fare(m.distance, next_price(), 2)
+
+    def route_lookup():
+        _, a, b, _ = next_journey()
+        route_index.trains_between(a, b)
+
+    def route_match():
+        t, a, b, _ = next_journey()
+        route_index.match(t, a, b)
+
+    def seat_maps(cold):
+        def run():
+            t, _, _, day = next_journey()
+            if cold:
+                cache.clear()
+            search.seat_maps([t], day)
+
+        return run
+
+    def seats_left():
+        t, a, b, day = next_journey()
+        m = route_index.match(t, a, b)
+        start, end = inventory.segment_span(m)
+        segments = inventory.segment_count(t)
+        for berth_type_id, data in search.seat_maps([t], day).get(t, {}).items():
+            inventory.SeatMap.from_bytes(data, segments, capacities[t, berth_type_id]).free_count(start, end)
+
+    def find_trains(cold):
+        def run():
+            _, a, b, day = next_journey()
+            if cold:
+                cache.clear()
+            search.find_trains(stations[a], stations[b], day)
+
+        return run
+
+    return {
+        "calculate_fare": fare,
+        "calculate_fares (60 pairs)": lambda: calculate_fares(fare_pairs, 2),
+        "route trains_between": route_lookup,
+        "route match": route_match,
+        "route index rebuild": route_index.rebuild,
+        "seat_maps cold": seat_maps(True),
+        "seat_maps warm": seat_maps(False),
+        "seats left (decode + count)": seats_left,
+        "find_trains cold": find_trains(True),
+        "find_trains warm": find_trains(False),
+    }
+
+
+def measure(func, repeat):
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    if elapsed < 0.2:
+        number = max(int(number * 0.2 / elapsed), 1)
+    return min(timer.repeat(repeat, number)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--journeys", type=int, default=200, help="distinct inputs cycled through")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", help="run the cases whose name contains this")
+    parser.add_argument("--save", help="write the results as JSON")
+    parser.add_argument("--compare", help="JSON from an earlier --save to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before failing")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(PROJECT_DIR))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "railway.settings")
+    import django
+
+    django.setup()
+
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else {}
+    results, regressions = {}, []
+    for name, func in cases(args).items():
+        if args.only and args.only not in name:
+            continue
+        seconds = results[name] = measure(func, args.repeat)
+        line = f"  {name:30s} {seconds * 1e6:12.1f} us/call"
+        if name in baseline:
+            change = seconds / baseline[name] - 1
+            line += f"  {change:+7.1%} vs baseline"
+            if change > args.tolerance:
+                regressions.append(name)
+                line += "  REGRESSION"
+        print(line, flush=True)
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, indent=2))
+    if regressions:
+        print(f"{len(regressions)} case(s) slower than the baseline by more than {args.tolerance:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
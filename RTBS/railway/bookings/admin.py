@@ -1,6 +1,7 @@
 from django.contrib import admin
 from .models import (User, Station, BerthType, Train, TrainBerthAvailability,
-                     RouteStop, DailyTrainAvailability, Booking, Passenger, Payment)
+                     RouteStop, DailyTrainAvailability, Booking, Passenger, Payment,
+                     TrainRunException)
 
 admin.site.register(User)
 admin.site.register(Station)
@@ -8,6 +9,7 @@ admin.site.register(BerthType)
 admin.site.register(Train)
 admin.site.register(TrainBerthAvailability)
 admin.site.register(RouteStop)
+admin.site.register(TrainRunException)
 admin.site.register(DailyTrainAvailability)
 admin.site.register(Booking)
 admin.site.register(Passenger)
@@ -0,0 +1,337 @@
+# bookings/api.py
+"""
+Read-only JSON API for partner integrations.
+
+Search, availability and fares are public. PNR status is not: PNRs are
+sequential booking ids, so it needs a logged-in session and only shows the
+caller's own bookings (staff see any); other PNRs are reported as not found.
+
+Responses are compact JSON (no whitespace, Decimals as strings) with an ETag;
+a matching If-None-Match gets an empty 304. Search can also stream NDJSON,
+one train per line, with ?format=ndjson or Accept: application/x-ndjson.
+
+Parameter parsing, lookups and payloads are public so the async endpoints
+(bookings/async_views.py) share them; lookups come in sync/async pairs.
+"""
+import hashlib
+import json
+from datetime import date, timedelta
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from . import holds, inventory, schedule
+from .models import Booking, Station, Train, TrainBerthAvailability
+from .routes import route_index
+from .search import iter_trains, seat_maps
+from .utils import calculate_fare
+
+MAX_ADVANCE_DAYS = 30
+MAX_PASSENGERS = 5
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def dumps(payload):
+    return json.dumps(payload, cls=DjangoJSONEncoder, separators=(",", ":"))
+
+
+def _etag_matches(request, etag):
+    tags = [t.strip() for t in request.headers.get("If-None-Match", "").split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def json_response(request, payload, status=200):
+    body = dumps(payload).encode("utf-8")
+    etag = '"%s"' % hashlib.sha1(body).hexdigest()
+    if status == 200 and _etag_matches(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, status=status, content_type="application/json")
+    response["ETag"] = etag
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
+def api_view(view_func):
+    """GET only; ApiError becomes a JSON error body. Works for sync and async views."""
+    if iscoroutinefunction(view_func):
+
+        async def wrapped(request, *args, **kwargs):
+            try:
+                return await view_func(request, *args, **kwargs)
+            except ApiError as exc:
+                return json_response(request, {"error": str(exc)}, status=exc.status)
+
+    else:
+
+        def wrapped(request, *args, **kwargs):
+            try:
+                return view_func(request, *args, **kwargs)
+            except ApiError as exc:
+                return json_response(request, {"error": str(exc)}, status=exc.status)
+
+    return require_GET(wraps(view_func)(wrapped))
+
+
+# ---- parameters ----
+def param(request, name):
+    value = request.GET.get(name)
+    if not value:
+        raise ApiError(f"Missing parameter '{name}'.")
+    return value
+
+
+def journey_date(request):
+    try:
+        value = date.fromisoformat(param(request, "date"))
+    except ValueError:
+        raise ApiError("Invalid date, expected YYYY-MM-DD.")
+    if value < date.today():
+        raise ApiError("Cannot search for past dates.")
+    if value > date.today() + timedelta(days=MAX_ADVANCE_DAYS):
+        raise ApiError(f"Booking allowed only up to {MAX_ADVANCE_DAYS} days in advance.")
+    return value
+
+
+def passenger_count(request):
+    try:
+        passengers = int(request.GET.get("passengers", 1))
+    except ValueError:
+        raise ApiError("passengers must be a number.")
+    if not 1 <= passengers <= MAX_PASSENGERS:
+        raise ApiError(f"passengers must be between 1 and {MAX_PASSENGERS}.")
+    return passengers
+
+
+def wants_segment(request):
+    """Whether availability is asked for ?source..?destination instead of the whole run."""
+    return bool(request.GET.get("source") or request.GET.get("destination"))
+
+
+def wants_ndjson(request):
+    return request.GET.get("format") == "ndjson" or "application/x-ndjson" in request.headers.get(
+        "Accept", ""
+    )
+
+
+# ---- lookups ----
+def get_station(request, name):
+    code = param(request, name)
+    try:
+        return Station.objects.get(code=code)
+    except Station.DoesNotExist:
+        raise ApiError(f"Unknown station '{code}'.", status=404)
+
+
+async def aget_station(request, name):
+    code = param(request, name)
+    try:
+        return await Station.objects.aget(code=code)
+    except Station.DoesNotExist:
+        raise ApiError(f"Unknown station '{code}'.", status=404)
+
+
+def get_train(request):
+    number = param(request, "train")
+    try:
+        return Train.objects.get(number=number)
+    except Train.DoesNotExist:
+        raise ApiError(f"Unknown train '{number}'.", status=404)
+
+
+async def aget_train(request):
+    number = param(request, "train")
+    try:
+        return await Train.objects.aget(number=number)
+    except Train.DoesNotExist:
+        raise ApiError(f"Unknown train '{number}'.", status=404)
+
+
+def get_berth(train, request):
+    code = param(request, "berth")
+    try:
+        return train.berths.select_related("berth_type").get(berth_type__code=code)
+    except TrainBerthAvailability.DoesNotExist:
+        raise ApiError("Selected berth invalid for this train.", status=404)
+
+
+async def aget_berth(train, request):
+    code = param(request, "berth")
+    try:
+        return await train.berths.select_related("berth_type").aget(berth_type__code=code)
+    except TrainBerthAvailability.DoesNotExist:
+        raise ApiError("Selected berth invalid for this train.", status=404)
+
+
+def check_running(train, journey_date):
+    if not schedule.runs_on(train.pk, journey_date):
+        raise ApiError(f"Train {train.number} does not run on {journey_date}.", status=404)
+
+
+def route_match(train, src, dst):
+    match = route_index.match(train.pk, src.pk, dst.pk)
+    if match is None:
+        raise ApiError("Train does not stop at the selected stations.", status=404)
+    return match
+
+
+def pnr_lookup(user, pnr):
+    """Lookup kwargs for the bookings `user` may see the status of."""
+    if not user.is_authenticated:
+        raise ApiError("Log in to see PNR status.", status=401)
+    return {"pk": pnr} if user.is_staff else {"pk": pnr, "user": user}
+
+
+# ---- payloads ----
+def train_json(train):
+    return {"id": train.pk, "number": train.number, "name": train.name}
+
+
+def result_json(result):
+    return {
+        "train": train_json(result["train"]),
+        "berths": [
+            {
+                "code": b["berth"].code,
+                "name": b["berth"].name,
+                "seats_left": b["seats_left"],
+                "fare_per_passenger": b["fare_per_passenger"],
+                "fare_total_preview": b["fare_total_preview"],
+            }
+            for b in result["berths"]
+        ],
+    }
+
+
+def ndjson_line(result):
+    return dumps(result_json(result)) + "\n"
+
+
+def search_payload(src, dst, journey_date, results):
+    results = [result_json(r) for r in results]
+    query = {"source": src.code, "destination": dst.code, "date": journey_date}
+    return {"query": query, "count": len(results), "results": results}
+
+
+def availability_payload(train, journey_date, train_berths, maps, segments, span):
+    """Seats left per berth over the segment span (seg_from, seg_to), from the seat maps."""
+    return {
+        "train": train_json(train),
+        "date": journey_date,
+        "berths": [
+            {
+                "code": tb.berth_type.code,
+                "capacity": tb.capacity,
+                "seats_left": inventory.SeatMap.from_bytes(
+                    maps.get(tb.berth_type_id), segments, tb.capacity
+                ).free_count(*span),
+            }
+            for tb in train_berths
+        ],
+    }
+
+
+def fare_quote_payload(train, src, dst, tb, match, passengers):
+    return {
+        "train": train_json(train),
+        "source": src.code,
+        "destination": dst.code,
+        "berth": tb.berth_type.code,
+        "distance_km": match.distance,
+        "passengers": passengers,
+        "fare": calculate_fare(
+            distance_km=match.distance,
+            price_per_km=tb.berth_type.price_per_km,
+            passengers=passengers,
+        ),
+    }
+
+
+def pnr_payload(booking, seat_numbers):
+    """Status of `booking` (with its train, stations and berth type); no passenger names."""
+    payload = {
+        "pnr": booking.pk,
+        "status": booking.status,
+        "train": train_json(booking.train),
+        "source": booking.source.code,
+        "destination": booking.destination.code,
+        "date_of_journey": booking.date_of_journey,
+        "berth": booking.berth_type.code,
+        "passengers": [{"seat_number": seat} for seat in seat_numbers],
+    }
+    if booking.status == "PENDING":
+        payload["hold_expires_at"] = holds.hold_deadline(booking)
+    return payload
+
+
+# ---- endpoints ----
+@api_view
+def search(request):
+    """Trains from ?source to ?destination on ?date with seats and fares per berth."""
+    src = get_station(request, "source")
+    dst = get_station(request, "destination")
+    day = journey_date(request)
+
+    if wants_ndjson(request):
+
+        def lines():
+            for result in iter_trains(src, dst, day):
+                yield ndjson_line(result)
+
+        return StreamingHttpResponse(lines(), content_type="application/x-ndjson")
+
+    return json_response(request, search_payload(src, dst, day, iter_trains(src, dst, day)))
+
+
+@api_view
+def availability(request):
+    """Seats left per berth for ?train on ?date, over ?source..?destination or the whole run."""
+    train = get_train(request)
+    day = journey_date(request)
+    check_running(train, day)
+    segments = inventory.segment_count(train.pk)
+    span = (0, segments)
+    if wants_segment(request):
+        src = get_station(request, "source")
+        dst = get_station(request, "destination")
+        span = inventory.segment_span(route_match(train, src, dst))
+
+    maps = seat_maps([train.pk], day).get(train.pk, {})
+    train_berths = TrainBerthAvailability.objects.filter(train=train).select_related("berth_type")
+    return json_response(
+        request, availability_payload(train, day, train_berths, maps, segments, span)
+    )
+
+
+@api_view
+def fare_quote(request):
+    """Fare breakdown for ?passengers (default 1) on ?train in ?berth from ?source to ?destination."""
+    train = get_train(request)
+    src = get_station(request, "source")
+    dst = get_station(request, "destination")
+    passengers = passenger_count(request)
+    tb = get_berth(train, request)
+    match = route_match(train, src, dst)
+    return json_response(request, fare_quote_payload(train, src, dst, tb, match, passengers))
+
+
+@api_view
+def pnr_status(request, pnr):
+    """Booking status and seat numbers for one of the user's PNRs (no passenger names)."""
+    lookup = pnr_lookup(request.user, pnr)
+    try:
+        booking = Booking.objects.select_related(
+            "train", "source", "destination", "berth_type"
+        ).get(**lookup)
+    except Booking.DoesNotExist:
+        raise ApiError("PNR not found.", status=404)
+    seats = booking.passengers.order_by("pk").values_list("seat_number", flat=True)
+    return json_response(request, pnr_payload(booking, seats))
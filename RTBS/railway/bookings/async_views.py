@@ -0,0 +1,198 @@
+# bookings/async_views.py
+"""
+Async versions of the read-heavy views, served when RAILWAY_ASYNC_VIEWS is on
+(the default under railway/asgi.py).
+
+They use the async ORM and cache APIs and start independent lookups together
+with asyncio.gather. Templates are still rendered through sync_to_async:
+Django's template engine, sessions and messages are synchronous. The JSON
+endpoints parse parameters and build payloads with the helpers of
+bookings/api.py, so both versions answer alike.
+"""
+import asyncio
+from datetime import date, timedelta
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import render
+
+from . import api, database, inventory
+from .api import ApiError, api_view
+from .middleware import query_budget
+from .models import Booking, Station, TrainBerthAvailability
+from .search import afind_trains, aiter_trains, aseat_maps
+
+
+async def _render(request, template_name, context):
+    request.user = await request.auser()
+    return await sync_to_async(render)(request, template_name, context)
+
+
+async def _stations():
+    return [s async for s in Station.objects.order_by("name")]
+
+
+async def _get_or_404(queryset, **lookup):
+    try:
+        return await queryset.aget(**lookup)
+    except queryset.model.DoesNotExist:
+        raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+
+
+# ---- HTML views ----
+@database.read_only
+@query_budget(queries=12)
+async def search_trains(request):
+    today_iso = date.today().isoformat()
+    max_date_iso = (date.today() + timedelta(days=30)).isoformat()
+    context = {"today": today_iso, "max_date": max_date_iso}
+
+    if request.method != "POST":
+        context["stations"] = await _stations()
+        return await _render(request, "bookings/search.html", context)
+
+    src_code = request.POST.get("source")
+    dst_code = request.POST.get("destination")
+    date_str = request.POST.get("date")
+    warning = None
+    if not (src_code and dst_code and date_str):
+        warning = "Please fill all fields."
+    else:
+        journey_date = date.fromisoformat(date_str)
+        if journey_date < date.today():
+            warning = "Cannot search for past dates."
+        elif journey_date > date.today() + timedelta(days=30):
+            warning = "Booking allowed only up to 30 days in advance."
+    if warning:
+        await sync_to_async(messages.warning)(request, warning)
+        context["stations"] = await _stations()
+        return await _render(request, "bookings/search.html", context)
+
+    stations, src, dst = await asyncio.gather(
+        _stations(),
+        _get_or_404(Station.objects.all(), code=src_code),
+        _get_or_404(Station.objects.all(), code=dst_code),
+    )
+    results = await afind_trains(src, dst, journey_date)
+    if not results:
+        await sync_to_async(messages.info)(
+            request, "No trains found for the selected route/date."
+        )
+    context.update({"stations": stations, "results": results})
+    return await _render(request, "bookings/search.html", context)
+
+
+@login_required
+@database.read_only
+@query_budget(queries=6)
+async def my_bookings(request):
+    user = await request.auser()
+    bookings = [
+        b
+        async for b in user.bookings.select_related(
+            "train", "source", "destination", "berth_type"
+        )
+        .prefetch_related("passengers")
+        .order_by("-created_at")
+    ]
+    return await _render(request, "bookings/my_bookings.html", {"bookings": bookings})
+
+
+@login_required
+@query_budget(queries=10)
+async def ticket_success(request, booking_id):
+    user = await request.auser()
+    booking = await _get_or_404(
+        Booking.objects.select_related(
+            "train", "source", "destination", "berth_type"
+        ).prefetch_related("passengers"),
+        pk=booking_id,
+        user=user,
+    )
+    return await _render(request, "bookings/ticket.html", {"booking": booking})
+
+
+# ---- JSON API ----
+@api_view
+async def api_search(request):
+    day = api.journey_date(request)
+    src, dst = await asyncio.gather(
+        api.aget_station(request, "source"), api.aget_station(request, "destination")
+    )
+
+    if api.wants_ndjson(request):
+
+        async def lines():
+            async for result in aiter_trains(src, dst, day):
+                yield api.ndjson_line(result)
+
+        return StreamingHttpResponse(lines(), content_type="application/x-ndjson")
+
+    results = [r async for r in aiter_trains(src, dst, day)]
+    return api.json_response(request, api.search_payload(src, dst, day, results))
+
+
+@api_view
+async def api_availability(request):
+    train = await api.aget_train(request)
+    day = api.journey_date(request)
+    await sync_to_async(api.check_running)(train, day)
+    segments = await sync_to_async(inventory.segment_count)(train.pk)
+    span = (0, segments)
+    if api.wants_segment(request):
+        src, dst = await asyncio.gather(
+            api.aget_station(request, "source"), api.aget_station(request, "destination")
+        )
+        span = inventory.segment_span(await sync_to_async(api.route_match)(train, src, dst))
+
+    async def berths():
+        return [
+            tb
+            async for tb in TrainBerthAvailability.objects.filter(
+                train=train
+            ).select_related("berth_type")
+        ]
+
+    maps, train_berths = await asyncio.gather(aseat_maps([train.pk], day), berths())
+    return api.json_response(
+        request,
+        api.availability_payload(
+            train, day, train_berths, maps.get(train.pk, {}), segments, span
+        ),
+    )
+
+
+@api_view
+async def api_fare_quote(request):
+    passengers = api.passenger_count(request)
+    train, src, dst = await asyncio.gather(
+        api.aget_train(request),
+        api.aget_station(request, "source"),
+        api.aget_station(request, "destination"),
+    )
+    tb = await api.aget_berth(train, request)
+    match = await sync_to_async(api.route_match)(train, src, dst)
+    return api.json_response(
+        request, api.fare_quote_payload(train, src, dst, tb, match, passengers)
+    )
+
+
+@api_view
+async def api_pnr_status(request, pnr):
+    lookup = api.pnr_lookup(await request.auser(), pnr)
+    try:
+        booking = await Booking.objects.select_related(
+            "train", "source", "destination", "berth_type"
+        ).aget(**lookup)
+    except Booking.DoesNotExist:
+        raise ApiError("PNR not found.", status=404)
+    seats = [
+        seat
+        async for seat in booking.passengers.order_by("pk").values_list(
+            "seat_number", flat=True
+        )
+    ]
+    return api.json_response(request, api.pnr_payload(booking, seats))
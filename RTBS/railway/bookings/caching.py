@@ -0,0 +1,83 @@
+# bookings/caching.py
+"""
+Cache keys for search results.
+
+Two layers live in the "search" cache alias:
+
+* route results per (source, destination, date): trains, berths, segment
+  spans and fares. Kept for SEARCH_CACHE_TTL and dropped all at once by
+  bumping a generation number whenever routes, trains, berths or prices change.
+  The route index (bookings/routes.py) of every process rebuilds when it sees
+  a new generation, so no process fills the new generation from old routes.
+  A RouteStop edit patches the local index instead and only bumps the results
+  generation (invalidate_results); other processes see it within
+  ROUTE_INDEX_TTL.
+* availability snapshots per (train, date): the raw seat maps of every berth.
+  Kept for SEARCH_AVAILABILITY_TTL and deleted by every seat map write for
+  that train and date, so bookings only invalidate what they touched.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+_GENERATION_KEY = "search:generation"
+_RESULTS_GENERATION_KEY = "search:results-generation"
+
+
+def search_cache():
+    return caches["search"]
+
+
+def routes_ttl():
+    return getattr(settings, "SEARCH_CACHE_TTL", 60 * 60)
+
+
+def availability_ttl():
+    return getattr(settings, "SEARCH_AVAILABILITY_TTL", 30)
+
+
+def _counter(key):
+    cache = search_cache()
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, 1, None)
+        value = cache.get(key, 1)
+    return value
+
+
+def _bump(key):
+    cache = search_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, None)
+
+
+def generation():
+    """The route generation; route indexes rebuild when it moves."""
+    return _counter(_GENERATION_KEY)
+
+
+def routes_key(src_id, dst_id, journey_date):
+    generations = f"{generation()}.{_counter(_RESULTS_GENERATION_KEY)}"
+    return f"search:routes:{generations}:{src_id}:{dst_id}:{journey_date.isoformat()}"
+
+
+def availability_key(train_id, journey_date):
+    return f"search:avail:{train_id}:{journey_date.isoformat()}"
+
+
+def invalidate_routes():
+    """Drop every cached route result and rebuild every route index."""
+    _bump(_GENERATION_KEY)
+
+
+def invalidate_results():
+    """Drop every cached route result; route indexes are kept."""
+    _bump(_RESULTS_GENERATION_KEY)
+
+
+def invalidate_availability(train_id, journey_date):
+    """Drop the snapshot for (train, date) once the current transaction commits."""
+    key = availability_key(train_id, journey_date)
+    transaction.on_commit(lambda: search_cache().delete(key))
@@ -0,0 +1,97 @@
+# bookings/database.py
+"""
+SQLite under concurrent web workers.
+
+With RAILWAY_SQLITE_TUNED=1, settings.py puts the database in WAL mode with
+IMMEDIATE transactions and a busy timeout, so readers no longer wait for
+writers and writers queue for the lock instead of failing at once. It is
+opt-in because WAL mode sticks to the database file, and the dev database is
+checked in. Two more pieces live here:
+
+* retry_on_busy re-runs a write that still hit "database is locked" (the
+  busy timeout ran out) after a short randomized backoff;
+* ReadReplicaRouter sends the reads of views marked @read_only to the
+  "replica" alias (tuned mode only): separate connections to the same file,
+  opened with PRAGMA query_only, so a read-only view can neither take the
+  write lock nor hold up a writer on its own connection.
+"""
+import asyncio
+import functools
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import OperationalError, connection
+
+REPLICA = "replica"
+BUSY_RETRIES = 4
+BUSY_BACKOFF = 0.05  # seconds, doubled per retry
+
+_read_only = ContextVar("read_only", default=False)
+
+
+def is_busy(exc):
+    message = str(exc).lower()
+    return "database is locked" in message or "database is busy" in message
+
+
+def retry_on_busy(func):
+    """
+    Re-run func when SQLite reports the database locked. Only the outermost
+    call retries: inside an atomic block the transaction is already lost.
+    """
+
+    @functools.wraps(func)
+    def wrapped(*args, **kwargs):
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as exc:
+                if attempt == BUSY_RETRIES or not is_busy(exc) or connection.in_atomic_block:
+                    raise
+            time.sleep(BUSY_BACKOFF * 2**attempt * random.uniform(0.5, 1.5))
+
+    return wrapped
+
+
+def read_only(view):
+    """Mark a view that only reads: its queries go to the replica connections."""
+    if asyncio.iscoroutinefunction(view):
+
+        @functools.wraps(view)
+        async def wrapped(*args, **kwargs):
+            token = _read_only.set(True)
+            try:
+                return await view(*args, **kwargs)
+            finally:
+                _read_only.reset(token)
+
+    else:
+
+        @functools.wraps(view)
+        def wrapped(*args, **kwargs):
+            token = _read_only.set(True)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                _read_only.reset(token)
+
+    return wrapped
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _read_only.get() and REPLICA in settings.DATABASES:
+            return REPLICA
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        # also for instances read from the replica
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
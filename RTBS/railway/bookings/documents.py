@@ -0,0 +1,195 @@
+# bookings/documents.py
+"""
+Ticket PDFs, rendered off the request path and cached; also the process
+pool plumbing shared with the bulk booking export (bookings/exports.py).
+
+The HTML is rendered in the web process (it needs the ORM and templates);
+xhtml2pdf then turns it into a PDF in a small process pool of PDF_WORKERS
+processes. Files are stored under PDF_CACHE_DIR named by the SHA-256 of the
+HTML, so a PDF is reused for as long as what it shows is unchanged and a new
+one is made as soon as the booking changes (status, seats, ...). Each
+booking's directory only keeps its latest ticket.
+
+mock_pay queues the ticket as soon as the payment commits; download_ticket
+then usually finds it on disk and streams it with FileResponse (sendfile
+under servers that provide wsgi.file_wrapper).
+
+This module must stay importable without Django being set up: the pool
+processes import it to run render_file and merge_files.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from django.conf import settings
+from django.template.loader import render_to_string
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+RENDER_TIMEOUT = 60  # seconds a download waits for its PDF
+
+_lock = threading.Lock()
+_pool = None
+_pending = {}  # path -> Future of a render in flight
+
+
+def cache_dir():
+    return Path(getattr(settings, "PDF_CACHE_DIR", settings.BASE_DIR / "pdf_cache"))
+
+
+def render_file(html, path, prune=False):
+    """
+    Pool job: write the PDF of `html` to `path` (atomically); with prune, other
+    PDFs in the same directory are removed. Returns pisa's error count.
+    """
+    from .pdf import html_to_pdf
+
+    data, err = html_to_pdf(html)
+    if err:
+        return err
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    if prune:
+        for old in path.parent.glob("*.pdf"):
+            if old != path:
+                old.unlink(missing_ok=True)
+    return 0
+
+
+def merge_files(paths, dest):
+    """Pool job: concatenate the PDFs at `paths` into `dest` (atomically), then delete them."""
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for path in paths:
+        writer.append(path)
+    tmp = Path(dest).with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        writer.write(f)
+    os.replace(tmp, dest)
+    for path in paths:
+        Path(path).unlink(missing_ok=True)
+
+
+def process_pool(workers):
+    # not fork: web workers may be multi-threaded
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        _pool = process_pool(settings.PDF_WORKERS)
+    return _pool
+
+
+def _submit(html, path, prune):
+    """Future for rendering `html` to `path`, shared with a render already in flight."""
+    global _pool
+    with _lock:
+        future = _pending.get(path)
+        if future is not None:
+            return future
+        try:
+            future = _executor().submit(render_file, html, str(path), prune)
+        except BrokenProcessPool:
+            _pool = None  # a worker died; start a fresh pool
+            future = _executor().submit(render_file, html, str(path), prune)
+        _pending[path] = future
+
+    def done(f):
+        with _lock:
+            if _pending.get(path) is f:
+                del _pending[path]
+
+    future.add_done_callback(done)
+    return future
+
+
+def _open(html, directory, prune=False, wait=True, document="ticket"):
+    """
+    The cached PDF for `html` in `directory`, opened for reading, rendering it
+    first if needed. None if rendering failed or took longer than
+    RENDER_TIMEOUT, or (wait=False) when it was only queued. A render that
+    timed out keeps going in the pool, so asking again later finds the file.
+    """
+    path = directory / f"{hashlib.sha256(html.encode('utf-8')).hexdigest()}.pdf"
+    try:
+        pdf = open(path, "rb")
+        metrics.PDF_CACHE.inc(result="hit")
+        return pdf
+    except FileNotFoundError:
+        metrics.PDF_CACHE.inc(result="miss")
+    started = time.perf_counter()
+    if not settings.PDF_WORKERS:
+        err = render_file(html, path, prune) if wait else None
+    else:
+        future = _submit(html, path, prune)
+        try:
+            err = future.result(timeout=RENDER_TIMEOUT) if wait else None
+        except TimeoutError:
+            logger.warning("%s PDF %s not rendered within %ss", document, path.name, RENDER_TIMEOUT)
+            err = "timeout"
+    if wait:
+        metrics.PDF_SECONDS.observe(time.perf_counter() - started, document=document)
+    if err or not wait:
+        return None
+    return open(path, "rb")
+
+
+# ---- tickets ----
+def ticket_html(booking):
+    departure = booking.train.stops.filter(station=booking.source).first()
+    context = {
+        "pnr": booking.pk,
+        "booking_date": booking.created_at.strftime("%d-%m-%Y"),
+        "train_number": booking.train.number,
+        "train_name": booking.train.name,
+        "source": f"{booking.source.name} ({booking.source.code})",
+        "destination": f"{booking.destination.name} ({booking.destination.code})",
+        "date_of_journey": booking.date_of_journey.strftime("%d-%m-%Y"),
+        "departure_time": (
+            departure.departure.strftime("%H:%M")
+            if departure and departure.departure
+            else "N/A"
+        ),
+        "class_name": booking.berth_type.name,
+        "berth_code": booking.berth_type.code,
+        "passengers": booking.passengers.all(),
+        "total_fare": booking.total_fare,
+        "status": booking.status,
+    }
+    return render_to_string("bookings/ticket_template.html", context)
+
+
+def ticket_pdf(booking, wait=True):
+    """Open file of the booking's current ticket PDF (see _open)."""
+    return _open(ticket_html(booking), cache_dir() / "tickets" / str(booking.pk), prune=True, wait=wait)
+
+
+def prerender_ticket(booking_id):
+    """Queue the ticket of a booking for rendering; never raises."""
+    from .models import Booking
+
+    try:
+        booking = Booking.objects.select_related(
+            "train", "source", "destination", "berth_type"
+        ).get(pk=booking_id)
+        pdf = ticket_pdf(booking, wait=False)
+        if pdf is not None:
+            pdf.close()  # already rendered
+    except Exception:
+        logger.exception("could not queue ticket PDF for booking %s", booking_id)
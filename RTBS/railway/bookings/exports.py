@@ -0,0 +1,244 @@
+# bookings/exports.py
+"""
+Bookings exports: the shared filters and the bulk PDF export job.
+
+One xhtml2pdf render of a large table is slow and memory hungry, so the PDF
+export splits the bookings (in pk order) into chunks of PDF_EXPORT_CHUNK_ROWS
+rows. Each chunk is rendered to HTML here, turned into a PDF by a process
+pool of PDF_EXPORT_WORKERS processes, and the chunk PDFs are finally merged
+into one file. Progress is kept on the PdfExportJob row, so any web worker
+can report it while the job runs in a background thread of the worker that
+started it (or in `manage.py export_bookings_pdf`).
+
+A background thread dies with its worker process (a restart, a crash, a
+gunicorn max-requests recycle), leaving its job QUEUED or RUNNING. Jobs touch
+updated_at after every chunk and every HEARTBEAT while waiting for a slow
+chunk or the merge; fail_stale_jobs marks those that went quiet for
+STALE_AFTER as FAILED, so their progress page stops waiting.
+"""
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from . import documents, metrics
+from .models import Booking, PdfExportJob
+
+FILTER_PARAMS = ("date", "from", "to", "train", "status")
+KEEP_FINISHED = timedelta(days=1)
+STALE_AFTER = timedelta(minutes=15)
+HEARTBEAT = timedelta(minutes=1)
+
+
+def filter_bookings(params, qs):
+    """
+    Bookings export filters, all optional: ?date (journey date), ?from/?to
+    (journey date range), ?train (numbers) and ?status; the last two may be
+    repeated or comma separated. Invalid values are ignored. `params` maps
+    names to lists of values, e.g. dict(request.GET.lists()).
+    """
+
+    def values(name):
+        return [v for raw in params.get(name, []) for v in raw.split(",") if v]
+
+    for param, lookup in (
+        ("date", "date_of_journey"),
+        ("from", "date_of_journey__gte"),
+        ("to", "date_of_journey__lte"),
+    ):
+        for value in values(param)[-1:]:
+            try:
+                qs = qs.filter(**{lookup: date.fromisoformat(value)})
+            except ValueError:
+                pass
+    if trains := values("train"):
+        qs = qs.filter(train__number__in=trains)
+    if statuses := values("status"):
+        qs = qs.filter(status__in=[s.upper() for s in statuses])
+    return qs
+
+
+# ---- bulk PDF export ----
+def chunk_rows():
+    return getattr(settings, "PDF_EXPORT_CHUNK_ROWS", 500)
+
+
+def export_workers():
+    return getattr(settings, "PDF_EXPORT_WORKERS", None) or os.cpu_count() or 1
+
+
+def job_dir(job):
+    return documents.cache_dir() / "exports" / str(job.pk)
+
+
+def job_file(job):
+    return job_dir(job) / "bookings.pdf"
+
+
+def create_job(params, user=None):
+    """A QUEUED export of the bookings matching `params` (see filter_bookings)."""
+    params = {k: v for k, v in params.items() if k in FILTER_PARAMS}
+    return PdfExportJob.objects.create(requested_by=user, params=params)
+
+
+def start_job(job):
+    """Run the job in a background thread once the current transaction commits."""
+
+    def run():
+        try:
+            run_job(job.pk)
+        finally:
+            connection.close()  # the thread's own connection
+
+    transaction.on_commit(lambda: threading.Thread(target=run, daemon=True).start())
+
+
+def _rows(qs):
+    rows = qs.order_by("pk").values_list(
+        "pk",
+        "user__username",
+        "train__number",
+        "train__name",
+        "source__code",
+        "destination__code",
+        "date_of_journey",
+        "passengers_count",
+        "total_fare",
+        "status",
+    )
+    chunk, chunks = [], 0
+    for pk, user, number, name, src, dst, day, count, fare, status in rows.iterator(
+        chunk_size=chunk_rows()
+    ):
+        chunk.append(
+            {
+                "id": pk,
+                "user": user,
+                "train": f"{number} {name}",
+                "source": src,
+                "destination": dst,
+                "date_of_journey": day,
+                "passengers": count,
+                "fare": float(fare or 0),
+                "status": status,
+            }
+        )
+        if len(chunk) == chunk_rows():
+            yield chunk
+            chunk, chunks = [], chunks + 1
+    if chunk or not chunks:
+        yield chunk  # an empty export still gets its "No bookings found." page
+
+
+def _touch(job):
+    PdfExportJob.objects.filter(pk=job.pk).update(updated_at=timezone.now())
+
+
+def _wait(job, futures):
+    """wait(FIRST_COMPLETED) that touches the job every HEARTBEAT until one is done."""
+    while True:
+        done, pending = wait(
+            futures, timeout=HEARTBEAT.total_seconds(), return_when=FIRST_COMPLETED
+        )
+        if done:
+            return done, pending
+        _touch(job)
+
+
+def run_job(job_id, progress=None):
+    """
+    Render and merge the export; returns the finished job. `progress` is
+    called with the job after every chunk.
+    """
+    job = PdfExportJob.objects.get(pk=job_id)
+    qs = filter_bookings(job.params, Booking.objects.all())
+    # an estimate for the progress bar: bookings may change while we render,
+    # the rows actually exported are counted below
+    job.rows = qs.count()
+    job.chunks = max(-(-job.rows // chunk_rows()), 1)
+    job.status = "RUNNING"
+    job.save(update_fields=["rows", "chunks", "status", "updated_at"])
+    directory = job_dir(job)
+    directory.mkdir(parents=True, exist_ok=True)
+    workers = export_workers()
+    paths, in_flight = [], set()
+    rows = 0
+    started = time.perf_counter()
+    try:
+        with documents.process_pool(workers) as pool:
+
+            def finish(done):
+                for future in done:
+                    if err := future.result():
+                        raise RuntimeError(f"xhtml2pdf reported {err} error(s)")
+                PdfExportJob.objects.filter(pk=job.pk).update(
+                    chunks_done=F("chunks_done") + len(done), updated_at=timezone.now()
+                )
+                if progress:
+                    job.refresh_from_db(fields=["chunks_done"])
+                    progress(job)
+
+            for n, chunk in enumerate(_rows(qs), 1):
+                rows += len(chunk)
+                title = f"Bookings export #{job.pk}" if n == 1 else ""
+                html = render_to_string(
+                    "bookings/admin_bookings_pdf.html", {"bookings": chunk, "title": title}
+                )
+                path = str(directory / f"chunk-{n:05d}.pdf")
+                paths.append(path)
+                in_flight.add(pool.submit(documents.render_file, html, path))
+                if len(in_flight) >= 2 * workers:  # bound the HTML held in memory
+                    done, in_flight = _wait(job, in_flight)
+                    finish(done)
+            while in_flight:
+                done, in_flight = _wait(job, in_flight)
+                finish(done)
+            merge = pool.submit(documents.merge_files, paths, str(job_file(job)))
+            _wait(job, {merge})
+            merge.result()
+    except Exception as exc:
+        now = timezone.now()
+        PdfExportJob.objects.filter(pk=job.pk).update(
+            status="FAILED", error=str(exc), finished_at=now, updated_at=now
+        )
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    metrics.PDF_SECONDS.observe(time.perf_counter() - started, document="export")
+    now = timezone.now()
+    PdfExportJob.objects.filter(pk=job.pk).update(
+        status="DONE", rows=rows, chunks=len(paths), chunks_done=len(paths),
+        finished_at=now, updated_at=now,
+    )
+    job.refresh_from_db()
+    return job
+
+
+def fail_stale_jobs(now=None):
+    """Mark QUEUED/RUNNING jobs with no progress for STALE_AFTER as FAILED."""
+    now = now or timezone.now()
+    return PdfExportJob.objects.filter(
+        status__in=("QUEUED", "RUNNING"), updated_at__lt=now - STALE_AFTER
+    ).update(
+        status="FAILED",
+        error="The export stopped making progress (its worker process exited). Please start it again.",
+        finished_at=now,
+        updated_at=now,
+    )
+
+
+def prune_jobs(now=None):
+    """Delete jobs (and files) finished more than KEEP_FINISHED ago."""
+    old = PdfExportJob.objects.filter(
+        finished_at__lt=(now or timezone.now()) - KEEP_FINISHED
+    )
+    for job in old:
+        shutil.rmtree(job_dir(job), ignore_errors=True)
+    return old.delete()[0]
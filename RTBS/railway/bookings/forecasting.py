@@ -0,0 +1,300 @@
+# bookings/forecasting.py
+"""
+Demand forecasts, fitted offline by `manage.py fit_forecasts`.
+
+One fit covers every series at once with numpy:
+
+* daily bookings for all trains, per route (source, destination) and per
+  (train, berth type): a ridge regression on trend + day of week over the
+  last HISTORY_DAYS days. Every series shares the same design matrix, so all
+  of them are solved in one linear system;
+* lead-time curves per (train, berth type): the share of a journey's seats
+  that is typically booked k or more days before departure, from completed
+  journeys, shrunk towards the curve of all trains;
+* a predicted sell-out date for every current DailyTrainAvailability row,
+  from its seats sold so far, its lead-time curve and the average seats
+  that train and class ends up selling on that day of the week.
+
+Each fit is saved as a new version under FORECAST_DIR (npz arrays plus a
+`current.json` pointer). Web workers load the current version once and
+reload only when the pointer changes, and lookups are dict/array indexing.
+"""
+import json
+import os
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Booking, DailyTrainAvailability, TrainBerthAvailability
+
+HISTORY_DAYS = 120
+HORIZON = 30  # days forecast ahead
+MAX_LEAD = 30  # bookings open this many days before the journey
+RIDGE = 1.0
+CURVE_PRIOR_SEATS = 20  # weight of the all-trains lead curve per key
+DOW_PRIOR_RUNS = 2  # weight of a key's mean seats per journey in its weekday means
+VERSIONS_KEPT = 3
+SEAT_STATUSES = ("PENDING", "CONFIRMED")
+
+
+def forecast_dir():
+    return Path(getattr(settings, "FORECAST_DIR", settings.BASE_DIR / "forecasts"))
+
+
+# ---- fitting ----
+def _design(day_ordinals, origin):
+    """Rows [1, trend, Mon..Sat] for the given day ordinals (Sunday is the baseline)."""
+    days = np.asarray(day_ordinals)
+    X = np.zeros((len(days), 8))
+    X[:, 0] = 1.0
+    X[:, 1] = (days - origin) / HISTORY_DAYS
+    dow = (days - 1) % 7  # date.fromordinal(1) is a Monday
+    for d in range(6):
+        X[:, 2 + d] = dow == d
+    return X
+
+
+def _fit_series(key_index, day_index, n_keys, history, future):
+    """Ridge fit of every key's daily counts at once; (HORIZON x n_keys) forecasts."""
+    Y = np.zeros((len(history), n_keys))
+    np.add.at(Y, (day_index, key_index), 1.0)
+    X = _design(history, history[0])
+    A = X.T @ X + RIDGE * np.eye(X.shape[1])
+    A[0, 0] -= RIDGE  # don't shrink the intercept
+    B = np.linalg.solve(A, X.T @ Y)
+    return np.clip(_design(future, history[0]) @ B, 0, None)
+
+
+def _keys(*columns):
+    """(unique key rows, inverse index) for parallel id columns."""
+    if not len(columns[0]):
+        return np.zeros((0, len(columns)), dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.unique(np.stack(columns, axis=1), axis=0, return_inverse=True)
+
+
+def fit(today=None):
+    """Fit every model and save them as a new version; returns a summary dict."""
+    today = today or timezone.localdate()
+    t0 = today.toordinal()
+    history = np.arange(t0 - HISTORY_DAYS, t0)
+    future = np.arange(t0, t0 + HORIZON)
+
+    rows = np.array(
+        list(
+            Booking.objects.annotate(created_day=TruncDate("created_at"))
+            .filter(created_day__gte=date.fromordinal(int(history[0])))
+            .values_list(
+                "source_id",
+                "destination_id",
+                "train_id",
+                "berth_type_id",
+                "created_day",
+                "date_of_journey",
+                "passengers_count",
+                "status",
+            )
+            .iterator(chunk_size=10000)
+        ),
+        dtype=object,
+    ).reshape(-1, 8)
+    src, dst, train, berth = (rows[:, i].astype(np.int64) for i in range(4))
+    created = np.array([d.toordinal() for d in rows[:, 4]], dtype=np.int64)
+    journey = np.array([d.toordinal() for d in rows[:, 5]], dtype=np.int64)
+    seats = rows[:, 6].astype(np.float64)
+    holds_seats = np.isin(rows[:, 7], SEAT_STATUSES)
+
+    # 1) daily bookings per series
+    past = created < t0
+    day_index = created[past] - history[0]
+    all_pred = _fit_series(np.zeros(past.sum(), dtype=np.int64), day_index, 1, history, future)[:, 0]
+    route_keys, route_idx = _keys(src[past], dst[past])
+    route_pred = _fit_series(route_idx, day_index, len(route_keys), history, future)
+    tb_keys, tb_idx = _keys(train[past], berth[past])
+    tb_pred = _fit_series(tb_idx, day_index, len(tb_keys), history, future)
+
+    # 2) lead-time curves per (train, berth) from completed journeys
+    done = holds_seats & (journey < t0)
+    curve_keys, curve_idx = _keys(train[done], berth[done])
+    lead = np.clip(journey[done] - created[done], 0, MAX_LEAD)
+    by_lead = np.zeros((len(curve_keys), MAX_LEAD + 1))
+    np.add.at(by_lead, (curve_idx, lead), seats[done])
+    booked_by = by_lead[:, ::-1].cumsum(axis=1)[:, ::-1]  # seats booked at lead >= k
+    totals = booked_by[:, :1]
+    overall = booked_by.sum(axis=0) / max(booked_by[:, 0].sum(), 1.0)
+    if not booked_by.sum():
+        overall = np.linspace(0, 1, MAX_LEAD + 1)[::-1]  # no history: linear booking
+    curves = (booked_by + CURVE_PRIOR_SEATS * overall) / (totals + CURVE_PRIOR_SEATS)
+
+    # seats a completed journey ends up with, per (train, berth) and day of week
+    # of the journey, shrunk towards the key's mean over all days
+    final = np.zeros((len(curve_keys), 7))
+    np.add.at(final, (curve_idx, (journey[done] - 1) % 7), seats[done])
+    lookup = {(int(t), int(b)): i for i, (t, b) in enumerate(curve_keys)}
+    runs = np.zeros((len(curve_keys), 7))
+    for t, b, day in DailyTrainAvailability.objects.filter(
+        date__gte=date.fromordinal(int(history[0])), date__lt=today
+    ).values_list("train_id", "berth_type_id", "date").iterator(chunk_size=10000):
+        if (i := lookup.get((t, b))) is not None:
+            runs[i, day.weekday()] += 1
+    mean = final.sum(axis=1, keepdims=True) / np.maximum(runs.sum(axis=1, keepdims=True), 1)
+    final_by_dow = (final + DOW_PRIOR_RUNS * mean) / (runs + DOW_PRIOR_RUNS)
+
+    # 3) sell-out dates for current availability rows
+    sellout = _sellouts(today, curve_keys, curves, final_by_dow, overall)
+
+    version = _save(
+        today,
+        all_pred=all_pred,
+        route_keys=route_keys,
+        route_pred=route_pred,
+        tb_keys=tb_keys,
+        tb_pred=tb_pred,
+        curve_keys=curve_keys,
+        curves=curves,
+        final_by_dow=final_by_dow,
+        overall=overall,
+        **sellout,
+    )
+    return {
+        "version": version,
+        "bookings": len(rows),
+        "routes": len(route_keys),
+        "train_berths": len(tb_keys),
+        "availability_rows": len(sellout["so_date"]),
+        "sellouts": int((sellout["so_sellout"] >= 0).sum()),
+    }
+
+
+def _sellouts(today, curve_keys, curves, final_by_dow, overall):
+    t0 = today.toordinal()
+    capacity = dict(
+        (((t, b), c) for t, b, c in TrainBerthAvailability.objects.values_list(
+            "train_id", "berth_type_id", "capacity"
+        ))
+    )
+    avail = list(
+        DailyTrainAvailability.objects.filter(
+            date__gte=today, date__lte=today + timedelta(days=MAX_LEAD)
+        ).values_list("train_id", "berth_type_id", "date", "available_seats")
+    )
+    train = np.array([a[0] for a in avail], dtype=np.int64)
+    berth = np.array([a[1] for a in avail], dtype=np.int64)
+    day = np.array([a[2].toordinal() for a in avail], dtype=np.int64)
+    cap = np.array([capacity.get((a[0], a[1]), 0) for a in avail], dtype=np.float64)
+    sold = cap - np.array([a[3] for a in avail], dtype=np.float64)
+
+    lookup = {(int(t), int(b)): i for i, (t, b) in enumerate(curve_keys)}
+    # keys without completed journeys (-1) get the all-trains curve and no known demand
+    key = np.array([lookup.get((int(t), int(b)), -1) for t, b in zip(train, berth)], dtype=np.int64)
+    row_curves = np.vstack([curves, overall])[key]  # (rows, MAX_LEAD + 1)
+    row_final = np.vstack([final_by_dow, np.zeros(7)])[key, (day - 1) % 7]
+
+    lead_now = np.clip(day - t0, 0, MAX_LEAD)
+    share_now = row_curves[np.arange(len(day)), lead_now]
+    # projected seats sold by lead k: what is sold now plus the usual demand still to come
+    projected = sold[:, None] + row_final[:, None] * (row_curves - share_now[:, None])
+    ks = np.arange(MAX_LEAD + 1)
+    full = (projected >= cap[:, None]) & (ks[None, :] <= lead_now[:, None]) & (cap[:, None] > 0)
+    # earliest date = largest lead k that is already full
+    last_full = MAX_LEAD - np.argmax(full[:, ::-1], axis=1)
+    sellout = np.where(full.any(axis=1), day - last_full, -1)
+    sellout = np.where((sold >= cap) & (cap > 0), t0, sellout)
+    return {"so_train": train, "so_berth": berth, "so_date": day, "so_sellout": sellout}
+
+
+def _save(today, **arrays):
+    directory = forecast_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    pointer = _read_pointer()
+    version = (pointer or {}).get("version", 0) + 1
+    path = directory / f"v{version}.npz"
+    tmp = directory / f".v{version}.{os.getpid()}.tmp.npz"
+    np.savez(tmp, start=np.array(today.toordinal()), **arrays)
+    os.replace(tmp, path)
+    meta = {"version": version, "file": path.name, "start": today.isoformat(), "fitted_at": timezone.now().isoformat()}
+    tmp = directory / f".current.{os.getpid()}.tmp"
+    tmp.write_text(json.dumps(meta))
+    os.replace(tmp, directory / "current.json")
+    for old in directory.glob("v*.npz"):
+        if old.stem[1:].isdigit() and int(old.stem[1:]) <= version - VERSIONS_KEPT:
+            old.unlink(missing_ok=True)
+    return version
+
+
+# ---- serving ----
+def _read_pointer():
+    try:
+        return json.loads((forecast_dir() / "current.json").read_text())
+    except FileNotFoundError:
+        return None
+
+
+class Forecast:
+    """A loaded model version; every lookup is O(1)."""
+
+    def __init__(self, meta, arrays):
+        self.version = meta["version"]
+        self.fitted_at = meta["fitted_at"]
+        self.start = int(arrays["start"])
+        self._all = arrays["all_pred"]
+        self._route_pred = arrays["route_pred"]
+        self._routes = {(int(s), int(d)): i for i, (s, d) in enumerate(arrays["route_keys"])}
+        self._tb_pred = arrays["tb_pred"]
+        self._tbs = {(int(t), int(b)): i for i, (t, b) in enumerate(arrays["tb_keys"])}
+        self._sellouts = {
+            (int(t), int(b), int(d)): int(s)
+            for t, b, d, s in zip(
+                arrays["so_train"], arrays["so_berth"], arrays["so_date"], arrays["so_sellout"]
+            )
+        }
+
+    def _at(self, day):
+        i = day.toordinal() - self.start
+        return i if 0 <= i < HORIZON else None
+
+    def daily(self, first, days=7):
+        """[(date, predicted bookings)] for all trains, from `first` within the horizon."""
+        i = max(first.toordinal() - self.start, 0)
+        return [
+            (date.fromordinal(self.start + j), float(self._all[j]))
+            for j in range(i, min(i + days, HORIZON))
+        ]
+
+    def route(self, source_id, destination_id, day):
+        i, col = self._at(day), self._routes.get((source_id, destination_id))
+        return 0.0 if i is None or col is None else float(self._route_pred[i, col])
+
+    def train_berth(self, train_id, berth_type_id, day):
+        i, col = self._at(day), self._tbs.get((train_id, berth_type_id))
+        return 0.0 if i is None or col is None else float(self._tb_pred[i, col])
+
+    def sellout(self, train_id, berth_type_id, day):
+        """Predicted sell-out date of a DailyTrainAvailability row, or None."""
+        s = self._sellouts.get((train_id, berth_type_id, day.toordinal()), -1)
+        return date.fromordinal(s) if s >= 0 else None
+
+    def upcoming_sellouts(self, limit=10):
+        """[(train_id, berth_type_id, journey date, sell-out date)] soonest first."""
+        rows = sorted(
+            ((s, d, t, b) for (t, b, d), s in self._sellouts.items() if s >= 0)
+        )[:limit]
+        return [(t, b, date.fromordinal(d), date.fromordinal(s)) for s, d, t, b in rows]
+
+
+_loaded = None
+
+
+def current():
+    """The current Forecast, or None before the first fit."""
+    global _loaded
+    meta = _read_pointer()
+    if meta is None:
+        return None
+    if _loaded is None or _loaded.version != meta["version"]:
+        with np.load(forecast_dir() / meta["file"]) as arrays:
+            _loaded = Forecast(meta, arrays)
+    return _loaded
@@ -0,0 +1,124 @@
+# bookings/holds.py
+"""
+Seat holds for PENDING bookings.
+
+book_train takes seats out of the seat map as soon as the booking is created.
+If the user never pays, the hold expires SEAT_HOLD_TTL seconds after
+created_at: the booking is marked EXPIRED, expired_at records when, and its
+seats go back to the map. The `expire_holds` management command does this in
+batches (once, or as a long-running worker); mock_pay also refuses and
+releases an expired hold.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Q, Sum
+from django.utils import timezone
+
+from . import inventory, rollups
+from .models import Booking
+
+# hold age buckets (minutes) reported by hold_metrics
+AGE_BUCKETS = (5, 10, 15, 30, 60)
+
+
+def hold_ttl():
+    return timedelta(seconds=getattr(settings, "SEAT_HOLD_TTL", 15 * 60))
+
+
+def hold_deadline(booking):
+    return booking.created_at + hold_ttl()
+
+
+def is_expired(booking, now=None):
+    return booking.status == "PENDING" and (now or timezone.now()) >= hold_deadline(
+        booking
+    )
+
+
+def _expire(bookings):
+    """Expire the given PENDING bookings of one (train, berth, date); seats released."""
+    expired = []
+    now = timezone.now()
+    with transaction.atomic():
+        for b in bookings:
+            # a concurrent mock_pay may have confirmed it since we looked
+            if Booking.objects.filter(pk=b.pk, status="PENDING").update(
+                status="EXPIRED", expired_at=now, updated_at=now
+            ):
+                rollups.status_changed(b, "PENDING", "EXPIRED")
+                expired.append(b)
+        seats = inventory.release_bookings(expired)
+    return len(expired), seats
+
+
+def expire_booking(booking):
+    """Expire a single hold; returns the number of seats released."""
+    return _expire([booking])[1]
+
+
+def expire_stale_holds(batch_size=500, now=None, max_batches=None):
+    """
+    Expire every PENDING booking older than the hold TTL, batch_size at a time.
+
+    Bookings of the same (train, berth, date) share one transaction so their
+    seats go back in one seat map write. A group whose seat map stays too
+    contended (inventory.InventoryBusy) is skipped and left PENDING for the
+    next pass. Returns (bookings_expired, seats_reclaimed).
+    """
+    cutoff = (now or timezone.now()) - hold_ttl()
+    total_bookings = total_seats = batches = 0
+    skipped = set()
+    while max_batches is None or batches < max_batches:
+        batch = list(
+            Booking.objects.filter(status="PENDING", created_at__lt=cutoff)
+            .exclude(pk__in=skipped)
+            .order_by("created_at", "pk")[:batch_size]
+        )
+        if not batch:
+            break
+        groups = defaultdict(list)
+        for b in batch:
+            groups[(b.train_id, b.berth_type_id, b.date_of_journey)].append(b)
+        for group in groups.values():
+            try:
+                n, seats = _expire(group)
+            except inventory.InventoryBusy:
+                skipped.update(b.pk for b in group)
+                continue
+            total_bookings += n
+            total_seats += seats
+        batches += 1
+        if len(batch) < batch_size:
+            break
+    return total_bookings, total_seats
+
+
+def hold_metrics(now=None, window=timedelta(hours=24)):
+    """Current hold ages and what expiry reclaimed over `window`."""
+    now = now or timezone.now()
+    pending = Booking.objects.filter(status="PENDING").aggregate(
+        holds=Count("pk"),
+        seats=Sum("passengers_count"),
+        oldest=Min("created_at"),
+        stale=Count("pk", filter=Q(created_at__lt=now - hold_ttl())),
+        **{
+            f"under_{m}m": Count("pk", filter=Q(created_at__gte=now - timedelta(minutes=m)))
+            for m in AGE_BUCKETS
+        },
+    )
+    reclaimed = Booking.objects.filter(
+        status="EXPIRED", expired_at__gte=now - window
+    ).aggregate(bookings=Count("pk"), seats=Sum("passengers_count"))
+    oldest = pending["oldest"]
+    return {
+        "pending_holds": pending["holds"],
+        "held_seats": pending["seats"] or 0,
+        "oldest_hold_age": (now - oldest).total_seconds() if oldest else 0,
+        "holds_younger_than": {m: pending[f"under_{m}m"] for m in AGE_BUCKETS},
+        "stale_holds": pending["stale"],
+        "expired_bookings": reclaimed["bookings"],
+        "reclaimed_seats": reclaimed["seats"] or 0,
+    }
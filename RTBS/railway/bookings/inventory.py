@@ -0,0 +1,251 @@
+# bookings/inventory.py
+"""
+Segment-aware seat inventory.
+
+A train with N stops has N-1 segments. For every DailyTrainAvailability row
+(train, berth type, date) we keep a seats x segments occupancy matrix in
+``seat_map``, stored segment-major: one bitset per segment with bit k set
+when seat k is taken on that segment. A journey from stop i to stop j uses
+segments i..j-1, so the seats taken anywhere on it are the OR of those rows
+and a seat freed at stop j can be sold again from j onwards.
+
+Encoding: 4 byte header (segments, seats as little-endian uint16) followed by
+one ceil(seats / 8) byte little-endian row per segment. An empty map means
+every seat is free.
+"""
+import struct
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import caching, metrics
+from .models import DailyTrainAvailability, Passenger, TrainBerthAvailability
+from .routes import route_index
+from .seats import pick_seats
+
+_HEADER = struct.Struct("<HH")
+
+# optimistic write attempts before giving up on a contended row
+CAS_RETRIES = 8
+
+
+class SeatsUnavailable(Exception):
+    def __init__(self, available):
+        super().__init__(f"only {available} seats available")
+        self.available = available
+
+
+class InventoryBusy(Exception):
+    """The seat map kept changing under us for CAS_RETRIES attempts."""
+
+
+class SeatMap:
+    def __init__(self, segments, seats, rows=None):
+        self.segments = segments
+        self.seats = seats
+        self.rows = list(rows) if rows is not None else [0] * segments
+
+    @classmethod
+    def from_bytes(cls, data, segments, seats):
+        data = bytes(data or b"")
+        if not data:
+            return cls(segments, seats)
+        stored_segments, stored_seats = _HEADER.unpack_from(data)
+        width = (stored_seats + 7) // 8
+        rows = [
+            int.from_bytes(data[_HEADER.size + i * width : _HEADER.size + (i + 1) * width], "little")
+            for i in range(stored_segments)
+        ]
+        # the route or the berth capacity may have changed since the map was written
+        rows += [0] * (segments - len(rows))
+        full = (1 << seats) - 1
+        return cls(max(segments, stored_segments), seats, [r & full for r in rows])
+
+    def to_bytes(self):
+        width = (self.seats + 7) // 8
+        return _HEADER.pack(self.segments, self.seats) + b"".join(
+            r.to_bytes(width, "little") for r in self.rows
+        )
+
+    # ---- queries ----
+    def occupied(self, start, end):
+        """Bitset of seats taken on any segment in start..end-1."""
+        mask = 0
+        for r in self.rows[start:end]:
+            mask |= r
+        return mask
+
+    def free_count(self, start, end):
+        return self.seats - self.occupied(start, end).bit_count()
+
+    def free_bits(self, start, end):
+        """Bitset of seats free on every segment in start..end-1."""
+        return ~self.occupied(start, end) & ((1 << self.seats) - 1)
+
+    def free_seats(self, start, end):
+        """Indices of seats free on every segment in start..end-1."""
+        free = self.free_bits(start, end)
+        seats = []
+        while free:
+            low = free & -free
+            seats.append(low.bit_length() - 1)
+            free ^= low
+        return seats
+
+    def fully_free_count(self):
+        return self.free_count(0, self.segments)
+
+    # ---- updates ----
+    def _set(self, seats, start, end, taken):
+        bits = 0
+        for s in seats:
+            bits |= 1 << s
+        for i in range(start, end):
+            self.rows[i] = self.rows[i] | bits if taken else self.rows[i] & ~bits
+
+    def take(self, seats, start, end):
+        self._set(seats, start, end, True)
+
+    def release(self, seats, start, end):
+        self._set(seats, start, end, False)
+
+    def allocate(self, start, end, berth_code, ages):
+        """Take one seat per passenger age across start..end-1; None if not enough."""
+        seats = pick_seats(self.free_bits(start, end), berth_code, ages)
+        if seats is not None:
+            self.take(seats, start, end)
+        return seats
+
+
+def segment_count(train_id):
+    return max(len(route_index.stops(train_id)) - 1, 0)
+
+
+def segment_span(match):
+    """(start, end) segment range for a routes.RouteMatch."""
+    return match.src.position, match.dst.position
+
+
+def load(dta, capacity, segments=None):
+    if segments is None:
+        segments = segment_count(dta.train_id)
+    return SeatMap.from_bytes(dta.seat_map, segments, capacity)
+
+
+def _swap(dta, seat_map):
+    """Write the map only if nobody changed the row since we read it."""
+    swapped = (
+        DailyTrainAvailability.objects.filter(pk=dta.pk, version=dta.version).update(
+            seat_map=seat_map.to_bytes(),
+            available_seats=seat_map.fully_free_count(),
+            version=F("version") + 1,
+            updated_at=timezone.now(),
+        )
+        == 1
+    )
+    if swapped:
+        caching.invalidate_availability(dta.train_id, dta.date)
+    return swapped
+
+
+@contextmanager
+def _write_lock(op):
+    """
+    transaction.atomic(), timing the wait for the write lock (BEGIN IMMEDIATE
+    in the tuned SQLite mode). Nested in another transaction it only sets a
+    savepoint: the lock was waited for when that one began, so nothing is
+    recorded.
+    """
+    outermost = not transaction.get_connection().in_atomic_block
+    started = time.perf_counter()
+    with transaction.atomic():
+        if outermost:
+            metrics.LOCK_WAIT_SECONDS.observe(time.perf_counter() - started, op=op)
+        yield
+
+
+def hold_seats(train_id, berth_type, day, capacity, seg_from, seg_to, ages, on_hold):
+    """
+    Take a seat per passenger on segments seg_from..seg_to-1 and call on_hold(seats).
+
+    No row lock is held: the map is read and the seats picked outside the
+    transaction, then written back with a conditional UPDATE on the row version.
+    on_hold runs in the same transaction as that UPDATE, so the booking rows are
+    only created when the seats were really taken. A lost race re-reads and retries.
+    """
+    for _ in range(CAS_RETRIES):
+        dta, created = DailyTrainAvailability.objects.get_or_create(
+            train_id=train_id,
+            berth_type=berth_type,
+            date=day,
+            defaults={"available_seats": capacity},
+        )
+        seat_map = load(dta, capacity)
+        seats = seat_map.allocate(seg_from, seg_to, berth_type.code, ages)
+        if seats is None:
+            raise SeatsUnavailable(seat_map.free_count(seg_from, seg_to))
+        with _write_lock("hold"):
+            if _swap(dta, seat_map):
+                on_hold(seats)
+                return seats
+        metrics.SEAT_CONFLICTS.inc(op="hold")
+    raise InventoryBusy()
+
+
+def release_seats(train_id, berth_type_id, day, capacity, held):
+    """
+    Give seats back to the map in one write; held is a list of
+    (seats, seg_from, seg_to). Uses the same CAS loop as hold_seats.
+    """
+    for _ in range(CAS_RETRIES):
+        dta = DailyTrainAvailability.objects.filter(
+            train_id=train_id, berth_type_id=berth_type_id, date=day
+        ).first()
+        if dta is None:
+            return
+        seat_map = load(dta, capacity)
+        for seats, seg_from, seg_to in held:
+            seat_map.release(seats, seg_from, seg_to)
+        with _write_lock("release"):
+            if _swap(dta, seat_map):
+                return
+        metrics.SEAT_CONFLICTS.inc(op="release")
+    raise InventoryBusy()
+
+
+def release_bookings(bookings):
+    """
+    Return the seats held by (now cancelled or expired) bookings that share one
+    train, berth type and journey date. Returns the number of seats released.
+    """
+    bookings = [b for b in bookings if b.seg_from is not None]
+    if not bookings:
+        return 0
+    seats = defaultdict(list)
+    for booking_id, seat in Passenger.objects.filter(
+        booking__in=bookings, seat_index__isnull=False
+    ).values_list("booking_id", "seat_index"):
+        seats[booking_id].append(seat)
+    held = [(seats[b.pk], b.seg_from, b.seg_to) for b in bookings if seats[b.pk]]
+    if not held:
+        return 0
+    first = bookings[0]
+    capacity = (
+        TrainBerthAvailability.objects.filter(
+            train_id=first.train_id, berth_type_id=first.berth_type_id
+        )
+        .values_list("capacity", flat=True)
+        .first()
+    ) or 0
+    release_seats(
+        first.train_id, first.berth_type_id, first.date_of_journey, capacity, held
+    )
+    return sum(len(s) for s, _, _ in held)
+
+
+def release_booking(booking):
+    return release_bookings([booking])
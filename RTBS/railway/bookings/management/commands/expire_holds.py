@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from bookings.holds import expire_stale_holds, hold_metrics
+
+
+class Command(BaseCommand):
+    help = 'Expire PENDING bookings older than SEAT_HOLD_TTL and release their seats'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--loop', action='store_true', help='keep running as a worker')
+        parser.add_argument('--interval', type=float, default=30, help='seconds between passes with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            expired, seats = expire_stale_holds(batch_size=options['batch_size'])
+            m = hold_metrics()
+            self.stdout.write(
+                f"expired {expired} holds, reclaimed {seats} seats in {time.monotonic() - started:.2f}s | "
+                f"pending {m['pending_holds']} holds ({m['held_seats']} seats), "
+                f"oldest {m['oldest_hold_age'] / 60:.1f} min, "
+                f"reclaimed last 24h {m['reclaimed_seats']} seats"
+            )
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from bookings import exports
+
+
+class Command(BaseCommand):
+    help = 'Export bookings to one PDF, rendered in parallel chunks (same filters as the dashboard export)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='journey date (YYYY-MM-DD)')
+        parser.add_argument('--from', dest='from_', help='journey dates from (YYYY-MM-DD)')
+        parser.add_argument('--to', help='journey dates up to (YYYY-MM-DD)')
+        parser.add_argument('--train', action='append', default=[], help='train number (repeatable)')
+        parser.add_argument('--status', action='append', default=[], help='booking status (repeatable)')
+
+    def handle(self, *args, **options):
+        params = {
+            'date': [options['date']] if options['date'] else [],
+            'from': [options['from_']] if options['from_'] else [],
+            'to': [options['to']] if options['to'] else [],
+            'train': options['train'],
+            'status': options['status'],
+        }
+        job = exports.create_job({k: v for k, v in params.items() if v})
+
+        def progress(job):
+            self.stdout.write(f"  {job.chunks_done}/{job.chunks} parts rendered")
+
+        job = exports.run_job(job.pk, progress=progress)
+        elapsed = (job.finished_at - job.created_at).total_seconds()
+        self.stdout.write(f"Exported {job.rows} bookings in {elapsed:.1f}s to {exports.job_file(job)}")
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bookings import forecasting
+
+
+class Command(BaseCommand):
+    help = 'Fit the demand forecasts and sell-out predictions and publish them as a new version'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        fit = forecasting.fit()
+        self.stdout.write(
+            f"Forecast v{fit['version']} written to {forecasting.forecast_dir()} from "
+            f"{fit['bookings']} bookings: {fit['routes']} routes, {fit['train_berths']} train/classes, "
+            f"{fit['sellouts']} of {fit['availability_rows']} availability rows predicted to sell out, "
+            f"in {time.monotonic() - started:.2f}s."
+        )
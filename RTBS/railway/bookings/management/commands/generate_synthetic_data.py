@@ -0,0 +1,318 @@
+import random
+import time
+from datetime import datetime, time as dtime, timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, connections, router, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from bookings import caching, inventory, rollups
+from bookings.holds import hold_ttl
+from bookings.models import (
+    BerthType, Booking, DailyTrainAvailability, Passenger, Payment, RouteStop, Station, Train,
+    TrainBerthAvailability,
+)
+from bookings.seats import seat_label
+from bookings.utils import calculate_fares
+
+# codes, train numbers and usernames of generated rows start with this
+PREFIX = 'SYN'
+PASSWORD = 'synthetic'
+
+# (name, code, price per km, capacity range); existing berth types with these codes are reused
+BERTH_TYPES = [
+    ('Sleeper', 'SL', '0.50', (72, 576)),
+    ('AC 3 Tier', '3A', '1.30', (64, 320)),
+    ('AC 2 Tier', '2A', '1.90', (46, 138)),
+    ('First AC', '1A', '3.20', (18, 36)),
+]
+PARTY_SIZES = ((1, 2, 3, 4), (55, 25, 12, 8))
+HISTORY_STATUS = (('CONFIRMED', 'CANCELLED', 'EXPIRED'), (85, 10, 5))
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the database with a synthetic network and booking history for benchmarks '
+        '(point RAILWAY_DB_PATH at a scratch database)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stations', type=int, default=300)
+        parser.add_argument('--trains', type=int, default=500)
+        parser.add_argument('--min-stops', type=int, default=4)
+        parser.add_argument('--max-stops', type=int, default=20)
+        parser.add_argument('--users', type=int, default=5000)
+        parser.add_argument('--bookings', type=int, default=200000, help='past journeys (the history)')
+        parser.add_argument('--history-days', type=int, default=180)
+        parser.add_argument('--future-bookings', type=int, default=20000,
+                            help='confirmed bookings in the open window, with their seats taken in the seat maps')
+        parser.add_argument('--days', type=int, default=30, help='availability window from today')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--chunk-size', type=int, default=5000, help='bookings per transaction')
+
+    def handle(self, *args, **options):
+        if options['min_stops'] < 2 or options['max_stops'] < options['min_stops']:
+            raise CommandError('Need 2 <= --min-stops <= --max-stops.')
+        if options['stations'] < options['max_stops'] * 2:
+            raise CommandError('Need at least twice --max-stops stations.')
+        if Station.objects.filter(code__startswith=PREFIX).exists():
+            raise CommandError('Synthetic data is already present; generate into a fresh database.')
+
+        started = time.monotonic()
+        self.rng = random.Random(options['seed'])
+        self.chunk_size = options['chunk_size']
+        self.verbosity = options['verbosity']
+        self.now = timezone.now()
+        self.today = timezone.localdate()
+
+        with transaction.atomic():
+            stations = self.create_stations(options['stations'])
+            berth_types = self.berth_types()
+            self.trains = self.create_trains(
+                options['trains'], stations, berth_types, options['min_stops'], options['max_stops']
+            )
+            self.users = self.create_users(options['users'])
+        # busier trains get more bookings
+        self.train_weights = list(accumulate(1 / (i + 1) ** 0.6 for i in range(len(self.trains))))
+        self.next_ids = {
+            model: (model.objects.aggregate(top=Max('pk'))['top'] or 0) + 1
+            for model in (Booking, Passenger, Payment)
+        }
+        self.seat_maps = {}
+
+        history = self.insert_bookings(options['bookings'], self.history_booking, options['history_days'])
+        future = self.insert_bookings(options['future_bookings'], self.future_booking, options['days'])
+        availability = self.create_availability(options['days'])
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Booking, Passenger, Payment]):
+                cursor.execute(sql)
+        rollups.rebuild()
+        caching.invalidate_routes()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f"Done. {len(stations)} stations, {len(self.trains)} trains, {len(self.users)} users, "
+            f"{history} past and {future} upcoming bookings "
+            f"({options['future_bookings'] - future} skipped on full trains), "
+            f"{availability} availability rows in {elapsed:.1f}s. Users log in with password '{PASSWORD}'."
+        )
+
+    # ---- network ----
+    def create_stations(self, count):
+        Station.objects.bulk_create(
+            Station(name=f'Synthetic {i}', code=f'{PREFIX}{i:05d}') for i in range(1, count + 1)
+        )
+        return list(Station.objects.filter(code__startswith=PREFIX).order_by('pk').values_list('pk', flat=True))
+
+    def berth_types(self):
+        types = []
+        for name, code, price, capacity in BERTH_TYPES:
+            berth = BerthType.objects.filter(code=code).first()
+            if berth is None:
+                berth = BerthType.objects.create(name=name, code=code, price_per_km=Decimal(price))
+            types.append((berth, capacity))
+        return types
+
+    def create_trains(self, count, stations, berth_types, min_stops, max_stops):
+        rng = self.rng
+        # a tenth of the stations are hubs that most trains call at
+        hubs, others = stations[: max(len(stations) // 10, 2)], stations[max(len(stations) // 10, 2):]
+        Train.objects.bulk_create(
+            Train(
+                number=f'{PREFIX}{i:05d}',
+                name=f'Synthetic Express {i}',
+                running_days=Train.DAILY if rng.random() < 0.7 else sum(
+                    1 << d for d in rng.sample(range(7), rng.randint(3, 6))
+                ),
+            )
+            for i in range(1, count + 1)
+        )
+        trains = []
+        stops, berths = [], []
+        for train in Train.objects.filter(number__startswith=PREFIX).order_by('pk'):
+            n = rng.randint(min_stops, max_stops)
+            from_hubs = min(len(hubs), max(2, n // 3))
+            route = rng.sample(hubs, from_hubs) + rng.sample(others, n - from_hubs)
+            rng.shuffle(route)
+            minute, distance = rng.randrange(24 * 60), 0
+            for seq, station in enumerate(route, start=1):
+                if seq > 1:
+                    gap = rng.randint(20, 150)
+                    distance += gap
+                    minute += round(gap * 60 / rng.uniform(45, 80))
+                stops.append(RouteStop(
+                    train=train, station_id=station, sequence=seq, distance=distance,
+                    arrival=_clock(minute) if seq > 1 else None,
+                    departure=_clock(minute + 2) if seq < n else None,
+                ))
+                minute += 2
+            classes = [berth_types[0]] + rng.sample(berth_types[1:], rng.randint(1, len(berth_types) - 1))
+            train_berths = []
+            for berth, (low, high) in classes:
+                capacity = rng.randint(low, high)
+                berths.append(TrainBerthAvailability(train=train, berth_type=berth, capacity=capacity))
+                train_berths.append((berth, capacity))
+            trains.append({
+                'pk': train.pk, 'running_days': train.running_days, 'route': route,
+                'distances': [s.distance for s in stops[-n:]], 'berths': train_berths,
+            })
+        RouteStop.objects.bulk_create(stops, batch_size=self.chunk_size)
+        TrainBerthAvailability.objects.bulk_create(berths, batch_size=self.chunk_size)
+        return trains
+
+    def create_users(self, count):
+        password = make_password(PASSWORD)  # hashed once, shared by every user
+        get_user_model().objects.bulk_create(
+            (get_user_model()(username=f'synthetic{i:06d}', password=password) for i in range(1, count + 1)),
+            batch_size=self.chunk_size,
+        )
+        return list(
+            get_user_model().objects.filter(username__startswith='synthetic').values_list('pk', flat=True)
+        )
+
+    # ---- bookings ----
+    def journey(self, train):
+        """A random (start, end) stop pair and class of train."""
+        rng = self.rng
+        start, end = sorted(rng.sample(range(len(train['route'])), 2))
+        berth, capacity = rng.choice(train['berths'])
+        return start, end, berth, capacity
+
+    def history_booking(self, days):
+        rng = self.rng
+        train = rng.choices(self.trains, cum_weights=self.train_weights)[0]
+        day = self.today - timedelta(days=rng.randint(1, days))
+        while not train['running_days'] >> day.weekday() & 1:
+            day -= timedelta(days=1)
+        start, end, berth, _ = self.journey(train)
+        lead = min(int(rng.expovariate(1 / 7)), 30)
+        created = _at(day - timedelta(days=lead), rng.randrange(24 * 3600))
+        status = rng.choices(*HISTORY_STATUS)[0]
+        size = rng.choices(*PARTY_SIZES)[0]
+        return train, day, start, end, berth, size, min(created, self.now), status, [None] * size
+
+    def future_booking(self, days):
+        """An upcoming booking whose seats are taken in the seat map, or None if the train is full."""
+        rng = self.rng
+        train = rng.choices(self.trains, cum_weights=self.train_weights)[0]
+        day = self.today + timedelta(days=rng.randrange(days))
+        while not train['running_days'] >> day.weekday() & 1:
+            day -= timedelta(days=1)
+        if day < self.today:
+            return None
+        start, end, berth, capacity = self.journey(train)
+        size = rng.choices(*PARTY_SIZES)[0]
+        key = (train['pk'], berth.pk, day)
+        seat_map = self.seat_maps.get(key)
+        if seat_map is None:
+            seat_map = self.seat_maps[key] = inventory.SeatMap(len(train['route']) - 1, capacity)
+        seats = seat_map.allocate(start, end, berth.code, [rng.randint(5, 80) for _ in range(size)])
+        if seats is None:
+            return None
+        created = self.now - timedelta(seconds=rng.randrange(3 * 24 * 3600))
+        return train, day, start, end, berth, size, created, 'CONFIRMED', seats
+
+    def insert_bookings(self, count, make, days):
+        inserted = 0
+        started = time.monotonic()
+        for offset in range(0, count, self.chunk_size):
+            rows = [make(days) for _ in range(min(self.chunk_size, count - offset))]
+            rows = [r for r in rows if r is not None]
+            with transaction.atomic():
+                self.write_chunk(rows)
+            inserted += len(rows)
+            if self.verbosity >= 2:
+                self.stdout.write(f"  {inserted} bookings ({inserted / (time.monotonic() - started):.0f}/s)")
+        return inserted
+
+    def write_chunk(self, rows):
+        rng = self.rng
+        # fares for the whole chunk, one calculate_fares call per party size
+        fares = {}
+        for size in PARTY_SIZES[0]:
+            group = [i for i, r in enumerate(rows) if r[5] == size]
+            pairs = [
+                (rows[i][0]['distances'][rows[i][3]] - rows[i][0]['distances'][rows[i][2]], rows[i][4].price_per_km)
+                for i in group
+            ]
+            fares.update(zip(group, (f['total'] for f in calculate_fares(pairs, passengers=size))))
+
+        bookings, passengers, payments = [], [], []
+        for i, (train, day, start, end, berth, size, created, status, seats) in enumerate(rows):
+            pk = self.next_ids[Booking]
+            self.next_ids[Booking] += 1
+            expired = created + hold_ttl() if status == 'EXPIRED' else None
+            bookings.append((
+                pk, rng.choice(self.users), train['pk'], train['route'][start], train['route'][end], day,
+                berth.pk, size, fares[i], status, created, start, end, expired or created, expired,
+            ))
+            for n, seat in enumerate(seats):
+                passengers.append((
+                    self.next_ids[Passenger] + n, pk, f'Passenger {n + 1}', rng.randint(5, 80),
+                    rng.choice('MF'), None if seat is None else seat_label(berth.code, seat), seat,
+                ))
+            self.next_ids[Passenger] += len(seats)
+            if status == 'CONFIRMED':
+                payments.append((
+                    self.next_ids[Payment], pk, fares[i], 'SUCCESS', f'{PREFIX}{pk}', created + timedelta(minutes=2),
+                ))
+                self.next_ids[Payment] += 1
+        # raw inserts: bulk_create would overwrite created_at (auto_now_add)
+        _insert(Booking, (
+            'id', 'user_id', 'train_id', 'source_id', 'destination_id', 'date_of_journey', 'berth_type_id',
+            'passengers_count', 'total_fare', 'status', 'created_at', 'seg_from', 'seg_to', 'updated_at',
+            'expired_at',
+        ), bookings)
+        _insert(Passenger, ('id', 'booking_id', 'name', 'age', 'gender', 'seat_number', 'seat_index'), passengers)
+        _insert(Payment, ('id', 'booking_id', 'amount', 'status', 'txn_id', 'created_at'), payments)
+
+    def create_availability(self, days):
+        """Availability rows for every running day in the window, with the seat maps taken above."""
+        rows = []
+        for d in (self.today + timedelta(days=i) for i in range(days)):
+            for train in self.trains:
+                if not train['running_days'] >> d.weekday() & 1:
+                    continue
+                for berth, capacity in train['berths']:
+                    seat_map = self.seat_maps.get((train['pk'], berth.pk, d))
+                    rows.append((
+                        train['pk'], berth.pk, d, seat_map.fully_free_count() if seat_map else capacity,
+                        seat_map.to_bytes() if seat_map else b'', 0, self.now,
+                    ))
+        with transaction.atomic():
+            for offset in range(0, len(rows), self.chunk_size):
+                _insert(DailyTrainAvailability, (
+                    'train_id', 'berth_type_id', 'date', 'available_seats', 'seat_map', 'version', 'updated_at',
+                ), rows[offset:offset + self.chunk_size])
+        return len(rows)
+
+
+def _clock(minute):
+    return dtime((minute // 60) % 24, minute % 60)
+
+
+def _at(day, second):
+    return timezone.make_aware(datetime.combine(day, dtime()) + timedelta(seconds=second))
+
+
+def _insert(model, fields, rows):
+    if not rows:
+        return
+    db = connections[router.db_for_write(model)]
+    columns = [model._meta.get_field(f) for f in fields]
+    qn = db.ops.quote_name
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        qn(model._meta.db_table), ', '.join(qn(c.column) for c in columns), ', '.join(['%s'] * len(columns)),
+    )
+    # ints and strings go through as they are; dates, datetimes and decimals are adapted by their field
+    with db.cursor() as cursor:
+        cursor.executemany(sql, [
+            [v if v is None or type(v) in (int, str) else c.get_db_prep_save(v, db) for c, v in zip(columns, row)]
+            for row in rows
+        ])
@@ -1,25 +1,111 @@
-from django.core.management.base import BaseCommand
-from django.utils import timezone
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta, date
-from bookings.models import Train, TrainBerthAvailability, DailyTrainAvailability
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Exists, F, OuterRef
+from bookings import schedule
+from bookings.models import Booking, TrainBerthAvailability, DailyTrainAvailability
+
 
 class Command(BaseCommand):
-    help = 'Populate DailyTrainAvailability for next N days (default 30)'
+    help = 'Populate DailyTrainAvailability for the days trains run in the next N days (default 30)'
 
     def add_arguments(self, parser):
         parser.add_argument('--days', type=int, default=30)
+        parser.add_argument('--drop-past', action='store_true',
+                            help='delete availability rows for dates before today (rolling window)')
+        parser.add_argument('--drop-not-running', action='store_true',
+                            help='delete unbooked rows in the window for days their train does not run')
+        parser.add_argument('--workers', type=int, default=1, help='shard trains over N threads')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='rows per bulk INSERT')
 
     def handle(self, *args, **options):
-        days = options['days']
+        started = time.monotonic()
         today = date.today()
-        for d in range(days):
-            target = today + timedelta(days=d)
-            for t in Train.objects.all():
-                for tb in TrainBerthAvailability.objects.filter(train=t):
-                    obj, created = DailyTrainAvailability.objects.get_or_create(
-                        train=t, berth_type=tb.berth_type, date=target,
-                        defaults={'available_seats': tb.capacity}
+        days = [today + timedelta(days=d) for d in range(options['days'])]
+        workers = max(options['workers'], 1)
+        chunk_size = options['chunk_size']
+        verbose = options['verbosity'] >= 2
+
+        dropped = 0
+        if options['drop_past']:
+            dropped, _ = DailyTrainAvailability.objects.filter(date__lt=today).delete()
+
+        # one read of all berth capacities and of the running calendar; shard i
+        # owns the trains with id % workers == i
+        berths = list(TrainBerthAvailability.objects.values_list('train_id', 'berth_type_id', 'capacity'))
+        running = schedule.running_dates(days[0], days[-1]) if days else set()
+        if options['drop_not_running'] and days:
+            dropped += self.drop_not_running(days, running)
+        if workers == 1:
+            created = self.fill(berths, days, running, chunk_size, verbose)
+        else:
+            def run(shard):
+                try:
+                    return self.fill(
+                        [b for b in berths if b[0] % workers == shard], days, running, chunk_size, verbose,
+                        shard=(shard, workers),
                     )
-                    if created:
-                        self.stdout.write(f"Created availability for {t} {tb.berth_type.code} {target}")
-        self.stdout.write("Done.")
+                finally:
+                    connection.close()  # each thread has its own connection
+
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                created = sum(pool.map(run, range(workers)))
+
+        elapsed = time.monotonic() - started
+        wanted = sum((t, d) in running for d in days for t, _, _ in berths)
+        self.stdout.write(
+            f"Done. {created} rows inserted, {wanted - created} already present, "
+            f"{dropped} rows dropped ({len(berths)} train berths x {len(days)} days, "
+            f"{len(berths) * len(days) - wanted} not running) "
+            f"in {elapsed:.2f}s: {created / elapsed if elapsed else 0:.0f} rows/s with {workers} worker(s)."
+        )
+
+    def drop_not_running(self, days, running):
+        """Delete rows on days their train does not run, unless a booking uses them."""
+        trains = {t for t, _ in running} | set(
+            DailyTrainAvailability.objects.filter(date__range=(days[0], days[-1]))
+            .values_list('train_id', flat=True).distinct()
+        )
+        booked = Booking.objects.filter(
+            train=OuterRef('train'), berth_type=OuterRef('berth_type'), date_of_journey=OuterRef('date')
+        )
+        dropped = 0
+        for d in days:
+            idle = [t for t in trains if (t, d) not in running]
+            if idle:
+                dropped += DailyTrainAvailability.objects.filter(
+                    date=d, train_id__in=idle
+                ).exclude(Exists(booked)).delete()[0]
+        return dropped
+
+    def fill(self, berths, days, running, chunk_size, verbose=False, shard=None):
+        """Insert the missing (train, berth, date) rows of running days for `berths`; returns rows inserted."""
+        if not berths or not days:
+            return 0
+        existing = DailyTrainAvailability.objects.filter(date__gte=days[0], date__lte=days[-1])
+        if shard is not None:
+            index, workers = shard
+            existing = existing.alias(shard=F('train_id') % workers).filter(shard=index)
+        present = set(existing.values_list('train_id', 'berth_type_id', 'date'))
+
+        missing = (
+            DailyTrainAvailability(train_id=t, berth_type_id=b, date=d, available_seats=cap)
+            for d in days
+            for t, b, cap in berths
+            if (t, d) in running and (t, b, d) not in present
+        )
+        created = 0
+        while chunk := list(islice(missing, chunk_size)):
+            # ignore_conflicts keeps concurrent or repeated runs idempotent; it
+            # skips rows another run inserted since we looked, so count what
+            # the INSERT actually added
+            before = existing.count()
+            DailyTrainAvailability.objects.bulk_create(chunk, ignore_conflicts=True)
+            created += existing.count() - before
+            if verbose:
+                self.stdout.write(f"  {created} rows inserted" + (f" (shard {shard[0]})" if shard else ""))
+        return created
@@ -0,0 +1,14 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bookings.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the admin dashboard booking rollups from the Booking table'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        written = rebuild()
+        self.stdout.write(f"Rebuilt booking rollups: {written} rows in {time.monotonic() - started:.2f}s.")
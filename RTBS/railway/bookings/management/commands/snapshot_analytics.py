@@ -0,0 +1,28 @@
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from bookings import snapshots
+
+
+class Command(BaseCommand):
+    help = 'Write bookings, passengers, payments and availability changed since the last run to columnar files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='rewrite every journey month')
+        parser.add_argument('--format', choices=sorted(snapshots.FORMATS),
+                            help='arrow (memory-mappable, default) or parquet; changing it implies --full')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            run = snapshots.take_snapshot(full=options['full'], fmt=options['format'])
+        except ImproperlyConfigured as exc:
+            raise CommandError(str(exc))
+        rows = ', '.join(f"{table} {n}" for table, n in run['rows'].items())
+        self.stdout.write(
+            f"Snapshot {'rebuilt' if run['full'] else 'updated'} in {snapshots.snapshot_dir()}: "
+            f"{len(run['months'])} journey month(s) {', '.join(run['months']) or '-'}; rows {rows} "
+            f"in {time.monotonic() - started:.2f}s."
+        )
@@ -0,0 +1,151 @@
+# bookings/metrics.py
+"""
+In-process metrics, exported in the Prometheus text format by the staff-only
+/metrics/ view.
+
+Histograms and counters are plain objects guarded by one lock each; an
+observation is a bisect and two additions, so instrumenting a hot path costs
+about a microsecond. `Histogram.time()` works both as a context manager and
+as a decorator.
+
+Every web worker process keeps its own numbers, and a scrape sees the worker
+that served it (the `pid` label tells them apart). Work done in the PDF pool
+processes is measured from the web process, around the wait for its result.
+"""
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FAST_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005, 0.01, 0.05)
+COUNT_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 50, 100, 200)
+
+_registry = []
+
+
+def _labels(names, values):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self, extra):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_labels(self.labelnames + extra[0], key + extra[1])} {value}"
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [per-bucket counts (last: +Inf), sum]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def time(self, **labels):
+        """Observe the seconds spent in a `with` block or a decorated function."""
+        return _Timer(self, labels)
+
+    def render(self, extra):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = sorted((k, (list(c), s)) for k, (c, s) in self._series.items())
+        names = self.labelnames + extra[0]
+        for key, (counts, total) in series:
+            values = key + extra[1]
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                yield f"{self.name}_bucket{_labels(names + ('le',), values + (bound,))} {cumulative}"
+            yield f"{self.name}_sum{_labels(names, values)} {total}"
+            yield f"{self.name}_count{_labels(names, values)} {cumulative}"
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram, self.labels = histogram, labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapped(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+
+        return wrapped
+
+
+def render():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    extra = (("pid",), (os.getpid(),))
+    lines = [line for metric in _registry for line in metric.render(extra)]
+    return "\n".join(lines) + "\n"
+
+
+# ---- the metrics ----
+VIEW_SECONDS = Histogram(
+    "railway_view_seconds", "Request latency by view.", ["view", "method"]
+)
+VIEW_QUERIES = Histogram(
+    "railway_view_queries", "Database queries per request by view.", ["view"], COUNT_BUCKETS
+)
+VIEW_DB_SECONDS = Histogram(
+    "railway_view_db_seconds", "Database time per request by view.", ["view"]
+)
+LOCK_WAIT_SECONDS = Histogram(
+    "railway_inventory_lock_wait_seconds",
+    "Wait for the database write lock before a seat map write.",
+    ["op"],
+)
+SEAT_CONFLICTS = Counter(
+    "railway_inventory_conflicts_total",
+    "Seat map writes lost to a concurrent writer and retried.",
+    ["op"],
+)
+PDF_SECONDS = Histogram(
+    "railway_pdf_render_seconds", "Wait for a PDF render, by document.", ["document"]
+)
+PDF_CACHE = Counter(
+    "railway_pdf_cache_total", "Ticket PDF lookups by cache result.", ["result"]
+)
+FARE_SECONDS = Histogram(
+    "railway_fare_seconds", "Fare computation time per call.", ["fn"], FAST_BUCKETS
+)
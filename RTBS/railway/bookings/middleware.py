@@ -0,0 +1,277 @@
+# bookings/middleware.py
+"""
+Per-request accounting: query budget and request metrics.
+
+QueryBudgetMiddleware counts the queries and database time of every request
+on all aliases, records them with the request latency per view in
+bookings/metrics.py, and compares them with the view's budget:
+
+* settings.QUERY_BUDGETS[url_name], else
+* the view's @query_budget(queries=..., time_ms=...), else
+* settings.QUERY_BUDGET.
+
+A request over budget is logged (logger "bookings.querybudget") with its
+most repeated statements, fingerprinted with literals and IN lists folded,
+which is usually enough to spot an N+1. With QUERY_BUDGET_RAISE (tests) it
+raises QueryBudgetExceeded instead. Queries run while a streaming response
+is consumed are not counted.
+
+Both middlewares are sync and async capable, so under ASGI the async views
+run without being wrapped in async_to_sync.
+
+ProfilingMiddleware samples the requests staff ask it to (bookings/profiling.py).
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import SyncToAsync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import metrics
+
+logger = logging.getLogger("bookings.querybudget")
+
+DEFAULT_BUDGET = {"queries": 50, "time_ms": 1000}
+SHOWN_FINGERPRINTS = 5
+
+_IN_LIST = re.compile(r"\bIN \((?:\s*(?:%s|\?|'[^']*'|-?\d+(?:\.\d+)?)\s*,?)+\)", re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w\"])-?\d+(?:\.\d+)?\b")
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(queries=None, time_ms=None):
+    """Set the query budget of a view; put it right above the def."""
+
+    def decorator(view):
+        view.query_budget = {
+            k: v for k, v in (("queries", queries), ("time_ms", time_ms)) if v is not None
+        }
+        return view
+
+    return decorator
+
+
+def fingerprint(sql):
+    """`sql` with parameters, literals and IN lists folded, so repeats group together."""
+    sql = _IN_LIST.sub("IN (...)", sql)
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql).replace("%s", "?")
+    return " ".join(sql.split())
+
+
+class QueryStats:
+    """execute_wrapper that tallies queries, time and statements."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.statements = Counter()  # fingerprinted only when reported
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def fingerprints(self):
+        counts = Counter()
+        for sql, n in self.statements.items():
+            counts[fingerprint(sql)] += n
+        return counts
+
+
+def budget_for(request, view_func):
+    budget = dict(getattr(settings, "QUERY_BUDGET", DEFAULT_BUDGET))
+    budget.update(getattr(view_func, "query_budget", {}))
+    match = request.resolver_match
+    if match and match.url_name:
+        budget.update(getattr(settings, "QUERY_BUDGETS", {}).get(match.url_name, {}))
+    return budget
+
+
+def _wrapping_connections(wrapper):
+    """execute_wrapper(wrapper) on every alias, as one context manager."""
+    stack = ExitStack()
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(wrapper))
+    return stack
+
+
+async def _awrapping_connections(wrapper):
+    """
+    _wrapping_connections for async requests. Connections are per thread, and
+    the async ORM and sync_to_async run a request's queries on its
+    thread-sensitive executor thread, so the wrappers go on that thread's
+    connections. Leaving only pops them off those connections' wrapper lists,
+    which is fine from the event loop.
+    """
+    return await sync_to_async(_wrapping_connections)(wrapper)
+
+
+class QueryBudgetMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = QueryStats()
+        started = time.perf_counter()
+        with _wrapping_connections(stats):
+            response = self.get_response(request)
+        return self.finish(request, stats, started, response)
+
+    async def __acall__(self, request):
+        stats = QueryStats()
+        started = time.perf_counter()
+        with await _awrapping_connections(stats):
+            response = await self.get_response(request)
+        return self.finish(request, stats, started, response)
+
+    def finish(self, request, stats, started, response):
+        match = request.resolver_match
+        if match is not None:
+            metrics.VIEW_SECONDS.observe(
+                time.perf_counter() - started, view=match.view_name, method=request.method
+            )
+            metrics.VIEW_QUERIES.observe(stats.queries, view=match.view_name)
+            metrics.VIEW_DB_SECONDS.observe(stats.seconds, view=match.view_name)
+        budget = getattr(request, "_query_budget", None)
+        if budget is not None:
+            self.check(request, stats, budget)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget = budget_for(request, view_func)
+
+    def check(self, request, stats, budget):
+        ms = stats.seconds * 1000
+        over = []
+        if stats.queries > budget.get("queries", float("inf")):
+            over.append(f"{stats.queries} queries (budget {budget['queries']})")
+        if ms > budget.get("time_ms", float("inf")):
+            over.append(f"{ms:.1f} ms in the database (budget {budget['time_ms']} ms)")
+        if not over:
+            return
+        match = request.resolver_match
+        top = "\n".join(
+            f"  {n}x {sql[:300]}" for sql, n in stats.fingerprints().most_common(SHOWN_FINGERPRINTS)
+        )
+        message = (
+            f"Query budget exceeded by {request.method} {request.path} "
+            f"({match.view_name if match else '?'}): {', '.join(over)}. Most repeated:\n{top}"
+        )
+        if getattr(settings, "QUERY_BUDGET_RAISE", False):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+class ProfilingMiddleware:
+    """
+    Profile a request for staff who send "X-Profile: folded|speedscope" or
+    add ?_profile=folded|speedscope ("1" is folded). The file name is sent
+    back in an X-Profile-File header. Other requests cost a dict lookup and a
+    substring test; with settings.PROFILING off the middleware is not loaded.
+
+    Async requests sample the event loop thread while their coroutine runs
+    and, while it awaits, the thread their sync_to_async calls (ORM queries,
+    template rendering) run in, under an AWAITING root frame.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "PROFILING", True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def wanted(request):
+        meta = request.META
+        if "HTTP_X_PROFILE" not in meta and "_profile=" not in meta.get("QUERY_STRING", ""):
+            return None
+        return request.headers.get("X-Profile") or request.GET.get("_profile")
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        fmt = self.wanted(request)
+        if not (fmt and request.user.is_authenticated and request.user.is_staff):
+            return self.get_response(request)
+        return self.profile(request, fmt)
+
+    async def __acall__(self, request):
+        fmt = self.wanted(request)
+        if fmt:
+            user = await request.auser()
+            if user.is_authenticated and user.is_staff:
+                return await self.aprofile(request, fmt)
+        return await self.get_response(request)
+
+    def start(self, fmt, stop_code, executor=None):
+        from . import profiling
+
+        fmt = fmt if fmt in profiling.FORMATS else "folded"
+        profile = profiling.RequestProfile(
+            threading.get_ident(),
+            stop_code,
+            getattr(settings, "PROFILE_INTERVAL", 0.001),
+            executor=executor,
+        )
+        return profile, fmt
+
+    def profile(self, request, fmt):
+        profile, fmt = self.start(fmt, self.profile.__code__)
+        with _wrapping_connections(profile):
+            profile.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                profile.stop()
+        return self.finish(request, profile, fmt, response)
+
+    async def aprofile(self, request, fmt):
+        # the request's thread-sensitive executor thread, below asgiref's frames
+        executor = await sync_to_async(threading.get_ident)()
+        profile, fmt = self.start(
+            fmt, self.aprofile.__code__, executor=(executor, SyncToAsync.thread_handler.__code__)
+        )
+        with await _awrapping_connections(profile):
+            profile.start()
+            try:
+                response = await self.get_response(request)
+            finally:
+                profile.stop()
+        return self.finish(request, profile, fmt, response)
+
+    def finish(self, request, profile, fmt, response):
+        from . import profiling
+
+        match = request.resolver_match
+        view_name = match.view_name if match else "unresolved"
+        profiling.record(view_name, profile)
+        response["X-Profile-File"] = profile.write(view_name, fmt)
+        return response
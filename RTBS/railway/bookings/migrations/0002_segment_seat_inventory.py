@@ -0,0 +1,101 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:40
+
+import struct
+
+from django.db import migrations, models
+
+
+def build_seat_maps(apps, schema_editor):
+    """Replay active bookings into per-segment seat maps (lowest free seats first)."""
+    Booking = apps.get_model('bookings', 'Booking')
+    RouteStop = apps.get_model('bookings', 'RouteStop')
+    TrainBerthAvailability = apps.get_model('bookings', 'TrainBerthAvailability')
+    DailyTrainAvailability = apps.get_model('bookings', 'DailyTrainAvailability')
+
+    positions, stop_counts = {}, {}
+    for train_id, station_id in RouteStop.objects.order_by('train_id', 'sequence').values_list('train_id', 'station_id'):
+        n = stop_counts.get(train_id, 0)
+        positions.setdefault(train_id, {}).setdefault(station_id, n)
+        stop_counts[train_id] = n + 1
+    capacity = {
+        (t, b): c for t, b, c in TrainBerthAvailability.objects.values_list('train_id', 'berth_type_id', 'capacity')
+    }
+
+    maps = {}
+    active = Booking.objects.filter(status__in=['PENDING', 'CONFIRMED']).order_by('created_at', 'pk')
+    for booking in active.prefetch_related('passengers'):
+        stops = positions.get(booking.train_id, {})
+        start, end = stops.get(booking.source_id), stops.get(booking.destination_id)
+        seats = capacity.get((booking.train_id, booking.berth_type_id), 0)
+        if start is None or end is None or start >= end:
+            continue
+        key = (booking.train_id, booking.berth_type_id, booking.date_of_journey)
+        rows = maps.setdefault(key, [0] * max(stop_counts.get(booking.train_id, 1) - 1, 0))
+        taken = 0
+        for r in rows[start:end]:
+            taken |= r
+        passengers = list(booking.passengers.all())
+        free = [s for s in range(seats) if not taken >> s & 1][:len(passengers)]
+        if len(free) < len(passengers):
+            continue
+        bits = sum(1 << s for s in free)
+        for i in range(start, end):
+            rows[i] |= bits
+        for p, s in zip(passengers, free):
+            p.seat_index = s
+            p.save(update_fields=['seat_index'])
+        booking.seg_from, booking.seg_to = start, end
+        booking.save(update_fields=['seg_from', 'seg_to'])
+
+    for (train_id, berth_type_id, day), rows in maps.items():
+        seats = capacity.get((train_id, berth_type_id), 0)
+        width = (seats + 7) // 8
+        data = struct.pack('<HH', len(rows), seats) + b''.join(r.to_bytes(width, 'little') for r in rows)
+        taken = 0
+        for r in rows:
+            taken |= r
+        DailyTrainAvailability.objects.update_or_create(
+            train_id=train_id, berth_type_id=berth_type_id, date=day,
+            defaults={'seat_map': data, 'available_seats': seats - taken.bit_count()},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='seg_from',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='seg_to',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='dailytrainavailability',
+            name='seat_map',
+            field=models.BinaryField(blank=True, default=b''),
+        ),
+        migrations.AddField(
+            model_name='passenger',
+            name='seat_index',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='passenger',
+            name='gender',
+            field=models.CharField(choices=[('M', 'Male'), ('F', 'Female')], max_length=1),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='gender',
+            field=models.CharField(blank=True, choices=[('M', 'Male'), ('F', 'Female')], max_length=1, null=True),
+        ),
+        migrations.RunPython(build_seat_maps, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0002_segment_seat_inventory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailytrainavailability',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0004_booking_expired_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user', '-created_at'], name='booking_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['created_at'], name='booking_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', 'created_at'], name='booking_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['date_of_journey'], name='booking_journey_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['train', 'date_of_journey', 'berth_type'], name='booking_train_day_berth_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailytrainavailability',
+            index=models.Index(fields=['date', 'train'], name='dta_date_train_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='routestop',
+            index=models.Index(fields=['train', 'station'], name='routestop_train_station_idx'),
+        ),
+    ]
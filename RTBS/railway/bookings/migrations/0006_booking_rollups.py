@@ -0,0 +1,106 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:53
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+
+
+def fill_rollups(apps, schema_editor):
+    # same aggregation as bookings.rollups.rebuild(), on the historical models
+    Booking = apps.get_model('bookings', 'Booking')
+    totals = {
+        'bookings': Count('pk'),
+        'revenue': Sum('total_fare'),
+        'confirmed': Count('pk', filter=Q(status='CONFIRMED')),
+        'confirmed_revenue': Sum('total_fare', filter=Q(status='CONFIRMED')),
+    }
+    groups = [
+        ('DailyBookingStats', {'day': TruncDate('created_at')}),
+        ('RouteBookingStats', {'source_id': F('source_id'), 'destination_id': F('destination_id')}),
+        ('CustomerBookingStats', {'user_id': F('user_id')}),
+        ('BerthBookingStats', {'berth_type_id': F('berth_type_id')}),
+    ]
+    for name, group_by in groups:
+        model = apps.get_model('bookings', name)
+        rows = (
+            Booking.objects.annotate(**{f'g_{k}': v for k, v in group_by.items()})
+            .values(*(f'g_{k}' for k in group_by))
+            .annotate(**totals)
+            .order_by()
+        )
+        model.objects.bulk_create(
+            [model(**{k: r[f'g_{k}'] for k in group_by}, **{k: r[k] or 0 for k in totals}) for r in rows],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0005_booking_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBookingStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bookings', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('confirmed', models.PositiveIntegerField(default=0)),
+                ('confirmed_revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('day', models.DateField(unique=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='BerthBookingStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bookings', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('confirmed', models.PositiveIntegerField(default=0)),
+                ('confirmed_revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('berth_type', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='bookings.berthtype')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='CustomerBookingStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bookings', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('confirmed', models.PositiveIntegerField(default=0)),
+                ('confirmed_revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-bookings'], name='customerstats_bookings_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RouteBookingStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bookings', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('confirmed', models.PositiveIntegerField(default=0)),
+                ('confirmed_revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('destination', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='bookings.station')),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='bookings.station')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-revenue'], name='routestats_revenue_idx')],
+                'unique_together': {('source', 'destination')},
+            },
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0008_updated_at_watermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='train',
+            name='running_days',
+            field=models.PositiveSmallIntegerField(default=127),
+        ),
+        migrations.CreateModel(
+            name='TrainRunException',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('runs', models.BooleanField(default=False)),
+                ('note', models.CharField(blank=True, max_length=100)),
+                ('train', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='run_exceptions', to='bookings.train')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'train'], name='trainrunexc_date_train_idx')],
+                'unique_together': {('train', 'date')},
+            },
+        ),
+    ]
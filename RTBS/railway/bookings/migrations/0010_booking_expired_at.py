@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:48
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_expired_at(apps, schema_editor):
+    # expiry was the last write to an expired hold
+    Booking = apps.get_model('bookings', 'Booking')
+    Booking.objects.filter(status='EXPIRED').update(expired_at=F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0009_train_running_days'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='expired_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['expired_at'], name='booking_expired_idx'),
+        ),
+        migrations.RunPython(fill_expired_at, migrations.RunPython.noop),
+    ]
@@ -37,12 +37,32 @@ class BerthType(models.Model):
         return f"{self.name} ({self.code})"
 
 class Train(models.Model):
+    DAILY = 0b1111111
     number = models.CharField(max_length=20, unique=True)
     name = models.CharField(max_length=255)
+    # weekdays the train runs, bit 0 = Monday .. bit 6 = Sunday; see bookings/schedule.py
+    running_days = models.PositiveSmallIntegerField(default=DAILY)
     # Optional: default overall capacity, but we'll use TrainBerthAvailability to manage berth-wise capacity
     def __str__(self):
         return f"{self.number} - {self.name}"
 
+# a date overriding a train's running days: cancelled (holiday) or an extra run (special)
+class TrainRunException(models.Model):
+    train = models.ForeignKey(Train, on_delete=models.CASCADE, related_name='run_exceptions')
+    date = models.DateField()
+    runs = models.BooleanField(default=False)
+    note = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        unique_together = ('train', 'date')
+        indexes = [
+            # exceptions of all trains on a date (search, availability population)
+            models.Index(fields=['date', 'train'], name='trainrunexc_date_train_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.train.number} {'runs' if self.runs else 'cancelled'} on {self.date}"
+
 class TrainBerthAvailability(models.Model):
     train = models.ForeignKey(Train, on_delete=models.CASCADE, related_name='berths')
     berth_type = models.ForeignKey(BerthType, on_delete=models.CASCADE)
@@ -65,6 +85,10 @@ class RouteStop(models.Model):
     class Meta:
         unique_together = ('train', 'sequence')
         ordering = ['sequence']
+        indexes = [
+            # departure time of a train at a station (tickets)
+            models.Index(fields=['train', 'station'], name='routestop_train_station_idx'),
+        ]
 
     def __str__(self):
         return f"{self.train.number} stop {self.sequence} - {self.station.code}"
@@ -75,15 +99,28 @@ class DailyTrainAvailability(models.Model):
     berth_type = models.ForeignKey(BerthType, on_delete=models.CASCADE)
     date = models.DateField()
     available_seats = models.PositiveIntegerField()
+    # seats x route segments occupancy, see bookings/inventory.py
+    seat_map = models.BinaryField(default=b'', blank=True)
+    # bumped on every seat map write, used for optimistic (lock-free) updates
+    version = models.PositiveIntegerField(default=0)
+    # analytics snapshot watermark; auto_now only covers save(), so every
+    # queryset .update() of this model sets it explicitly
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ('train', 'berth_type', 'date')
+        indexes = [
+            # all trains on a date (dashboard), rolling window cleanup
+            models.Index(fields=['date', 'train'], name='dta_date_train_idx'),
+            # rows changed since the last analytics snapshot
+            models.Index(fields=['updated_at'], name='dta_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.train.number} | {self.berth_type.code} | {self.date} -> {self.available_seats}"
 
 class Booking(models.Model):
-    STATUS_CHOICES = [('PENDING','PENDING'), ('CONFIRMED','CONFIRMED'), ('CANCELLED','CANCELLED')]
+    STATUS_CHOICES = [('PENDING','PENDING'), ('CONFIRMED','CONFIRMED'), ('CANCELLED','CANCELLED'), ('EXPIRED','EXPIRED')]
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='bookings')
     train = models.ForeignKey(Train, on_delete=models.CASCADE)
     source = models.ForeignKey(Station, on_delete=models.CASCADE, related_name='source_bookings')
@@ -94,6 +131,32 @@ class Booking(models.Model):
     total_fare = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
     created_at = models.DateTimeField(auto_now_add=True)
+    # route segments seg_from..seg_to-1 held in the seat map
+    seg_from = models.PositiveSmallIntegerField(null=True, blank=True)
+    seg_to = models.PositiveSmallIntegerField(null=True, blank=True)
+    # when an unpaid hold was expired and its seats released (bookings/holds.py)
+    expired_at = models.DateTimeField(null=True, blank=True)
+    # analytics snapshot watermark; auto_now only covers save(), so every
+    # queryset .update() of this model sets it explicitly
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # my bookings, newest first
+            models.Index(fields=['user', '-created_at'], name='booking_user_created_idx'),
+            # dashboard time series and stats windows
+            models.Index(fields=['created_at'], name='booking_created_idx'),
+            # hold expiry sweep and hold metrics
+            models.Index(fields=['status', 'created_at'], name='booking_status_created_idx'),
+            # exports by journey date
+            models.Index(fields=['date_of_journey'], name='booking_journey_idx'),
+            # bookings on one train/date/class (seat map replay, manifests)
+            models.Index(fields=['train', 'date_of_journey', 'berth_type'], name='booking_train_day_berth_idx'),
+            # bookings changed since the last analytics snapshot
+            models.Index(fields=['updated_at'], name='booking_updated_idx'),
+            # seats reclaimed by hold expiry in the metrics window
+            models.Index(fields=['expired_at'], name='booking_expired_idx'),
+        ]
 
     def __str__(self):
         return f"Booking {self.pk} {self.user} {self.train.number} {self.date_of_journey}"
@@ -104,6 +167,7 @@ class Passenger(models.Model):
     age = models.PositiveIntegerField()
     gender = models.CharField(max_length=1, choices=User.GENDER_CHOICES)
     seat_number = models.CharField(max_length=20, blank=True, null=True)
+    seat_index = models.PositiveIntegerField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.name} ({self.age})"
@@ -114,3 +178,67 @@ class Payment(models.Model):
     status = models.CharField(max_length=10, choices=[('PENDING','PENDING'),('SUCCESS','SUCCESS'),('FAILED','FAILED')], default='PENDING')
     txn_id = models.CharField(max_length=255, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+
+# booking rollups for the admin dashboard, kept up to date by bookings/rollups.py
+class BookingStats(models.Model):
+    bookings = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    confirmed = models.PositiveIntegerField(default=0)
+    confirmed_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+
+    class Meta:
+        abstract = True
+
+class DailyBookingStats(BookingStats):
+    day = models.DateField(unique=True)   # local date of created_at
+
+    def __str__(self):
+        return f"{self.day}: {self.bookings} bookings"
+
+class RouteBookingStats(BookingStats):
+    source = models.ForeignKey(Station, on_delete=models.CASCADE, related_name='+')
+    destination = models.ForeignKey(Station, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        unique_together = ('source', 'destination')
+        indexes = [models.Index(fields=['-revenue'], name='routestats_revenue_idx')]
+
+    def __str__(self):
+        return f"{self.source_id} -> {self.destination_id}: {self.bookings} bookings"
+
+class CustomerBookingStats(BookingStats):
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        indexes = [models.Index(fields=['-bookings'], name='customerstats_bookings_idx')]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.bookings} bookings"
+
+class BerthBookingStats(BookingStats):
+    berth_type = models.OneToOneField(BerthType, on_delete=models.CASCADE, related_name='+')
+
+    def __str__(self):
+        return f"{self.berth_type_id}: {self.bookings} bookings"
+
+# background bulk PDF export of bookings, see bookings/exports.py
+class PdfExportJob(models.Model):
+    STATUS_CHOICES = [('QUEUED','QUEUED'), ('RUNNING','RUNNING'), ('DONE','DONE'), ('FAILED','FAILED')]
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    params = models.JSONField(default=dict, blank=True)   # export filters, as query string lists
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='QUEUED')
+    rows = models.PositiveIntegerField(default=0)
+    chunks = models.PositiveIntegerField(default=0)
+    chunks_done = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # last sign of life of the job; set by hand on .update() (see exports.fail_stale_jobs)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def progress(self):
+        # chunks is an estimate until the job is done
+        return min(round(100 * self.chunks_done / self.chunks), 100) if self.chunks else 0
+
+    def __str__(self):
+        return f"PDF export {self.pk} {self.status} {self.chunks_done}/{self.chunks}"
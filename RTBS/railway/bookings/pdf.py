@@ -0,0 +1,25 @@
+# bookings/pdf.py
+"""
+HTML to PDF rendering with xhtml2pdf.
+
+Only imported inside the PDF worker processes of bookings/documents.py (or
+in the request with PDF_WORKERS = 0), so web workers never load xhtml2pdf
+and reportlab themselves.
+"""
+import io
+
+from xhtml2pdf import pisa  # type: ignore
+
+
+def write_pdf(html, dest):
+    """Render an HTML string into the file-like `dest`; returns the pisa status."""
+    return pisa.CreatePDF(io.BytesIO(html.encode("utf-8")), dest=dest, encoding="utf-8")
+
+
+def html_to_pdf(html):
+    """(pdf bytes, None), or (None, error count)."""
+    result = io.BytesIO()
+    pdf_status = write_pdf(html, result)
+    if pdf_status.err:
+        return None, pdf_status.err
+    return result.getvalue(), None
@@ -0,0 +1,268 @@
+# bookings/profiling.py
+"""
+Sampling profiler for single requests, switched on by staff per request
+(see ProfilingMiddleware in bookings/middleware.py).
+
+While a profiled request runs, a helper thread reads the request thread's
+Python stack every settings.PROFILE_INTERVAL seconds (sys._current_frames),
+and an execute_wrapper notes the SQL statement in flight, which is added as
+the innermost frame of the samples taken during it. The result is written to
+settings.PROFILE_DIR as a collapsed-stack file (flamegraph.pl, speedscope,
+inferno) or a speedscope JSON file, and added to per-view aggregates of this
+process: hot functions by self and total samples, and queries by count and
+time. Only the newest settings.PROFILE_FILES_KEPT files are kept. Nothing
+here runs for requests that don't ask for it.
+
+A sampler thread needs the GIL to take a sample, and a thread running pure
+Python only gives it up every interpreter switch interval (5 ms by default).
+While any profile runs, the switch interval of the process is lowered to the
+sampling interval; the last profile to finish puts it back.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from .middleware import fingerprint
+
+FORMATS = {"folded": ".folded", "speedscope": ".speedscope.json"}
+TOP = 15
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+AWAITING = "<awaiting>"  # outer frame of async samples taken in the executor thread
+
+_labels = {}  # code object -> frame label
+_root = str(settings.BASE_DIR) + os.sep
+_lock = threading.Lock()
+_by_view = {}  # view name -> ViewProfile
+_running = 0  # profiles in progress
+_switch_interval = None  # to restore when the last one ends
+
+
+def profile_dir():
+    return Path(getattr(settings, "PROFILE_DIR", settings.BASE_DIR / "profiles"))
+
+
+def files_kept():
+    return getattr(settings, "PROFILE_FILES_KEPT", 200)
+
+
+def _profile_files(directory):
+    """Profile files in `directory`, newest first (names start with a timestamp)."""
+    return sorted(
+        (p for p in directory.iterdir() if p.suffix in (".folded", ".json")),
+        key=lambda p: p.name,
+        reverse=True,
+    )
+
+
+def _label(code):
+    label = _labels.get(code)
+    if label is None:
+        path = code.co_filename
+        if path.startswith(_root):
+            path = path[len(_root):]
+        else:
+            # site-packages/django/db/... -> django/db/...
+            path = path.rsplit("site-packages" + os.sep, 1)[-1]
+        label = _labels[code] = f"{code.co_qualname} ({path}:{code.co_firstlineno})"
+    return label
+
+
+class RequestProfile:
+    def __init__(self, thread_id, stop_code, interval, executor=None):
+        self.thread_id = thread_id
+        self.stop_code = stop_code  # frames from this one outwards are the server's, not the request's
+        self.interval = interval
+        # async requests: (thread id, stop code) of the thread their sync_to_async calls run in
+        self.executor = executor
+        self.stacks = Counter()  # (outermost .. innermost label) -> samples
+        self.queries = {}  # fingerprint -> [count, seconds]
+        self.sql = None  # statement in flight
+        self.elapsed = 0.0
+        self._fingerprints = {}
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    # ---- sampling ----
+    def start(self):
+        global _running, _switch_interval
+        with _lock:
+            if not _running:
+                _switch_interval = sys.getswitchinterval()
+                sys.setswitchinterval(min(self.interval, _switch_interval))
+            _running += 1
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        global _running
+        self._done.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+        with _lock:
+            _running -= 1
+            if not _running:
+                sys.setswitchinterval(_switch_interval)
+
+    def _run(self):
+        while not self._done.wait(self.interval):
+            frames = sys._current_frames()
+            if self.thread_id in frames:
+                self._sample(frames, self.sql)
+
+    @staticmethod
+    def _walk(frame, stop_code):
+        """Labels from `frame` outwards up to stop_code, and whether it was reached."""
+        stack = []
+        while frame is not None and frame.f_code is not stop_code:
+            stack.append(_label(frame.f_code))
+            frame = frame.f_back
+        return stack, frame is not None
+
+    def _sample(self, frames, sql):
+        stack, found = self._walk(frames[self.thread_id], self.stop_code)
+        if not found and self.executor is not None:
+            # the coroutine is suspended: the request's work, if any, runs in the executor
+            thread_id, stop_code = self.executor
+            stack, found = self._walk(frames.get(thread_id), stop_code)
+            stack = (stack if found else []) + [AWAITING]
+        stack.reverse()
+        if sql is not None:
+            stack.append("SQL " + self._fingerprint(sql)[:200])
+        self.stacks[tuple(stack)] += 1
+
+    def _fingerprint(self, sql):
+        fp = self._fingerprints.get(sql)
+        if fp is None:
+            fp = self._fingerprints[sql] = fingerprint(sql)
+        return fp
+
+    # execute_wrapper
+    def __call__(self, execute, sql, params, many, context):
+        self.sql = sql
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql = None
+            entry = self.queries.setdefault(self._fingerprint(sql), [0, 0.0])
+            entry[0] += 1
+            entry[1] += time.perf_counter() - started
+
+    # ---- output ----
+    def folded(self):
+        """Collapsed stacks: "outer;...;inner samples" per line."""
+        return "".join(f"{';'.join(stack)} {n}\n" for stack, n in self.stacks.most_common())
+
+    def speedscope(self, name):
+        frames, index = [], {}
+        samples, weights = [], []
+        # samples come at most every interval, so weigh them to add up to the wall time
+        per_sample = self.elapsed / max(sum(self.stacks.values()), 1)
+        for stack, n in self.stacks.most_common():
+            ids = []
+            for label in stack:
+                if label not in index:
+                    index[label] = len(frames)
+                    frames.append({"name": label})
+                ids.append(index[label])
+            samples.append(ids)
+            weights.append(n * per_sample)
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": name,
+            "exporter": "railway bookings.profiling",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled", "name": name, "unit": "seconds",
+                "startValue": 0, "endValue": sum(weights), "samples": samples, "weights": weights,
+            }],
+        }
+
+    def write(self, view_name, fmt):
+        """Write the profile in `fmt` (see FORMATS) to the profile directory; returns the file name."""
+        directory = profile_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        stamp = timezone.localtime().strftime("%Y%m%d-%H%M%S-%f")[:-3]
+        name = f"{stamp}-{view_name.replace(':', '-')}-{os.getpid()}-{self.thread_id % 10000}{FORMATS[fmt]}"
+        if fmt == "speedscope":
+            content = json.dumps(self.speedscope(f"{view_name} ({self.elapsed * 1000:.0f} ms)"))
+        else:
+            content = self.folded()
+        tmp = directory / (name + ".tmp")
+        tmp.write_text(content)
+        os.replace(tmp, directory / name)
+        for old in _profile_files(directory)[files_kept():]:
+            old.unlink(missing_ok=True)  # another worker may have pruned it already
+        return name
+
+
+class ViewProfile:
+    """Profiles of one view added up."""
+
+    def __init__(self):
+        self.requests = 0
+        self.samples = 0
+        self.seconds = 0.0
+        self.self_samples = Counter()  # innermost frame
+        self.total_samples = Counter()  # anywhere on the stack
+        self.queries = Counter()
+        self.query_seconds = Counter()
+
+    def add(self, profile):
+        self.requests += 1
+        self.seconds += profile.elapsed
+        for stack, n in profile.stacks.items():
+            if not stack:
+                continue
+            self.samples += n
+            self.self_samples[stack[-1]] += n
+            for label in set(stack):
+                self.total_samples[label] += n
+        for fp, (count, seconds) in profile.queries.items():
+            self.queries[fp] += count
+            self.query_seconds[fp] += seconds
+
+    def summary(self, top=TOP):
+        samples = self.samples or 1
+        return {
+            "requests": self.requests,
+            "samples": self.samples,
+            "avg_ms": self.seconds * 1000 / self.requests if self.requests else 0,
+            "self": [(label, n, 100 * n / samples) for label, n in self.self_samples.most_common(top)],
+            "total": [(label, n, 100 * n / samples) for label, n in self.total_samples.most_common(top)],
+            "queries": [
+                (fp, self.queries[fp], seconds * 1000, seconds * 1000 / self.requests)
+                for fp, seconds in self.query_seconds.most_common(top)
+            ],
+        }
+
+
+def record(view_name, profile):
+    with _lock:
+        _by_view.setdefault(view_name, ViewProfile()).add(profile)
+
+
+def summaries(top=TOP):
+    """{view name: ViewProfile.summary()} for this process, busiest view first."""
+    with _lock:
+        views = sorted(_by_view.items(), key=lambda item: -item[1].seconds)
+        return {name: view.summary(top) for name, view in views}
+
+
+def reset():
+    with _lock:
+        _by_view.clear()
+
+
+def recent_files(limit=20):
+    directory = profile_dir()
+    if not directory.is_dir():
+        return []
+    return [p.name for p in _profile_files(directory)[:limit]]
@@ -0,0 +1,144 @@
+# bookings/rollups.py
+"""
+Pre-aggregated booking stats for the admin dashboard.
+
+Four rollups (per created day, per route, per customer, per berth type) keep
+booking counts and fare totals over all bookings, plus the same for bookings
+that are currently CONFIRMED. They are updated right after the transaction
+that changes the booking commits (transaction.on_commit), so the rollup rows,
+which every booking writes, are never locked inside the seat hold's write
+transaction:
+
+* creation and deletion via signals (bookings/signals.py), so the admin and
+  shell are covered too;
+* status changes via status_changed(), called next to each conditional
+  status UPDATE (those bypass signals).
+
+Anything else that edits bookings behind our back (raw SQL, changing
+total_fare in the admin), or a process dying between the commit and the
+rollup update, is fixed by `manage.py rebuild_rollups`.
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import (
+    BerthBookingStats,
+    Booking,
+    CustomerBookingStats,
+    DailyBookingStats,
+    RouteBookingStats,
+)
+
+ZERO = Decimal("0.00")
+
+
+def _keys(booking):
+    return [
+        (DailyBookingStats, {"day": timezone.localdate(booking.created_at)}),
+        (
+            RouteBookingStats,
+            {"source_id": booking.source_id, "destination_id": booking.destination_id},
+        ),
+        (CustomerBookingStats, {"user_id": booking.user_id}),
+        (BerthBookingStats, {"berth_type_id": booking.berth_type_id}),
+    ]
+
+
+def _bump(model, key, deltas):
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(**key).update(**updates):
+        return
+    if any(delta < 0 for delta in deltas.values()):
+        return  # nothing recorded yet to take back; a rebuild will settle it
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **deltas)
+    except IntegrityError:
+        # created concurrently between our UPDATE and INSERT
+        model.objects.filter(**key).update(**updates)
+
+
+def _apply(booking, **deltas):
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    keys = _keys(booking)  # now: the booking may change before the commit
+
+    def bump():
+        with transaction.atomic():
+            for model, key in keys:
+                _bump(model, key, deltas)
+
+    # robust: a failed rollup update must not fail a booking that committed
+    transaction.on_commit(bump, robust=True)
+
+
+def booking_created(booking):
+    fare = booking.total_fare or ZERO
+    confirmed = booking.status == "CONFIRMED"
+    _apply(
+        booking,
+        bookings=1,
+        revenue=fare,
+        confirmed=int(confirmed),
+        confirmed_revenue=fare if confirmed else ZERO,
+    )
+
+
+def booking_deleted(booking):
+    fare = booking.total_fare or ZERO
+    confirmed = booking.status == "CONFIRMED"
+    _apply(
+        booking,
+        bookings=-1,
+        revenue=-fare,
+        confirmed=-int(confirmed),
+        confirmed_revenue=-fare if confirmed else ZERO,
+    )
+
+
+def status_changed(booking, old, new):
+    """Record a status UPDATE of `booking` from old to new."""
+    sign = int(new == "CONFIRMED") - int(old == "CONFIRMED")
+    fare = booking.total_fare or ZERO
+    _apply(booking, confirmed=sign, confirmed_revenue=sign * fare)
+
+
+def rebuild():
+    """Recompute every rollup from the Booking table; returns rows written."""
+    totals = {
+        "bookings": Count("pk"),
+        "revenue": Sum("total_fare"),
+        "confirmed": Count("pk", filter=Q(status="CONFIRMED")),
+        "confirmed_revenue": Sum("total_fare", filter=Q(status="CONFIRMED")),
+    }
+    groups = [
+        (DailyBookingStats, {"day": TruncDate("created_at")}),
+        (RouteBookingStats, {"source_id": F("source_id"), "destination_id": F("destination_id")}),
+        (CustomerBookingStats, {"user_id": F("user_id")}),
+        (BerthBookingStats, {"berth_type_id": F("berth_type_id")}),
+    ]
+    written = 0
+    with transaction.atomic():
+        for model, group_by in groups:
+            model.objects.all().delete()
+            rows = (
+                Booking.objects.annotate(**{f"g_{k}": v for k, v in group_by.items()})
+                .values(*(f"g_{k}" for k in group_by))
+                .annotate(**totals)
+                .order_by()
+            )
+            objs = [
+                model(
+                    **{k: row[f"g_{k}"] for k in group_by},
+                    **{k: row[k] or 0 for k in totals},
+                )
+                for row in rows
+            ]
+            model.objects.bulk_create(objs, batch_size=1000)
+            written += len(objs)
+    return written
@@ -0,0 +1,159 @@
+# bookings/routes.py
+"""
+In-memory route index built from RouteStop.
+
+Each station maps to a list of stop entries sorted by train id, so the trains
+running from A to B are found by walking the two station lists side by side
+instead of running per-train RouteStop subqueries.
+
+The index is rebuilt every ROUTE_INDEX_TTL seconds, and as soon as the search
+cache generation (bookings/caching.py) moves: with a shared cache another
+process may have changed routes, and results computed from an older index
+must not be stored under the new generation. A RouteStop saved or deleted in
+this process only patches its train in (refresh_train); the lists readers may
+hold are never changed in place, changed stations get new ones.
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import namedtuple
+
+from django.conf import settings
+
+from . import caching
+
+StopEntry = namedtuple(
+    "StopEntry", ["train_id", "sequence", "distance", "departure", "position"]
+)
+RouteMatch = namedtuple("RouteMatch", ["train_id", "src", "dst", "distance"])
+
+
+class RouteIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._by_station = {}  # station_id -> [StopEntry] sorted by (train_id, sequence)
+        self._by_train = {}  # train_id -> [(station_id, StopEntry)] in sequence order
+        self._built_at = None
+        self._generation = None  # search cache generation the index was built at
+
+    # ---- building ----
+    def _ttl(self):
+        return getattr(settings, "ROUTE_INDEX_TTL", 300)
+
+    def _ensure_built(self):
+        generation = caching.generation()
+        built_at = self._built_at
+        if (
+            built_at is None
+            or generation != self._generation
+            or time.monotonic() - built_at > self._ttl()
+        ):
+            self.rebuild(generation)
+
+    def _load(self, train_id=None):
+        from .models import RouteStop
+
+        qs = RouteStop.objects.all()
+        if train_id is not None:
+            qs = qs.filter(train_id=train_id)
+        rows = qs.order_by("train_id", "sequence").values_list(
+            "train_id", "station_id", "sequence", "distance", "departure"
+        )
+        by_train = {}
+        for train, station, sequence, distance, departure in rows:
+            stops = by_train.setdefault(train, [])
+            stops.append(
+                (station, StopEntry(train, sequence, distance, departure, len(stops)))
+            )
+        return by_train
+
+    def rebuild(self, generation=None):
+        # read before loading: a later bump triggers another rebuild
+        if generation is None:
+            generation = caching.generation()
+        by_train = self._load()
+        by_station = {}
+        for stops in by_train.values():
+            for station, entry in stops:
+                by_station.setdefault(station, []).append(entry)
+        for entries in by_station.values():
+            entries.sort(key=lambda e: (e.train_id, e.sequence))
+        with self._lock:
+            self._by_train = by_train
+            self._by_station = by_station
+            self._built_at = time.monotonic()
+            self._generation = generation
+
+    def refresh_train(self, train_id):
+        """Re-read the stops of a single train and patch them into the index."""
+        if self._built_at is None:
+            return  # nothing built yet, the next lookup loads everything
+        stops = self._load(train_id).get(train_id, [])
+        with self._lock:
+            stations = {station for station, _ in self._by_train.pop(train_id, [])}
+            stations.update(station for station, _ in stops)
+            for station in stations:
+                # a new list: trains_between and match read theirs outside the lock
+                entries = [e for e in self._by_station.get(station, []) if e.train_id != train_id]
+                entries.extend(e for s, e in stops if s == station)
+                entries.sort(key=lambda e: (e.train_id, e.sequence))
+                self._by_station[station] = entries
+            if stops:
+                self._by_train[train_id] = stops
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    # ---- lookups ----
+    def trains_between(self, src_id, dst_id):
+        """Trains that stop at src before dst, as RouteMatch tuples sorted by train id."""
+        self._ensure_built()
+        with self._lock:
+            a = self._by_station.get(src_id, [])
+            b = self._by_station.get(dst_id, [])
+        matches = []
+        i = j = 0
+        while i < len(a) and j < len(b):
+            ta, tb = a[i].train_id, b[j].train_id
+            if ta < tb:
+                i += 1
+            elif tb < ta:
+                j += 1
+            else:
+                # first stop of the train at each station, like the old subqueries
+                src, dst = a[i], b[j]
+                if src.sequence < dst.sequence:
+                    matches.append(
+                        RouteMatch(ta, src, dst, dst.distance - src.distance)
+                    )
+                while i < len(a) and a[i].train_id == ta:
+                    i += 1
+                while j < len(b) and b[j].train_id == ta:
+                    j += 1
+        return matches
+
+    def match(self, train_id, src_id, dst_id):
+        """RouteMatch for one train, or None if it does not run src -> dst."""
+        self._ensure_built()
+        with self._lock:
+            a = self._by_station.get(src_id, [])
+            b = self._by_station.get(dst_id, [])
+        key = lambda e: e.train_id  # noqa: E731
+        i = bisect_left(a, train_id, key=key)
+        j = bisect_left(b, train_id, key=key)
+        if i == len(a) or j == len(b) or a[i].train_id != train_id or b[j].train_id != train_id:
+            return None
+        src, dst = a[i], b[j]
+        if src.sequence >= dst.sequence:
+            return None
+        return RouteMatch(train_id, src, dst, dst.distance - src.distance)
+
+    def stops(self, train_id):
+        """[(station_id, StopEntry)] for a train in sequence order."""
+        self._ensure_built()
+        with self._lock:
+            return list(self._by_train.get(train_id, []))
+
+
+route_index = RouteIndex()
@@ -0,0 +1,47 @@
+# bookings/schedule.py
+"""
+Running-day calendar of trains.
+
+Train.running_days is a 7-bit mask of the weekdays a train runs (bit 0 =
+Monday, as date.weekday()); TrainRunException rows override it for single
+dates, either cancelling a run (holidays) or adding one (specials). Search,
+booking and the population of DailyTrainAvailability all go through here,
+so a train has no inventory, results or bookings on days it doesn't run.
+"""
+from datetime import timedelta
+
+from django.db.models import Exists, F, OuterRef, Q
+
+from .models import Train, TrainRunException
+
+
+def running_on(qs, day, train_field="pk"):
+    """`qs` narrowed to rows whose train (Train itself for "pk") runs on `day`."""
+    prefix = "" if train_field == "pk" else f"{train_field}__"
+    exceptions = TrainRunException.objects.filter(train=OuterRef(train_field), date=day)
+    return qs.alias(
+        runs_weekly=F(f"{prefix}running_days").bitand(1 << day.weekday()),
+        cancelled=Exists(exceptions.filter(runs=False)),
+        extra=Exists(exceptions.filter(runs=True)),
+    ).filter(Q(runs_weekly__gt=0, cancelled=False) | Q(extra=True))
+
+
+def runs_on(train_id, day):
+    return running_on(Train.objects.filter(pk=train_id), day).exists()
+
+
+def running_dates(first, last, train_ids=None):
+    """{(train_id, date)} of the runs from `first` to `last` inclusive, in two queries."""
+    trains = Train.objects.all()
+    if train_ids is not None:
+        trains = trains.filter(pk__in=train_ids)
+    masks = dict(trains.values_list("pk", "running_days"))
+    days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+    running = {
+        (t, d) for t, bits in masks.items() for d in days if bits >> d.weekday() & 1
+    }
+    for t, d, runs in TrainRunException.objects.filter(
+        date__range=(first, last), train_id__in=list(masks)
+    ).values_list("train_id", "date", "runs"):
+        (running.add if runs else running.discard)((t, d))
+    return running
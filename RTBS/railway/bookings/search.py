@@ -0,0 +1,174 @@
+# bookings/search.py
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+
+from .models import DailyTrainAvailability, Train
+from . import caching, inventory, schedule
+from .routes import route_index
+from .utils import calculate_fares
+
+
+def _route_results(src, dst, journey_date):
+    """
+    Route and fare part of a search, cached per (source, destination, date).
+
+    [{"train", "segments", "seg_from", "seg_to", "berths": [{"berth", "capacity",
+    "fare_per_passenger", "fare_total_preview"}]}]
+    """
+    cache = caching.search_cache()
+    key = caching.routes_key(src.pk, dst.pk, journey_date)
+    results = cache.get(key)
+    if results is not None:
+        return results
+
+    matches = route_index.trains_between(src.pk, dst.pk)
+    train_ids = [m.train_id for m in matches]
+    # trains that don't run on journey_date drop out here (bookings/schedule.py)
+    trains_by_id = {
+        t.pk: t
+        for t in schedule.running_on(
+            Train.objects.filter(pk__in=train_ids), journey_date
+        ).prefetch_related("berths__berth_type")
+    }
+    rows = []
+    for m in matches:
+        t = trains_by_id.get(m.train_id)
+        if t is None:
+            continue
+        for tb in t.berths.all():
+            rows.append((t, m, tb))
+    fares = calculate_fares(
+        [(m.distance, tb.berth_type.price_per_km) for _, m, tb in rows]
+    )
+
+    results = []
+    for (t, m, tb), fare in zip(rows, fares):
+        if not results or results[-1]["train"] is not t:
+            seg_from, seg_to = inventory.segment_span(m)
+            results.append(
+                {
+                    "train": t,
+                    "segments": inventory.segment_count(t.pk),
+                    "seg_from": seg_from,
+                    "seg_to": seg_to,
+                    "berths": [],
+                }
+            )
+        results[-1]["berths"].append(
+            {
+                "berth": tb.berth_type,
+                "capacity": tb.capacity,
+                "fare_per_passenger": fare["base_per"],
+                "fare_total_preview": fare["total"],
+            }
+        )
+    cache.set(key, results, caching.routes_ttl())
+    return results
+
+
+def seat_maps(train_ids, journey_date):
+    """{train_id: {berth_type_id: seat_map bytes}} from short-lived per (train, date) snapshots."""
+    cache = caching.search_cache()
+    keys = {caching.availability_key(t, journey_date): t for t in train_ids}
+    cached = cache.get_many(keys)
+    maps = {keys[k]: v for k, v in cached.items()}
+    missing = [t for k, t in keys.items() if k not in cached]
+    if missing:
+        fresh = defaultdict(dict)
+        for train_id, berth_type_id, seat_map in DailyTrainAvailability.objects.filter(
+            train_id__in=missing, date=journey_date
+        ).values_list("train_id", "berth_type_id", "seat_map"):
+            fresh[train_id][berth_type_id] = bytes(seat_map)
+        snapshot = {t: fresh.get(t, {}) for t in missing}
+        cache.set_many(
+            {caching.availability_key(t, journey_date): v for t, v in snapshot.items()},
+            caching.availability_ttl(),
+        )
+        maps.update(snapshot)
+    return maps
+
+
+async def aseat_maps(train_ids, journey_date):
+    """Async seat_maps: cache and DailyTrainAvailability read without blocking the event loop."""
+    cache = caching.search_cache()
+    keys = {caching.availability_key(t, journey_date): t for t in train_ids}
+    cached = await cache.aget_many(keys)
+    maps = {keys[k]: v for k, v in cached.items()}
+    missing = [t for k, t in keys.items() if k not in cached]
+    if missing:
+        fresh = defaultdict(dict)
+        async for train_id, berth_type_id, seat_map in DailyTrainAvailability.objects.filter(
+            train_id__in=missing, date=journey_date
+        ).values_list("train_id", "berth_type_id", "seat_map"):
+            fresh[train_id][berth_type_id] = bytes(seat_map)
+        snapshot = {t: fresh.get(t, {}) for t in missing}
+        await cache.aset_many(
+            {caching.availability_key(t, journey_date): v for t, v in snapshot.items()},
+            caching.availability_ttl(),
+        )
+        maps.update(snapshot)
+    return maps
+
+
+def _overlay(route, train_maps):
+    """A cached route result with seats left filled in from its seat maps."""
+    berths = []
+    for b in route["berths"]:
+        seat_map = inventory.SeatMap.from_bytes(
+            train_maps.get(b["berth"].pk), route["segments"], b["capacity"]
+        )
+        berths.append(
+            {
+                "berth": b["berth"],
+                "seats_left": seat_map.free_count(route["seg_from"], route["seg_to"]),
+                "fare_per_passenger": b["fare_per_passenger"],
+                "fare_total_preview": b["fare_total_preview"],
+            }
+        )
+    return {"train": route["train"], "berths": berths}
+
+
+def iter_trains(src, dst, journey_date, chunk_size=50):
+    """
+    Search results for src -> dst on journey_date, yielded train by train.
+
+    The route and fare part comes from one cached lookup; seat maps are read
+    chunk_size trains at a time (all at once for None), so callers can stream
+    the first trains out before availability for the rest has been fetched.
+    """
+    routes = _route_results(src, dst, journey_date)
+    step = chunk_size or max(len(routes), 1)
+    for start in range(0, len(routes), step):
+        chunk = routes[start : start + step]
+        maps = seat_maps([r["train"].pk for r in chunk], journey_date)
+        for r in chunk:
+            yield _overlay(r, maps.get(r["train"].pk, {}))
+
+
+async def aiter_trains(src, dst, journey_date, chunk_size=50):
+    """Async iter_trains for the ASGI views."""
+    routes = await sync_to_async(_route_results)(src, dst, journey_date)
+    step = chunk_size or max(len(routes), 1)
+    for start in range(0, len(routes), step):
+        chunk = routes[start : start + step]
+        maps = await aseat_maps([r["train"].pk for r in chunk], journey_date)
+        for r in chunk:
+            yield _overlay(r, maps.get(r["train"].pk, {}))
+
+
+def find_trains(src, dst, journey_date):
+    """
+    Trains running src -> dst with per-berth seats and fares for journey_date.
+
+    Uses a fixed number of queries however many trains match: the route comes
+    from the in-memory index, seat maps for every (train, berth) are read in
+    one query and fares are computed as one batch. Both parts are cached (see
+    bookings/caching.py); seats left are counted over the travelled segments
+    only, from the availability snapshot.
+    """
+    return list(iter_trains(src, dst, journey_date, chunk_size=None))
+
+
+async def afind_trains(src, dst, journey_date):
+    return [r async for r in aiter_trains(src, dst, journey_date, chunk_size=None)]
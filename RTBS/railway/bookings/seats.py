@@ -0,0 +1,94 @@
+# bookings/seats.py
+"""
+Seat selection on top of the seat map.
+
+Seats are numbered coach-wise in bays (compartments). A booking is placed in
+a single bay when one has room, senior citizens get lower berths first, and
+other passengers are steered away from lower berths so they stay free for
+seniors booking later. Picking a seat is a couple of bit operations on the
+free-seat bitset, so the cost per passenger does not grow with the coach.
+"""
+
+# berth positions within one bay, in seat order
+BAY_LAYOUTS = {
+    "SL": ("LB", "MB", "UB", "LB", "MB", "UB", "SL", "SU"),
+    "3A": ("LB", "MB", "UB", "LB", "MB", "UB", "SL", "SU"),
+    "2A": ("LB", "UB", "LB", "UB", "SL", "SU"),
+    "1A": ("LB", "UB", "LB", "UB"),
+}
+LOWER_BERTHS = ("LB", "SL")
+DEFAULT_BAY_SIZE = 8  # seating classes: keep groups within a block of 8 seats
+SENIOR_AGE = 60
+
+
+def berth_position(berth_code, seat_index):
+    layout = BAY_LAYOUTS.get(berth_code)
+    if not layout:
+        return None
+    return layout[seat_index % len(layout)]
+
+
+def seat_label(berth_code, seat_index):
+    label = f"{berth_code}-{seat_index + 1:03d}"
+    position = berth_position(berth_code, seat_index)
+    return f"{label} {position}" if position else label
+
+
+def _lower_mask(berth_code):
+    layout = BAY_LAYOUTS.get(berth_code, ())
+    return sum(1 << i for i, pos in enumerate(layout) if pos in LOWER_BERTHS)
+
+
+def _pop_lowest(bits):
+    low = bits & -bits
+    return low.bit_length() - 1, bits ^ low
+
+
+def pick_seats(free, berth_code, ages):
+    """
+    Seat indices for passengers of the given ages, in the same order, taken
+    from the `free` bitset; None when there are not enough free seats.
+    """
+    count = len(ages)
+    if free.bit_count() < count:
+        return None
+    layout = BAY_LAYOUTS.get(berth_code)
+    size = len(layout) if layout else DEFAULT_BAY_SIZE
+    bay_mask = (1 << size) - 1
+    lower = _lower_mask(berth_code)
+    seniors = sum(1 for a in ages if a >= SENIOR_AGE)
+
+    # 1) a single bay that fits everybody, preferring one with enough lower berths
+    pool = None
+    bay, rest = 0, free
+    while rest:
+        bits = rest & bay_mask
+        if bits.bit_count() >= count:
+            if (bits & lower).bit_count() >= seniors:
+                pool = bits << (bay * size)
+                break
+            if pool is None:
+                pool = bits << (bay * size)
+        rest >>= size
+        bay += 1
+    if pool is None:
+        # no bay has room: fill whole bays in seat order until everybody fits
+        pool, bay, rest = 0, 0, free
+        while pool.bit_count() < count:
+            pool |= (rest & bay_mask) << (bay * size)
+            rest >>= size
+            bay += 1
+    lower_pool = pool & sum(lower << (b * size) for b in range(bay + 1))
+
+    # 2) seniors on lower berths, everybody else on the remaining seats
+    picks = [None] * count
+    for i in sorted(range(count), key=lambda i: ages[i] < SENIOR_AGE):
+        if ages[i] >= SENIOR_AGE and lower_pool:
+            seat, lower_pool = _pop_lowest(lower_pool)
+        else:
+            others = pool & ~lower_pool if pool & ~lower_pool else pool
+            seat, _ = _pop_lowest(others)
+            lower_pool &= ~(1 << seat)
+        pool &= ~(1 << seat)
+        picks[i] = seat
+    return picks
@@ -0,0 +1,58 @@
+# bookings/signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import caching, rollups
+from .models import (
+    BerthType,
+    Booking,
+    DailyTrainAvailability,
+    RouteStop,
+    Train,
+    TrainBerthAvailability,
+    TrainRunException,
+)
+from .routes import route_index
+
+
+@receiver(post_save, sender=RouteStop)
+@receiver(post_delete, sender=RouteStop)
+def refresh_route_index(sender, instance, **kwargs):
+    train_id = instance.train_id
+
+    def refresh():
+        # the index patches this train itself; only the cached results go
+        route_index.refresh_train(train_id)
+        caching.invalidate_results()
+
+    transaction.on_commit(refresh)
+
+
+@receiver(post_save, sender=Train)
+@receiver(post_delete, sender=Train)
+@receiver(post_save, sender=TrainBerthAvailability)
+@receiver(post_delete, sender=TrainBerthAvailability)
+@receiver(post_save, sender=BerthType)
+@receiver(post_delete, sender=BerthType)
+@receiver(post_save, sender=TrainRunException)
+@receiver(post_delete, sender=TrainRunException)
+def invalidate_search_routes(sender, instance, **kwargs):
+    transaction.on_commit(caching.invalidate_routes)
+
+
+@receiver(post_save, sender=DailyTrainAvailability)
+@receiver(post_delete, sender=DailyTrainAvailability)
+def invalidate_search_availability(sender, instance, **kwargs):
+    caching.invalidate_availability(instance.train_id, instance.date)
+
+
+@receiver(post_save, sender=Booking)
+def add_booking_to_rollups(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        rollups.booking_created(instance)
+
+
+@receiver(post_delete, sender=Booking)
+def remove_booking_from_rollups(sender, instance, **kwargs):
+    rollups.booking_deleted(instance)
@@ -0,0 +1,277 @@
+# bookings/snapshots.py
+"""
+Columnar analytics snapshot of bookings, passengers, payments and availability.
+
+Each table is written under SNAPSHOT_DIR as one file per journey month, in a
+hive-style layout analysts can point pyarrow / pandas / DuckDB at:
+
+    <SNAPSHOT_DIR>/booking/journey_month=2026-10/data.arrow
+
+The default format is Arrow IPC (uncompressed, so readers can memory-map it
+and read columns without copying); Parquet is available for smaller files.
+
+Runs are incremental. Booking and DailyTrainAvailability carry updated_at,
+and only the journey months with a row changed since the last run's
+watermark are rewritten (whole partitions, so readers never see duplicates).
+Passengers and payments follow their booking's month: every change to them
+goes with a booking update. Deleted rows only disappear with a full run.
+
+Partitions are streamed to disk in record batches of BATCH_ROWS rows, so a
+busy month never sits in memory as Python lists.
+
+pyarrow is only imported here; the rest of the app runs without it.
+"""
+import json
+import os
+from datetime import date, datetime, timedelta
+from itertools import chain, islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+from .models import Booking, DailyTrainAvailability, Passenger, Payment
+
+MANIFEST = "_snapshot.json"
+FORMATS = {"arrow": "data.arrow", "parquet": "data.parquet"}
+# rewrite a little before the watermark: a transaction that commits after a
+# run may carry an updated_at from before it
+OVERLAP = timedelta(minutes=5)
+BATCH_ROWS = 10000
+
+# table -> (model, journey date lookup, [(column, ORM path, arrow type name)])
+TABLES = {
+    "booking": (
+        Booking,
+        "date_of_journey",
+        [
+            ("id", "pk", "int64"),
+            ("user_id", "user_id", "int64"),
+            ("train_id", "train_id", "int64"),
+            ("source_id", "source_id", "int64"),
+            ("destination_id", "destination_id", "int64"),
+            ("date_of_journey", "date_of_journey", "date32"),
+            ("berth_type_id", "berth_type_id", "int64"),
+            ("passengers_count", "passengers_count", "int32"),
+            ("total_fare", "total_fare", "money"),
+            ("status", "status", "string"),
+            ("seg_from", "seg_from", "int16"),
+            ("seg_to", "seg_to", "int16"),
+            ("created_at", "created_at", "timestamp"),
+            ("updated_at", "updated_at", "timestamp"),
+        ],
+    ),
+    # no names: snapshots are for analytics, not for looking people up
+    "passenger": (
+        Passenger,
+        "booking__date_of_journey",
+        [
+            ("id", "pk", "int64"),
+            ("booking_id", "booking_id", "int64"),
+            ("age", "age", "int32"),
+            ("gender", "gender", "string"),
+            ("seat_number", "seat_number", "string"),
+            ("seat_index", "seat_index", "int32"),
+        ],
+    ),
+    "payment": (
+        Payment,
+        "booking__date_of_journey",
+        [
+            ("id", "pk", "int64"),
+            ("booking_id", "booking_id", "int64"),
+            ("amount", "amount", "money"),
+            ("status", "status", "string"),
+            ("txn_id", "txn_id", "string"),
+            ("created_at", "created_at", "timestamp"),
+        ],
+    ),
+    # seat maps are left out; available_seats is the fully free count
+    "availability": (
+        DailyTrainAvailability,
+        "date",
+        [
+            ("id", "pk", "int64"),
+            ("train_id", "train_id", "int64"),
+            ("berth_type_id", "berth_type_id", "int64"),
+            ("date", "date", "date32"),
+            ("available_seats", "available_seats", "int32"),
+            ("version", "version", "int64"),
+            ("updated_at", "updated_at", "timestamp"),
+        ],
+    ),
+}
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise ImproperlyConfigured("Analytics snapshots need pyarrow: pip install pyarrow")
+    return pyarrow
+
+
+def snapshot_dir():
+    return Path(getattr(settings, "SNAPSHOT_DIR", settings.BASE_DIR / "snapshots"))
+
+
+def read_manifest():
+    try:
+        return json.loads((snapshot_dir() / MANIFEST).read_text())
+    except FileNotFoundError:
+        return {}
+
+
+def _write_atomic(path, write):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def _month_end(month):
+    return (month + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+
+def _changed_months(since):
+    """Journey months with a booking or availability row changed since `since` (all with None)."""
+    months = set()
+    for model, day_field in ((Booking, "date_of_journey"), (DailyTrainAvailability, "date")):
+        qs = model.objects.all()
+        if since is not None:
+            qs = qs.filter(updated_at__gte=since)
+        days = qs.order_by().values_list(day_field, flat=True).distinct()
+        months.update(d.replace(day=1) for d in days.iterator(chunk_size=BATCH_ROWS))
+    return months
+
+
+def _arrow_type(pa, name):
+    return {
+        "int16": pa.int16(),
+        "int32": pa.int32(),
+        "int64": pa.int64(),
+        "string": pa.string(),
+        "date32": pa.date32(),
+        "timestamp": pa.timestamp("us", tz="UTC"),
+        "money": pa.decimal128(14, 2),
+    }[name]
+
+
+def _batches(pa, schema, rows):
+    """RecordBatches of up to BATCH_ROWS of the value tuples in `rows`."""
+    rows = iter(rows)
+    while chunk := list(islice(rows, BATCH_ROWS)):
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(zip(*chunk), schema)],
+            schema=schema,
+        )
+
+
+def _write_partition(pa, table, month, fmt):
+    """Rewrite one table's partition for `month`; returns its row count (0: partition removed)."""
+    model, day_field, columns = TABLES[table]
+    schema = pa.schema([(name, _arrow_type(pa, kind)) for name, _, kind in columns])
+    rows = (
+        model.objects.filter(**{f"{day_field}__range": (month, _month_end(month))})
+        .order_by("pk")
+        .values_list(*(path for _, path, _ in columns))
+        .iterator(chunk_size=BATCH_ROWS)
+    )
+    batches = _batches(pa, schema, rows)
+    path = snapshot_dir() / table / f"journey_month={month:%Y-%m}" / FORMATS[fmt]
+    first = next(batches, None)
+    if first is None:
+        path.unlink(missing_ok=True)
+        return 0
+    n = 0
+
+    def write(tmp):
+        nonlocal n
+        if fmt == "parquet":
+            writer = pa.parquet.ParquetWriter(str(tmp), schema)
+        else:
+            writer = pa.ipc.new_file(str(tmp), schema)
+        with writer:
+            for batch in chain([first], batches):
+                writer.write_batch(batch)
+                n += batch.num_rows
+
+    _write_atomic(path, write)
+    return n
+
+
+def take_snapshot(full=False, fmt=None):
+    """
+    Bring the snapshot up to date; returns {"months": [...], "rows": {table: n}}.
+    full rewrites every month with data (and switches format with fmt).
+    """
+    pa = _pyarrow()
+    manifest = read_manifest()
+    fmt = fmt or manifest.get("format", "arrow")
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown snapshot format {fmt!r}")
+    full = full or fmt != manifest.get("format", fmt)
+    started = timezone.now()
+    since = None
+    if not full and manifest.get("watermark"):
+        since = datetime.fromisoformat(manifest["watermark"]) - OVERLAP
+
+    months = _changed_months(since)
+    if full:
+        # months that held data before but no longer do
+        old = {
+            date.fromisoformat(f"{p.name.split('=', 1)[1]}-01")
+            for p in snapshot_dir().glob("*/journey_month=*")
+        }
+        months |= old
+    rows = {}
+    for table in TABLES:
+        rows[table] = sum(_write_partition(pa, table, month, fmt) for month in sorted(months))
+        if full:  # drop files of the other format
+            other = next(name for f, name in FORMATS.items() if f != fmt)
+            for path in (snapshot_dir() / table).glob(f"journey_month=*/{other}"):
+                path.unlink()
+
+    manifest = {
+        "format": fmt,
+        "watermark": started.isoformat(),
+        "last_run": {"months": [f"{m:%Y-%m}" for m in sorted(months)], "rows": rows, "full": full},
+        "tables": {
+            table: sorted(p.parent.name for p in (snapshot_dir() / table).glob("journey_month=*/data.*"))
+            for table in TABLES
+        },
+    }
+    _write_atomic(snapshot_dir() / MANIFEST, lambda tmp: tmp.write_text(json.dumps(manifest, indent=2)))
+    return manifest["last_run"]
+
+
+def read_table(table, months=None):
+    """
+    One snapshot table as a pyarrow.Table. Arrow IPC partitions are
+    memory-mapped, so only the columns actually used are paged in.
+    """
+    pa = _pyarrow()
+    parts = []
+    for path in sorted((snapshot_dir() / table).glob("journey_month=*/data.*")):
+        month = path.parent.name.split("=", 1)[1]
+        if months is not None and month not in months:
+            continue
+        if path.suffix == ".arrow":
+            parts.append(pa.ipc.open_file(pa.memory_map(str(path))).read_all())
+        else:
+            parts.append(pa.parquet.read_table(path, memory_map=True))
+    if not parts:
+        _, _, columns = TABLES[table]
+        return pa.schema([(n, _arrow_type(pa, k)) for n, _, k in columns]).empty_table()
+    return pa.concat_tables(parts)
+
+
+def revenue_by_route(months=None):
+    """Example offline query: bookings and fare total per (source, destination)."""
+    bookings = read_table("booking", months)
+    return bookings.group_by(["source_id", "destination_id"]).aggregate(
+        [("id", "count"), ("total_fare", "sum")]
+    )
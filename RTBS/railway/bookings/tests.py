@@ -1,3 +1,1528 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from . import (
+    api,
+    async_views,
+    caching,
+    documents,
+    exports,
+    forecasting,
+    holds,
+    inventory,
+    metrics,
+    profiling,
+    schedule,
+    search,
+    snapshots,
+    views,
+)
+from .management.commands import populate_daily_availability
+from .middleware import QueryBudgetExceeded, QueryBudgetMiddleware, fingerprint, query_budget
+from .models import (
+    BerthBookingStats,
+    BerthType,
+    Booking,
+    DailyBookingStats,
+    DailyTrainAvailability,
+    Passenger,
+    Payment,
+    PdfExportJob,
+    RouteStop,
+    Station,
+    Train,
+    TrainBerthAvailability,
+    TrainRunException,
+    User,
+)
+from .routes import route_index
+from .seats import LOWER_BERTHS, berth_position, pick_seats, seat_label
+from .utils import calculate_fare, calculate_fares
+
+# "SCAN bookings_booking" is a full table scan; "SCAN ... USING [COVERING] INDEX"
+# walks an index and "SEARCH ..." seeks into one.
+FULL_SCAN = re.compile(r"\bSCAN (?!CONSTANT ROW)(\w+)(?! USING)(?:\s|$)")
+
+
+@unittest.skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN is SQLite syntax")
+class QueryPlanTests(TestCase):
+    """
+    The hot queries of the booking flow, dashboard and background jobs must be
+    served by an index. Each test explains the queryset the code actually runs
+    and fails on a full scan of any table.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("plan", password="x")
+        cls.src = Station.objects.create(name="Ahmedabad", code="ADI")
+        cls.dst = Station.objects.create(name="Mumbai Central", code="MMCT")
+        cls.berth = BerthType.objects.create(name="Sleeper", code="SL", price_per_km=Decimal("0.50"))
+        cls.train = Train.objects.create(number="12934", name="Karnavati Express")
+        RouteStop.objects.create(train=cls.train, station=cls.src, sequence=1, distance=0)
+        RouteStop.objects.create(train=cls.train, station=cls.dst, sequence=2, distance=491)
+        cls.day = date.today() + timedelta(days=3)
+        cls.booking = Booking.objects.create(
+            user=cls.user,
+            train=cls.train,
+            source=cls.src,
+            destination=cls.dst,
+            date_of_journey=cls.day,
+            berth_type=cls.berth,
+            passengers_count=1,
+        )
+
+    def assertIndexed(self, queryset):
+        plan = queryset.explain()
+        scans = FULL_SCAN.findall(plan)
+        self.assertFalse(scans, f"full scan of {', '.join(scans)}:\n{queryset.query}\n{plan}")
+
+    # ---- bookings ----
+    def test_my_bookings(self):
+        self.assertIndexed(
+            self.user.bookings.select_related("train", "source", "destination", "berth_type").order_by(
+                "-created_at"
+            )
+        )
+
+    def test_bookings_since(self):
+        start = timezone.now() - timedelta(days=30)
+        self.assertIndexed(Booking.objects.filter(created_at__gte=start).order_by("created_at"))
+
+    def test_stale_holds(self):
+        cutoff = timezone.now() - timedelta(minutes=15)
+        self.assertIndexed(
+            Booking.objects.filter(status="PENDING", created_at__lt=cutoff).order_by("created_at", "pk")[:500]
+        )
+
+    def test_hold_metrics(self):
+        self.assertIndexed(Booking.objects.filter(status="PENDING"))
+        self.assertIndexed(Booking.objects.filter(status="EXPIRED", expired_at__gte=timezone.now()))
+
+    def test_bookings_by_journey_date(self):
+        self.assertIndexed(
+            Booking.objects.select_related("user", "train", "source", "destination", "berth_type").filter(
+                date_of_journey=self.day
+            )
+        )
+
+    def test_bookings_on_train_day_berth(self):
+        self.assertIndexed(
+            Booking.objects.filter(
+                train=self.train,
+                date_of_journey=self.day,
+                berth_type=self.berth,
+                status__in=["PENDING", "CONFIRMED"],
+            )
+        )
+
+    def test_booked_seats(self):
+        self.assertIndexed(
+            Passenger.objects.filter(booking__in=[self.booking], seat_index__isnull=False).values_list(
+                "booking_id", "seat_index"
+            )
+        )
+
+    def test_bookings_changed_since(self):
+        self.assertIndexed(
+            Booking.objects.filter(updated_at__gte=timezone.now())
+            .order_by()
+            .values_list("date_of_journey", flat=True)
+            .distinct()
+        )
+
+    # ---- routes and availability ----
+    def test_stop_at_station(self):
+        self.assertIndexed(self.train.stops.filter(station=self.src))
+
+    def test_route_index_refresh(self):
+        self.assertIndexed(
+            RouteStop.objects.filter(train_id=self.train.pk)
+            .order_by("train_id", "sequence")
+            .values_list("train_id", "station_id", "sequence", "distance", "departure")
+        )
+
+    def test_seat_map_lookup(self):
+        self.assertIndexed(
+            DailyTrainAvailability.objects.filter(
+                train_id=self.train.pk, berth_type_id=self.berth.pk, date=self.day
+            )
+        )
+
+    def test_seat_maps_for_search(self):
+        self.assertIndexed(
+            DailyTrainAvailability.objects.filter(train_id__in=[self.train.pk], date=self.day).values_list(
+                "train_id", "berth_type_id", "seat_map"
+            )
+        )
+
+    def test_availability_changed_since(self):
+        self.assertIndexed(
+            DailyTrainAvailability.objects.filter(updated_at__gte=timezone.now())
+            .order_by()
+            .values_list("date", flat=True)
+            .distinct()
+        )
+
+    def test_availability_on_date(self):
+        self.assertIndexed(DailyTrainAvailability.objects.filter(date=self.day))
+        self.assertIndexed(DailyTrainAvailability.objects.filter(date__lt=date.today()))
+
+    def test_run_exceptions(self):
+        self.assertIndexed(
+            TrainRunException.objects.filter(
+                date__range=(self.day, self.day + timedelta(days=30)), train_id__in=[1, 2]
+            )
+        )
+        self.assertIndexed(
+            schedule.running_on(Train.objects.filter(pk__in=[1, 2]), self.day)
+        )
+
+
+class ImportTimeTests(unittest.TestCase):
+    """
+    Worker cold start: loading the WSGI app and URLconf must stay cheap and
+    must not pull in the forecasting or PDF stacks (see bookings/forecasting.py,
+    bookings/pdf.py). Measured with `python -X importtime` in a fresh process.
+    """
+
+    HEAVY = ("pandas", "numpy", "sklearn", "xhtml2pdf", "reportlab")
+    # generous for CI machines; the heavy stacks alone add seconds
+    BUDGET_MS = int(os.environ.get("IMPORT_TIME_BUDGET_MS", 1500))
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE="railway.settings")
+        env.pop("RAILWAY_PRELOAD_HEAVY", None)
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import railway.wsgi, railway.urls"],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        # "import time: self [us] | cumulative | imported package", nesting by indent
+        cls.imports = []
+        for line in proc.stderr.splitlines():
+            parts = line.removeprefix("import time:").split("|")
+            if len(parts) == 3 and parts[1].strip().isdigit():
+                name = parts[2][1:]
+                cls.imports.append((name.strip(), len(name) - len(name.lstrip()), int(parts[1])))
+
+    def test_heavy_modules_not_imported(self):
+        loaded = {name.split(".")[0] for name, _, _ in self.imports}
+        self.assertFalse(loaded & set(self.HEAVY), "imported at worker start")
+
+    def test_import_time_budget(self):
+        top_level = [(name, us) for name, depth, us in self.imports if depth == 0]
+        total_ms = sum(us for _, us in top_level) / 1000
+        slowest = sorted(top_level, key=lambda i: -i[1])[:5]
+        self.assertLess(
+            total_ms,
+            self.BUDGET_MS,
+            "slowest top-level imports: " + ", ".join(f"{n} {us // 1000}ms" for n, us in slowest),
+        )
+
+
+@override_settings(QUERY_BUDGET_RAISE=True)
+class QueryBudgetTests(TestCase):
+    """
+    QueryBudgetMiddleware fails the request when a view goes over its query
+    budget, and the main pages stay within theirs however many rows they show
+    (N+1 guard).
+    """
+
+    databases = "__all__"  # "replica" too in the tuned SQLite mode
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("budget", password="x", is_staff=True)
+        cls.src = Station.objects.create(name="Ahmedabad", code="ADI")
+        cls.dst = Station.objects.create(name="Mumbai Central", code="MMCT")
+        cls.berth = BerthType.objects.create(name="Sleeper", code="SL", price_per_km=Decimal("0.50"))
+        cls.day = date.today() + timedelta(days=3)
+        for n in range(5):
+            train = Train.objects.create(number=f"1293{n}", name=f"Express {n}")
+            TrainBerthAvailability.objects.create(train=train, berth_type=cls.berth, capacity=72)
+            RouteStop.objects.create(train=train, station=cls.src, sequence=1, distance=0)
+            RouteStop.objects.create(train=train, station=cls.dst, sequence=2, distance=491)
+            booking = Booking.objects.create(
+                user=cls.user,
+                train=train,
+                source=cls.src,
+                destination=cls.dst,
+                date_of_journey=cls.day,
+                berth_type=cls.berth,
+                passengers_count=2,
+            )
+            Passenger.objects.create(booking=booking, name="A", age=30, gender="M")
+            Passenger.objects.create(booking=booking, name="B", age=60, gender="F")
+
+    def setUp(self):
+        route_index.invalidate()
+        caching.invalidate_routes()
+        self.client.force_login(self.user)
+
+    def run_middleware(self, view, path="/budget/"):
+        request = RequestFactory().get(path)
+        request.resolver_match = resolve(path) if path != "/budget/" else None
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        middleware = QueryBudgetMiddleware(get_response)
+        return middleware(request)
+
+    @staticmethod
+    @query_budget(queries=2)
+    def three_queries(request):
+        for code in ("ADI", "MMCT", "ST"):
+            list(Station.objects.filter(code=code))
+        return None
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id IN (%s, %s, %s) AND code = 'ADI' LIMIT 21"),
+            "SELECT * FROM t WHERE id IN (...) AND code = ? LIMIT ?",
+        )
+
+    def test_over_budget_raises(self):
+        with self.assertRaises(QueryBudgetExceeded) as ctx:
+            self.run_middleware(self.three_queries)
+        self.assertIn("3 queries (budget 2)", str(ctx.exception))
+        self.assertIn('3x SELECT "bookings_station"', str(ctx.exception))
+
+    @override_settings(QUERY_BUDGET_RAISE=False)
+    def test_over_budget_logs(self):
+        with self.assertLogs("bookings.querybudget", "WARNING") as logs:
+            self.run_middleware(self.three_queries)
+        self.assertIn("3 queries (budget 2)", logs.output[0])
+
+    @override_settings(QUERY_BUDGETS={"my_bookings": {"queries": 1}})
+    def test_budget_by_url_name(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get("/my-bookings/")
+
+    async def test_async_view(self):
+        @query_budget(queries=2)
+        async def three_queries(request):
+            for code in ("ADI", "MMCT", "ST"):
+                [s async for s in Station.objects.filter(code=code)]
+
+        async def get_response(request):
+            middleware.process_view(request, three_queries, (), {})
+            return await three_queries(request)
+
+        middleware = QueryBudgetMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = RequestFactory().get("/budget/")
+        request.resolver_match = None
+        with self.assertRaises(QueryBudgetExceeded) as ctx:
+            await middleware(request)
+        self.assertIn("3 queries (budget 2)", str(ctx.exception))
+
+    @override_settings(QUERY_BUDGETS={"my_bookings": {"queries": 1}})
+    async def test_budget_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        with self.assertRaises(QueryBudgetExceeded):
+            await self.async_client.get("/my-bookings/")
+
+    def test_pages_within_budget(self):
+        pages = [
+            ("get", "/my-bookings/", {}),
+            ("post", "/search/", {"source": "ADI", "destination": "MMCT", "date": self.day.isoformat()}),
+            ("get", "/admin-dashboard/", {}),
+            ("get", f"/ticket/{Booking.objects.first().pk}/", {}),
+        ]
+        for method, path, data in pages:
+            with self.subTest(path=path):
+                response = getattr(self.client, method)(path, data)
+                self.assertEqual(response.status_code, 200)
+
+
+class ProfilingTests(TestCase):
+    """Staff can profile a request; everyone else gets the plain response."""
+
+    databases = "__all__"  # "replica" too in the tuned SQLite mode
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user("prof", password="x", is_staff=True)
+        cls.user = User.objects.create_user("plain", password="x")
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        override = override_settings(PROFILE_DIR=self.dir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        profiling.reset()
+
+    def test_profiled_request(self):
+        self.client.force_login(self.staff)
+        response = self.client.get("/my-bookings/?_profile=1")
+        name = response["X-Profile-File"]
+        self.assertTrue(name.endswith(".folded"))
+        self.assertTrue(os.path.isfile(os.path.join(self.dir.name, name)))
+        summary = profiling.summaries()["my_bookings"]
+        self.assertEqual(summary["requests"], 1)
+        self.assertTrue(any("bookings_booking" in sql for sql, *_ in summary["queries"]))
+
+        response = self.client.get("/admin-dashboard/", HTTP_X_PROFILE="speedscope")
+        self.assertTrue(response["X-Profile-File"].endswith(".speedscope.json"))
+        self.assertEqual(self.client.get("/admin-dashboard/profiles/").status_code, 200)
+
+    def test_old_files_pruned(self):
+        self.client.force_login(self.staff)
+        with override_settings(PROFILE_FILES_KEPT=2):
+            names = [self.client.get("/my-bookings/?_profile=1")["X-Profile-File"] for _ in range(3)]
+        self.assertEqual(sorted(os.listdir(self.dir.name)), sorted(names[1:]))
+        self.assertEqual(profiling.recent_files(), names[:0:-1])
+
+    def test_not_staff(self):
+        self.client.force_login(self.user)
+        response = self.client.get("/my-bookings/?_profile=1")
+        self.assertNotIn("X-Profile-File", response)
+        self.assertEqual(os.listdir(self.dir.name), [])
+
+    async def test_profiled_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get("/my-bookings/?_profile=1")
+        self.assertNotIn("X-Profile-File", response)
+
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get("/my-bookings/", headers={"X-Profile": "speedscope"})
+        self.assertTrue(response["X-Profile-File"].endswith(".speedscope.json"))
+        summary = profiling.summaries()["my_bookings"]
+        self.assertEqual(summary["requests"], 1)
+        self.assertTrue(any("bookings_booking" in sql for sql, *_ in summary["queries"]))
+
+
+class SearchCacheTests(TestCase):
+    """Route changes reach searches through the cache generation, in any process."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.src = Station.objects.create(name="Ahmedabad", code="ADI")
+        cls.dst = Station.objects.create(name="Mumbai Central", code="MMCT")
+        cls.berth = BerthType.objects.create(name="Sleeper", code="SL", price_per_km=Decimal("0.50"))
+        cls.day = date.today() + timedelta(days=3)
+        cls.add_train("12934")
+
+    @classmethod
+    def add_train(cls, number):
+        """A train created without signals, as another process would."""
+        train = Train.objects.create(number=number, name=f"Express {number}")
+        TrainBerthAvailability.objects.bulk_create(
+            [TrainBerthAvailability(train=train, berth_type=cls.berth, capacity=72)]
+        )
+        RouteStop.objects.bulk_create(
+            [
+                RouteStop(train=train, station=cls.src, sequence=1, distance=0),
+                RouteStop(train=train, station=cls.dst, sequence=2, distance=491),
+            ]
+        )
+        return train
+
+    def setUp(self):
+        caching.search_cache().clear()
+        route_index.invalidate()
+
+    def numbers(self):
+        return [r["train"].number for r in search.find_trains(self.src, self.dst, self.day)]
+
+    def test_cached_until_invalidated(self):
+        self.assertEqual(self.numbers(), ["12934"])
+        self.add_train("22962")
+        self.assertEqual(self.numbers(), ["12934"])  # cached results and route index
+        caching.invalidate_routes()
+        self.assertEqual(self.numbers(), ["12934", "22962"])
+
+    def test_index_rebuilt_on_new_generation(self):
+        self.numbers()
+        self.add_train("22962")
+        # another process bumped the shared generation; the local index is well within its TTL
+        caching.search_cache().incr("search:generation")
+        self.assertEqual(self.numbers(), ["12934", "22962"])
+        self.assertEqual([m.train_id for m in route_index.trains_between(self.src.pk, self.dst.pk)][-1],
+                         Train.objects.get(number="22962").pk)
+
+    def test_signals_invalidate(self):
+        self.assertEqual(self.numbers(), ["12934"])
+        generation = caching.generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            train = Train.objects.get(number="12934")
+            RouteStop.objects.filter(train=train, station=self.dst).delete()
+            for stop in RouteStop.objects.filter(train=train):
+                stop.save()
+        with mock.patch.object(route_index, "rebuild") as rebuild:
+            self.assertEqual(self.numbers(), [])
+        rebuild.assert_not_called()  # refresh_train patched the index
+        self.assertEqual(caching.generation(), generation)
+
+    def test_refresh_train_swaps_lists(self):
+        other = self.add_train("22962")
+        brc = Station.objects.create(name="Vadodara", code="BRC")
+        RouteStop.objects.create(train=other, station=brc, sequence=3, distance=600)
+        self.numbers()
+        entries = route_index._by_station[brc.pk]  # as held by a reader
+        train = Train.objects.get(number="12934")
+        RouteStop.objects.bulk_create([RouteStop(train=train, station=brc, sequence=3, distance=600)])
+        route_index.refresh_train(train.pk)
+        self.assertEqual([e.train_id for e in entries], [other.pk])
+        self.assertEqual(
+            [e.train_id for e in route_index._by_station[brc.pk]], sorted([train.pk, other.pk])
+        )
+        self.assertIsNotNone(route_index.match(train.pk, self.src.pk, brc.pk))
+
+
+class TrainPanelTests(TestCase):
+    """The dashboard train table costs the same queries however many trains run."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.berths = [
+            BerthType.objects.create(name=name, code=code, price_per_km=Decimal("1.00"))
+            for name, code in [("Sleeper", "SL"), ("AC 3 Tier", "3A")]
+        ]
+        cls.stations = [Station.objects.create(name=f"Station {i}", code=f"S{i}") for i in range(4)]
+        cls.day = date.today() + timedelta(days=3)
+        cls.trains = []
+
+    def add_trains(self, n):
+        for _ in range(n):
+            i = len(self.trains)
+            train = Train.objects.create(number=f"{12900 + i}", name=f"Express {chr(ord('Z') - i)}")
+            for sequence, station in enumerate(self.stations[: 2 + i % 3], 1):
+                RouteStop.objects.create(train=train, station=station, sequence=sequence, distance=sequence * 100)
+            for berth in self.berths:
+                TrainBerthAvailability.objects.create(train=train, berth_type=berth, capacity=10)
+            # train i has sold i sleeper seats
+            DailyTrainAvailability.objects.create(
+                train=train, berth_type=self.berths[0], date=self.day, available_seats=10 - i
+            )
+            self.trains.append(train)
+
+    def page(self, sort=None, page=None):
+        trains_page, sort = views._train_availability_page(self.day, sort, page)
+        return [row["number"] for row in trains_page], sort
+
+    def test_query_count_independent_of_trains(self):
+        self.add_trains(4)
+        with CaptureQueriesContext(connection) as few:
+            self.page()
+        self.assertEqual(len(few), 2)  # COUNT and SELECT
+        self.add_trains(4)
+        with self.assertNumQueries(len(few)):
+            numbers, _ = self.page()
+        self.assertEqual(len(numbers), 8)
+
+    def test_rows_and_sorting(self):
+        self.add_trains(3)
+        trains_page, sort = views._train_availability_page(self.day, "-available", None)
+        self.assertEqual(sort, "-available")
+        self.assertEqual(
+            [(r["number"], r["stops_count"], r["total_available"], r["total_capacity"]) for r in trains_page],
+            [("12900", 2, 20, 20), ("12901", 3, 19, 20), ("12902", 4, 18, 20)],
+        )
+        self.assertEqual(self.page("name")[0], ["12902", "12901", "12900"])
+        self.assertEqual(self.page("-stops")[0], ["12902", "12901", "12900"])
+        self.assertEqual(self.page("bogus"), (["12900", "12901", "12902"], "number"))
+
+    def test_pagination(self):
+        self.add_trains(5)
+        with mock.patch.object(views, "TRAIN_PANEL_PAGE_SIZE", 2):
+            self.assertEqual(self.page(page="2")[0], ["12902", "12903"])
+            self.assertEqual(self.page(page="3")[0], ["12904"])
+            self.assertEqual(self.page(page="99")[0], ["12904"])  # last page
+            self.assertEqual(self.page(page="x")[0], ["12900", "12901"])  # first page
+
+
+class FareTests(SimpleTestCase):
+    """calculate_fares (search) must price every row exactly like calculate_fare (booking)."""
+
+    PRICES = ["0.50", "1.30", "1.90", "3.20", "0.45", "1.05", "2.35", "0.33"]
+    DISTANCES = [1, 2, 3, 7, 13, 49, 50, 99, 101, 333, 491, 999, 1234, 2999]
+
+    def assertBatchMatches(self):
+        pairs = [(km, Decimal(price)) for price in self.PRICES for km in self.DISTANCES]
+        for passengers in range(1, 6):
+            with self.subTest(passengers=passengers):
+                batch = calculate_fares(pairs, passengers)
+                single = [calculate_fare(km, price, passengers) for km, price in pairs]
+                self.assertEqual(batch, single)
+
+    def test_batch_matches_single(self):
+        self.assertBatchMatches()
+
+    @override_settings(TAX_CONFIG={"GST_PCT": "2.5", "SERVICE_PCT": "1.75", "CONVENIENCE_FEE": "12.5"})
+    def test_batch_matches_single_fractional_taxes(self):
+        self.assertBatchMatches()
+
+
+class SeatPickTests(SimpleTestCase):
+    """Seat selection: whole parties in one bay, seniors on lower berths."""
+
+    ALL_FREE = (1 << 72) - 1
+
+    @staticmethod
+    def free_except(taken, seats=72):
+        return ((1 << seats) - 1) & ~sum(1 << s for s in taken)
+
+    def positions(self, picks):
+        return [berth_position("SL", s) for s in picks]
+
+    def test_seat_label(self):
+        self.assertEqual(
+            [seat_label("SL", i) for i in (0, 1, 2, 6, 7, 8)],
+            ["SL-001 LB", "SL-002 MB", "SL-003 UB", "SL-007 SL", "SL-008 SU", "SL-009 LB"],
+        )
+        self.assertEqual([seat_label("2A", i) for i in (0, 1, 4, 5)], ["2A-001 LB", "2A-002 UB", "2A-005 SL", "2A-006 SU"])
+        self.assertEqual(seat_label("1A", 5), "1A-006 UB")
+        self.assertEqual(seat_label("CC", 11), "CC-012")  # seating class: no berth positions
+
+    def test_senior_gets_lower_berth(self):
+        picks = pick_seats(self.ALL_FREE, "SL", [34, 67, 8])
+        positions = self.positions(picks)
+        self.assertIn(positions[1], LOWER_BERTHS)
+        self.assertNotIn(positions[0], LOWER_BERTHS)
+        self.assertNotIn(positions[2], LOWER_BERTHS)
+
+    def test_party_kept_in_one_bay(self):
+        # bay 0 has two seats left, bay 1 is empty: a party of four goes to bay 1
+        picks = pick_seats(self.free_except(range(6)), "SL", [40, 38, 10, 8])
+        self.assertEqual({s // 8 for s in picks}, {1})
+        self.assertEqual(len(set(picks)), 4)
+
+    def test_bay_with_lower_berths_preferred_for_seniors(self):
+        # bay 0 still has four seats but all its lower berths are taken
+        lowers_bay0 = [i for i in range(8) if berth_position("SL", i) in LOWER_BERTHS]
+        picks = pick_seats(self.free_except(lowers_bay0), "SL", [70, 72])
+        self.assertEqual({s // 8 for s in picks}, {1})
+        self.assertTrue(all(p in LOWER_BERTHS for p in self.positions(picks)))
+
+    def test_no_single_bay_fits(self):
+        # every bay has at most three free seats: the party is spread, seat order
+        free = sum(0b111 << (bay * 8) for bay in range(9))
+        picks = pick_seats(free, "SL", [30, 31, 32, 33, 34])
+        self.assertEqual(len(set(picks)), 5)
+        self.assertTrue(all(free >> s & 1 for s in picks))
+
+    def test_not_enough_seats(self):
+        self.assertIsNone(pick_seats(0b101, "SL", [30, 30, 30]))
+
+
+class SeatMapFixture:
+    """A two-seat train over ADI -> BRC -> MMCT (segments 0 and 1)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.berth = BerthType.objects.create(name="Sleeper", code="SL", price_per_km=Decimal("0.50"))
+        cls.train = Train.objects.create(number="19011", name="Gujarat Express")
+        TrainBerthAvailability.objects.create(train=cls.train, berth_type=cls.berth, capacity=2)
+        for sequence, (code, km) in enumerate([("ADI", 0), ("BRC", 100), ("MMCT", 491)], 1):
+            station = Station.objects.create(name=code, code=code)
+            RouteStop.objects.create(train=cls.train, station=station, sequence=sequence, distance=km)
+        cls.day = date.today() + timedelta(days=3)
+        cls.user = User.objects.create_user("inventory", password="x")
+
+    def setUp(self):
+        route_index.invalidate()
+        self.held = []
+
+    def hold(self, seg_from, seg_to, passengers=1):
+        return inventory.hold_seats(
+            self.train.pk, self.berth, self.day, 2, seg_from, seg_to, [30] * passengers, self.held.append
+        )
+
+    def seat_map(self):
+        dta = DailyTrainAvailability.objects.get(train=self.train, date=self.day)
+        return inventory.load(dta, 2)
+
+    def book(self, seg_from, seg_to, ages, status="CONFIRMED"):
+        stops = list(RouteStop.objects.filter(train=self.train).order_by("sequence"))
+        booking = Booking(
+            user=self.user,
+            train=self.train,
+            source=stops[seg_from].station,
+            destination=stops[seg_to].station,
+            date_of_journey=self.day,
+            berth_type=self.berth,
+            passengers_count=len(ages),
+            status=status,
+            seg_from=seg_from,
+            seg_to=seg_to,
+        )
+
+        def save_booking(seats):
+            booking.save()
+            Passenger.objects.bulk_create(
+                Passenger(booking=booking, name="P", age=age, gender="M", seat_index=seat)
+                for age, seat in zip(ages, seats)
+            )
+
+        inventory.hold_seats(self.train.pk, self.berth, self.day, 2, seg_from, seg_to, ages, save_booking)
+        return booking
+
+
+class InventoryTests(SeatMapFixture, TestCase):
+    """Segment seat maps and the optimistic (version checked) writes to them."""
+
+    databases = "__all__"  # my_bookings reads from the replica in the tuned SQLite mode
+
+    def test_seat_reused_after_passenger_leaves(self):
+        seat_map = inventory.SeatMap(2, 8)
+        seat_map.take([0], 0, 1)  # ADI -> BRC
+        self.assertIn(0, seat_map.free_seats(1, 2))  # BRC -> MMCT
+        self.assertNotIn(0, seat_map.free_seats(0, 2))
+        self.assertEqual(inventory.SeatMap.from_bytes(seat_map.to_bytes(), 2, 8).rows, seat_map.rows)
+
+        first = self.hold(0, 1, passengers=2)
+        second = self.hold(1, 2, passengers=2)
+        self.assertEqual(sorted(first), sorted(second))
+        self.assertEqual(self.held, [first, second])
+
+    def test_full_train(self):
+        self.hold(0, 2, passengers=2)
+        with self.assertRaises(inventory.SeatsUnavailable) as raised:
+            self.hold(1, 2)
+        self.assertEqual(raised.exception.available, 0)
+        self.assertEqual(len(self.held), 1)
+
+    def concurrent_writes(self, times):
+        """Patch _swap so another writer bumps the row version first, `times` times."""
+        swap = inventory._swap
+        calls = []
+
+        def racing_swap(dta, seat_map):
+            calls.append(dta.version)
+            if len(calls) <= times:
+                DailyTrainAvailability.objects.filter(pk=dta.pk).update(version=F("version") + 1)
+            return swap(dta, seat_map)
+
+        return mock.patch.object(inventory, "_swap", racing_swap), calls
+
+    def test_hold_retries_lost_race(self):
+        patch, calls = self.concurrent_writes(2)
+        with patch:
+            seats = self.hold(0, 2)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(self.held, [seats])
+        self.assertEqual(self.seat_map().free_seats(0, 2), [1 - seats[0]])
+
+    def test_hold_gives_up_when_always_beaten(self):
+        patch, calls = self.concurrent_writes(inventory.CAS_RETRIES)
+        with patch, self.assertRaises(inventory.InventoryBusy):
+            self.hold(0, 2)
+        self.assertEqual(len(calls), inventory.CAS_RETRIES)
+        self.assertEqual(self.held, [])
+        self.assertEqual(self.seat_map().free_seats(0, 2), [0, 1])
+
+    def test_release_frees_only_cancelled_segment(self):
+        early = self.hold(0, 1)  # ADI -> BRC
+        late = self.hold(1, 2)  # BRC -> MMCT
+        inventory.release_seats(self.train.pk, self.berth.pk, self.day, 2, [(early, 0, 1)])
+        seat_map = self.seat_map()
+        self.assertEqual(seat_map.free_seats(0, 1), [0, 1])
+        self.assertEqual(seat_map.free_seats(1, 2), [s for s in (0, 1) if s not in late])
+
+    def test_cancel_returns_seats(self):
+        booking = self.book(0, 2, [30, 31])
+        self.assertEqual(self.seat_map().free_seats(0, 2), [])
+        self.client.force_login(self.user)
+        response = self.client.post(reverse("cancel_booking", args=[booking.pk]))
+        self.assertRedirects(response, reverse("my_bookings"), fetch_redirect_response=False)
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, "CANCELLED")
+        self.assertEqual(self.seat_map().free_seats(0, 2), [0, 1])
+
+    def test_cancel_when_inventory_busy(self):
+        booking = self.book(0, 2, [30])
+        self.client.force_login(self.user)
+        with mock.patch.object(inventory, "release_seats", side_effect=inventory.InventoryBusy):
+            response = self.client.post(reverse("cancel_booking", args=[booking.pk]), follow=True)
+        self.assertContains(response, "Please try again")
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, "CONFIRMED")  # rolled back with the release
+        self.assertEqual(len(self.seat_map().free_seats(0, 2)), 1)
+
+    def test_rollups_updated_after_hold_commits(self):
+        with self.captureOnCommitCallbacks() as callbacks, CaptureQueriesContext(connection) as queries:
+            booking = self.book(0, 2, [30, 31])
+        # every booking writes the same rollup rows; keep them out of the hold
+        self.assertFalse([q["sql"] for q in queries if "bookingstats" in q["sql"].lower()])
+        self.assertFalse(DailyBookingStats.objects.exists())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(DailyBookingStats.objects.get().bookings, 1)
+        self.assertEqual(BerthBookingStats.objects.get(berth_type=self.berth).confirmed, 1)
+        self.assertEqual(booking.status, "CONFIRMED")
+
+
+class HoldExpiryTests(SeatMapFixture, TestCase):
+    """expire_stale_holds gives the seats of unpaid holds back; hold_metrics reports it."""
+
+    def age(self, booking, minutes):
+        Booking.objects.filter(pk=booking.pk).update(created_at=timezone.now() - timedelta(minutes=minutes))
+
+    def test_expires_only_stale_pending_holds(self):
+        stale = self.book(0, 1, [30], status="PENDING")
+        fresh = self.book(1, 2, [30], status="PENDING")
+        paid = self.book(0, 2, [30])
+        for booking in (stale, paid):
+            self.age(booking, 20)
+
+        self.assertEqual(holds.expire_stale_holds(), (1, 1))
+        statuses = dict(Booking.objects.values_list("pk", "status"))
+        self.assertEqual(
+            [statuses[b.pk] for b in (stale, fresh, paid)], ["EXPIRED", "PENDING", "CONFIRMED"]
+        )
+        stale.refresh_from_db()
+        self.assertIsNotNone(stale.expired_at)
+        seat_map = self.seat_map()
+        self.assertEqual(len(seat_map.free_seats(0, 1)), 1)  # stale hold's seat is back
+        self.assertEqual(seat_map.free_seats(1, 2), [])  # fresh hold and paid booking
+        self.assertEqual(holds.expire_stale_holds(), (0, 0))
+
+    def test_batches(self):
+        first = self.book(0, 2, [30], status="PENDING")
+        second = self.book(0, 2, [31], status="PENDING")
+        for booking in (first, second):
+            self.age(booking, 20)
+        self.assertEqual(holds.expire_stale_holds(batch_size=1, max_batches=1), (1, 1))
+        self.assertEqual(holds.expire_stale_holds(batch_size=1), (1, 1))
+        self.assertEqual(self.seat_map().free_seats(0, 2), [0, 1])
+
+    def test_confirmed_meanwhile_is_kept(self):
+        booking = self.book(0, 2, [30], status="PENDING")
+        Booking.objects.filter(pk=booking.pk).update(status="CONFIRMED")
+        self.assertEqual(holds.expire_booking(booking), 0)
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, "CONFIRMED")
+        self.assertEqual(len(self.seat_map().free_seats(0, 2)), 1)
+
+    def test_busy_group_skipped(self):
+        busy = self.book(0, 2, [30], status="PENDING")
+        with mock.patch.object(self, "day", self.day + timedelta(days=1)):
+            other = self.book(0, 2, [30], status="PENDING")
+        for booking in (busy, other):
+            self.age(booking, 20)
+
+        release = inventory.release_bookings
+
+        def contended(bookings):
+            if any(b.date_of_journey == self.day for b in bookings):
+                raise inventory.InventoryBusy
+            return release(bookings)
+
+        with mock.patch.object(inventory, "release_bookings", side_effect=contended):
+            self.assertEqual(holds.expire_stale_holds(batch_size=1), (1, 1))
+        busy.refresh_from_db()
+        self.assertEqual(busy.status, "PENDING")  # rolled back, retried next pass
+        self.assertEqual(holds.expire_stale_holds(), (1, 1))
+
+    def test_pay_after_expiry_when_inventory_busy(self):
+        booking = self.book(0, 2, [30], status="PENDING")
+        self.age(booking, 20)
+        self.client.force_login(self.user)
+        with mock.patch.object(inventory, "release_seats", side_effect=inventory.InventoryBusy):
+            response = self.client.post(reverse("mock_pay", args=[booking.pk]))
+        self.assertRedirects(response, reverse("my_bookings"), fetch_redirect_response=False)
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, "PENDING")
+        self.assertFalse(Payment.objects.filter(booking=booking).exists())
+        self.assertEqual(holds.expire_stale_holds(), (1, 1))
+
+    def test_metrics_count_reclaims_by_expiry_time(self):
+        old_booking = self.book(0, 2, [30], status="PENDING")
+        recent = self.book(0, 2, [31], status="PENDING")
+        # booked two days ago but expired just now: reclaimed within the window
+        self.age(recent, 2 * 24 * 60)
+        self.age(old_booking, 3 * 24 * 60)
+        holds.expire_stale_holds()
+        Booking.objects.filter(pk=old_booking.pk).update(expired_at=timezone.now() - timedelta(days=2))
+
+        metrics = holds.hold_metrics()
+        self.assertEqual(metrics["expired_bookings"], 1)
+        self.assertEqual(metrics["reclaimed_seats"], 1)
+        self.assertEqual(metrics["pending_holds"], 0)
+
+
+class ApiTests(SeatMapFixture, TestCase):
+    """The public JSON API: search, availability and fare quotes."""
+
+    def setUp(self):
+        super().setUp()
+        caching.search_cache().clear()
+
+    def get(self, name, **params):
+        headers = {k: params.pop(k) for k in ("HTTP_IF_NONE_MATCH", "HTTP_ACCEPT") if k in params}
+        return self.client.get(reverse(name), {"date": self.day.isoformat(), **params}, **headers)
+
+    def assertCached(self, name, **params):
+        """The ETag of a 200 gets an empty 304 back."""
+        response = self.get(name, **params)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        again = self.get(name, HTTP_IF_NONE_MATCH=etag, **params)
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.content, b"")
+        self.assertEqual(again["ETag"], etag)
+        self.assertEqual(self.get(name, HTTP_IF_NONE_MATCH='"stale"', **params).status_code, 200)
+        return response.json()
+
+    def test_search(self):
+        payload = self.assertCached("api_search", source="ADI", destination="MMCT")
+        self.assertEqual(payload["query"], {"source": "ADI", "destination": "MMCT", "date": self.day.isoformat()})
+        self.assertEqual(payload["count"], 1)
+        result = payload["results"][0]
+        self.assertEqual(result["train"]["number"], "19011")
+        fare = calculate_fare(distance_km=491, price_per_km=self.berth.price_per_km, passengers=1)
+        self.assertEqual(
+            result["berths"],
+            [
+                {
+                    "code": "SL",
+                    "name": "Sleeper",
+                    "seats_left": 2,
+                    "fare_per_passenger": str(fare["base_per"]),
+                    "fare_total_preview": str(fare["total"]),
+                }
+            ],
+        )
+
+    def test_search_ndjson(self):
+        expected = self.get("api_search", source="ADI", destination="MMCT").json()["results"]
+        for params in ({"format": "ndjson"}, {"HTTP_ACCEPT": "application/x-ndjson"}):
+            response = self.get("api_search", source="ADI", destination="MMCT", **params)
+            self.assertTrue(response.streaming)
+            self.assertEqual(response["Content-Type"], "application/x-ndjson")
+            lines = b"".join(response.streaming_content).decode().splitlines()
+            self.assertEqual([json.loads(line) for line in lines], expected)
+
+    def test_search_errors(self):
+        self.assertEqual(self.get("api_search", source="ADI").status_code, 400)
+        response = self.get("api_search", source="ADI", destination="XXX")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {"error": "Unknown station 'XXX'."})
+        yesterday = (date.today() - timedelta(days=1)).isoformat()
+        self.assertEqual(self.get("api_search", source="ADI", destination="MMCT", date=yesterday).status_code, 400)
+        self.assertEqual(self.client.post(reverse("api_search")).status_code, 405)
+
+    def test_availability(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.hold(0, 1)  # ADI -> BRC
+
+        def seats_left(**params):
+            payload = self.assertCached("api_availability", train="19011", **params)
+            return [(b["code"], b["capacity"], b["seats_left"]) for b in payload["berths"]]
+
+        self.assertEqual(seats_left(), [("SL", 2, 1)])
+        self.assertEqual(seats_left(source="BRC", destination="MMCT"), [("SL", 2, 2)])
+        backwards = self.get("api_availability", train="19011", source="MMCT", destination="ADI")
+        self.assertEqual(backwards.status_code, 404)
+        self.assertEqual(self.get("api_availability", train="00000").status_code, 404)
+
+        self.train.running_days = Train.DAILY & ~(1 << self.day.weekday())
+        self.train.save()
+        self.assertEqual(self.get("api_availability", train="19011").status_code, 404)
+
+    def test_availability_etag_follows_bookings(self):
+        etag = self.get("api_availability", train="19011")["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.hold(0, 2)
+        response = self.get("api_availability", train="19011", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["berths"][0]["seats_left"], 1)
+
+    def test_fare_quote(self):
+        payload = self.assertCached(
+            "api_fare_quote", train="19011", source="BRC", destination="MMCT", berth="SL", passengers="2"
+        )
+        fare = calculate_fare(distance_km=391, price_per_km=self.berth.price_per_km, passengers=2)
+        self.assertEqual(payload["distance_km"], 391)
+        self.assertEqual(payload["passengers"], 2)
+        self.assertEqual(payload["fare"], {key: str(value) for key, value in fare.items()})
+
+        quote = {"train": "19011", "source": "ADI", "destination": "MMCT", "berth": "SL"}
+        for params, status in [
+            ({"passengers": "9"}, 400),
+            ({"passengers": "two"}, 400),
+            ({"berth": "1A"}, 404),
+            ({"source": "MMCT", "destination": "ADI"}, 404),
+        ]:
+            with self.subTest(params=params):
+                self.assertEqual(self.get("api_fare_quote", **{**quote, **params}).status_code, status)
+
+    async def test_async_views_answer_alike(self):
+        quote = {"train": "19011", "source": "ADI", "destination": "BRC", "berth": "SL"}
+        day = self.day.isoformat()
+        for sync_view, async_view, params in [
+            (api.search, async_views.api_search, {"source": "ADI", "destination": "MMCT"}),
+            (api.search, async_views.api_search, {"source": "ADI", "destination": "XXX"}),
+            (api.availability, async_views.api_availability, {"train": "19011"}),
+            (api.availability, async_views.api_availability, {**quote, "source": "BRC", "destination": "MMCT"}),
+            (api.fare_quote, async_views.api_fare_quote, {**quote, "passengers": "3"}),
+            (api.fare_quote, async_views.api_fare_quote, {**quote, "passengers": "9"}),
+        ]:
+            with self.subTest(view=sync_view.__name__, params=params):
+                request = RequestFactory().get("/", {"date": day, **params})
+                expected = await sync_to_async(sync_view)(request)
+                response = await async_view(RequestFactory().get("/", {"date": day, **params}))
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(response.content, expected.content)
+                self.assertEqual(response["ETag"], expected["ETag"])
+
+
+class PnrStatusTests(SeatMapFixture, TestCase):
+    """PNR status needs a login and only shows the caller's own bookings."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = User.objects.create_user("other", password="x")
+        cls.staff = User.objects.create_user("staff", password="x", is_staff=True)
+
+    def setUp(self):
+        super().setUp()
+        self.booking = self.book(0, 2, [30])
+        self.url = reverse("api_pnr_status", args=[self.booking.pk])
+
+    def test_anonymous(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+        self.assertNotContains(response, "19011", status_code=401)
+
+    def test_ticket_needs_login(self):
+        response = self.client.get(reverse("download_ticket", args=[self.booking.pk]))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(settings.LOGIN_URL, response["Location"])
+
+    def test_owner_and_staff(self):
+        for user in (self.user, self.staff):
+            self.client.force_login(user)
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["pnr"], self.booking.pk)
+
+    def test_someone_elses_booking_not_found(self):
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    async def test_async_view(self):
+        async def status(user):
+            request = RequestFactory().get(self.url)
+
+            async def auser():
+                return user
+
+            request.auser = auser
+            return (await async_views.api_pnr_status(request, self.booking.pk)).status_code
+
+        self.assertEqual(await status(AnonymousUser()), 401)
+        self.assertEqual(await status(self.other), 404)
+        self.assertEqual(await status(self.user), 200)
+
+
+class MetricsTests(TestCase):
+    """/metrics/ serves the exposition format to staff and to scrapers with the token."""
+
+    def setUp(self):
+        self.enterContext(mock.patch.object(metrics, "_registry", []))
+        self.latency = metrics.Histogram("test_seconds", "Test latency.", ["view"], buckets=(0.1, 1))
+        self.errors = metrics.Counter("test_errors_total", "Test errors.", ["kind"])
+
+    def test_exposition(self):
+        self.latency.observe(0.05, view="search")
+        self.latency.observe(0.5, view="search")
+        self.errors.inc(kind='say "hi"\n')
+        pid = os.getpid()
+        self.assertEqual(
+            metrics.render().splitlines(),
+            [
+                "# HELP test_seconds Test latency.",
+                "# TYPE test_seconds histogram",
+                f'test_seconds_bucket{{view="search",pid="{pid}",le="0.1"}} 1',
+                f'test_seconds_bucket{{view="search",pid="{pid}",le="1"}} 2',
+                f'test_seconds_bucket{{view="search",pid="{pid}",le="+Inf"}} 2',
+                f'test_seconds_sum{{view="search",pid="{pid}"}} 0.55',
+                f'test_seconds_count{{view="search",pid="{pid}"}} 2',
+                "# HELP test_errors_total Test errors.",
+                "# TYPE test_errors_total counter",
+                f'test_errors_total{{kind="say \\"hi\\"\\n",pid="{pid}"}} 1',
+            ],
+        )
+
+    def scrape(self, authorization=None):
+        headers = {"HTTP_AUTHORIZATION": authorization} if authorization is not None else {}
+        return self.client.get(reverse("metrics"), **headers)
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_token(self):
+        response = self.scrape("Bearer s3cret")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], views.METRICS_CONTENT_TYPE)
+        self.assertContains(response, "# TYPE test_seconds histogram")
+        for authorization in (None, "Bearer wrong", "s3cret", "Bearer s3crét"):
+            with self.subTest(authorization=authorization):
+                self.assertEqual(self.scrape(authorization).status_code, 302)  # to the login page
+
+    def test_staff_session(self):
+        self.assertEqual(self.scrape("Bearer ").status_code, 302)  # no token configured
+        self.client.force_login(User.objects.create_user("customer", password="x"))
+        self.assertEqual(self.scrape().status_code, 302)
+        self.client.force_login(User.objects.create_user("ops", password="x", is_staff=True))
+        self.assertContains(self.scrape(), "# TYPE test_errors_total counter")
+
+
+class DocumentTests(SimpleTestCase):
+    """Ticket PDFs rendered in the process pool."""
+
+    @override_settings(PDF_WORKERS=1)
+    def test_render_timeout(self):
+        stuck = Future()  # a render that never finishes
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.object(documents, "RENDER_TIMEOUT", 0.01):
+            with mock.patch.object(documents, "_submit", return_value=stuck), self.assertLogs(
+                "bookings.documents", "WARNING"
+            ):
+                self.assertIsNone(documents._open("<p>ticket</p>", Path(tmp)))
+
+
+class ExportJobTests(SeatMapFixture, TestCase):
+    """Bulk PDF export jobs."""
+
+    def setUp(self):
+        super().setUp()
+        self.staff = User.objects.create_user("exporter", password="x", is_staff=True)
+        self.client.force_login(self.staff)
+
+    def test_post_only(self):
+        url = reverse("admin_export_bookings_pdf")
+        with mock.patch.object(exports, "start_job") as start_job:
+            self.assertEqual(self.client.get(url, {"date": "2026-01-01"}).status_code, 405)
+            self.assertFalse(PdfExportJob.objects.exists())
+            response = self.client.post(url, {"date": "2026-01-01"})
+        job = PdfExportJob.objects.get()
+        self.assertRedirects(response, reverse("admin_export_job", args=[job.pk]), fetch_redirect_response=False)
+        self.assertEqual(job.params, {"date": ["2026-01-01"]})
+        start_job.assert_called_once_with(job)
+
+    def test_stale_jobs_failed(self):
+        stale, fresh = PdfExportJob.objects.create(status="RUNNING"), PdfExportJob.objects.create()
+        PdfExportJob.objects.filter(pk=stale.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        response = self.client.get(reverse("admin_export_job", args=[stale.pk]))
+        self.assertContains(response, "Export failed")
+        self.assertEqual(
+            dict(PdfExportJob.objects.values_list("pk", "status")), {stale.pk: "FAILED", fresh.pk: "QUEUED"}
+        )
+
+    def test_rows_counted_as_exported(self):
+        self.book(0, 1, [30])
+        self.book(1, 2, [30])
+        job = exports.create_job({})
+        rows = exports._rows
+
+        def booked_meanwhile(qs):
+            self.book(0, 1, [31])  # after run_job counted
+            yield from rows(qs)
+
+        with tempfile.TemporaryDirectory() as tmp, override_settings(
+            PDF_CACHE_DIR=Path(tmp), PDF_EXPORT_WORKERS=1
+        ), mock.patch.object(exports, "_rows", booked_meanwhile):
+            job = exports.run_job(job.pk)
+            self.assertTrue(exports.job_file(job).exists())
+        self.assertEqual((job.status, job.rows, job.chunks_done, job.chunks), ("DONE", 3, 1, 1))
+
+    def test_heartbeat_during_merge(self):
+        self.book(0, 2, [30])
+        job = exports.create_job({})
+        touched = threading.Event()
+        touch = exports._touch
+        merge_files = documents.merge_files
+
+        def slow_merge(paths, dest):
+            self.assertTrue(touched.wait(5))  # the job stays fresh while the merge runs
+            merge_files(paths, dest)
+
+        tmp = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(PDF_CACHE_DIR=Path(tmp), PDF_EXPORT_WORKERS=1))
+        # threads instead of processes, so the pool sees the slow merge
+        self.enterContext(mock.patch.object(documents, "process_pool", ThreadPoolExecutor))
+        self.enterContext(mock.patch.object(documents, "merge_files", slow_merge))
+        self.enterContext(mock.patch.object(exports, "HEARTBEAT", timedelta(seconds=0.01)))
+        self.enterContext(
+            mock.patch.object(exports, "_touch", side_effect=lambda job: (touch(job), touched.set()))
+        )
+        job = exports.run_job(job.pk)
+        self.assertEqual(job.status, "DONE")
+        self.assertTrue(exports.job_file(job).exists())
+
+    def test_download_pruned_file(self):
+        job = PdfExportJob.objects.create(status="DONE")
+        with tempfile.TemporaryDirectory() as tmp, override_settings(PDF_CACHE_DIR=Path(tmp)):
+            url = reverse("admin_export_job_download", args=[job.pk])
+            self.assertEqual(self.client.get(url).status_code, 404)
+            exports.job_dir(job).mkdir(parents=True)
+            exports.job_file(job).write_bytes(b"%PDF-1.4")
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(b"".join(response.streaming_content), b"%PDF-1.4")
+
+
+class CsvExportTests(SeatMapFixture, TestCase):
+    """The bookings CSV export streams the filtered bookings, optionally gzipped."""
+
+    def setUp(self):
+        super().setUp()
+        other = Train.objects.create(number="12934", name="Karnavati Express")
+        stations = list(Station.objects.order_by("pk"))
+        self.bookings = {}
+        for key, train, days, status in [
+            ("early", self.train, 0, "CONFIRMED"),
+            ("pending", self.train, 1, "PENDING"),
+            ("other", other, 1, "CONFIRMED"),
+            ("late", self.train, 2, "CANCELLED"),
+        ]:
+            self.bookings[key] = Booking.objects.create(
+                user=self.user, train=train, source=stations[0], destination=stations[-1],
+                date_of_journey=self.day + timedelta(days=days), berth_type=self.berth,
+                passengers_count=1, total_fare=Decimal("245.50"), status=status,
+            )
+        self.client.force_login(User.objects.create_user("csv", password="x", is_staff=True))
+
+    def export(self, **params):
+        response = self.client.get(reverse("admin_export_bookings_csv"), params)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content)
+
+    def exported(self, **params):
+        _, content = self.export(**params)
+        rows = list(csv.reader(content.decode().splitlines()))
+        self.assertEqual(rows[0][:3], ["ID", "User", "Train"])
+        names = {b.pk: key for key, b in self.bookings.items()}
+        return [names[int(row[0])] for row in rows[1:]]
+
+    def test_rows(self):
+        with mock.patch.object(views, "CSV_EXPORT_CHUNK", 3):
+            response, content = self.export()
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertIn('filename="bookings_all.csv"', response["Content-Disposition"])
+        rows = list(csv.reader(content.decode().splitlines()))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(
+            rows[1],
+            [str(self.bookings["early"].pk), "inventory", "19011 Gujarat Express", "ADI", "MMCT",
+             self.day.isoformat(), "1", "245.5", "CONFIRMED", str(self.bookings["early"].created_at)],
+        )
+
+    def test_gzip(self):
+        response, content = self.export(gzip="1", status="confirmed")
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertIn('filename="bookings_all.csv.gz"', response["Content-Disposition"])
+        _, plain = self.export(status="confirmed")
+        self.assertEqual(gzip.decompress(content), plain)
+
+    def test_filters(self):
+        day = self.day + timedelta(days=1)
+        self.assertEqual(self.exported(date=day.isoformat()), ["pending", "other"])
+        self.assertEqual(self.exported(**{"from": day.isoformat()}), ["pending", "other", "late"])
+        self.assertEqual(self.exported(to=day.isoformat()), ["early", "pending", "other"])
+        self.assertEqual(self.exported(train="12934"), ["other"])
+        self.assertEqual(self.exported(status="pending,cancelled"), ["pending", "late"])
+        self.assertEqual(self.exported(date="not-a-date", train="19011"), ["early", "pending", "late"])
+
+    def test_staff_only(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("admin_export_bookings_csv"))
+        self.assertEqual(response.status_code, 302)
+
+
+class ForecastTests(SeatMapFixture, TestCase):
+    """fit() saves a model version that current() serves."""
+
+    def setUp(self):
+        super().setUp()
+        self.today = timezone.localdate()
+        stops = list(RouteStop.objects.filter(train=self.train).order_by("sequence"))
+        self.src, self.dst = stops[0].station, stops[-1].station
+        # a full journey every day, both seats booked the day before departure
+        for ago in range(forecasting.HISTORY_DAYS):
+            journey = self.today - timedelta(days=ago)
+            booking = Booking.objects.create(
+                user=self.user, train=self.train, source=self.src, destination=self.dst,
+                date_of_journey=journey, berth_type=self.berth, passengers_count=2, status="CONFIRMED",
+            )
+            created = timezone.make_aware(datetime.combine(journey - timedelta(days=1), time(12)))
+            Booking.objects.filter(pk=booking.pk).update(created_at=created)
+            if ago:
+                DailyTrainAvailability.objects.create(
+                    train=self.train, berth_type=self.berth, date=journey, available_seats=0
+                )
+        # one of two seats sold three days out
+        DailyTrainAvailability.objects.create(
+            train=self.train, berth_type=self.berth, date=self.day, available_seats=1
+        )
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(FORECAST_DIR=directory))
+        self.enterContext(mock.patch.object(forecasting, "_loaded", None))
+
+    def test_fit_and_serve(self):
+        self.assertIsNone(forecasting.current())
+        summary = forecasting.fit(self.today)
+        self.assertEqual(
+            summary,
+            {
+                "version": 1,
+                "bookings": forecasting.HISTORY_DAYS,
+                "routes": 1,
+                "train_berths": 1,
+                "availability_rows": 1,
+                "sellouts": 1,
+            },
+        )
+
+        forecast = forecasting.current()
+        self.assertEqual(forecast.version, 1)
+        self.assertIs(forecasting.current(), forecast)  # loaded once
+        daily = forecast.daily(self.today)
+        self.assertEqual([day for day, _ in daily], [self.today + timedelta(days=i) for i in range(7)])
+        for _, predicted in daily:
+            self.assertAlmostEqual(predicted, 1.0, delta=0.2)  # one booking a day
+        self.assertAlmostEqual(forecast.route(self.src.pk, self.dst.pk, self.day), 1.0, delta=0.2)
+        self.assertAlmostEqual(forecast.train_berth(self.train.pk, self.berth.pk, self.day), 1.0, delta=0.2)
+        self.assertEqual(forecast.route(self.dst.pk, self.src.pk, self.day), 0.0)
+        self.assertEqual(
+            forecast.train_berth(self.train.pk, self.berth.pk, self.today + timedelta(days=forecasting.HORIZON)),
+            0.0,
+        )
+
+        # the last seat usually goes the day before departure
+        sellout = self.day - timedelta(days=1)
+        self.assertEqual(forecast.sellout(self.train.pk, self.berth.pk, self.day), sellout)
+        self.assertEqual(
+            forecast.upcoming_sellouts(), [(self.train.pk, self.berth.pk, self.day, sellout)]
+        )
+
+        self.assertEqual(forecasting.fit(self.today)["version"], 2)
+        self.assertEqual(forecasting.current().version, 2)
+
+
+class SnapshotTests(SeatMapFixture, TestCase):
+    """Analytics snapshots: partitions written in batches, incremental runs, format switch."""
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.enterContext(override_settings(SNAPSHOT_DIR=Path(tmp.name)))
+        self.enterContext(mock.patch.object(snapshots, "BATCH_ROWS", 2))  # several batches per partition
+
+    def test_snapshot(self):
+        first = [self.book(0, 1, [30]), self.book(0, 1, [40]), self.book(1, 2, [50])]
+        run = snapshots.take_snapshot()
+        self.assertEqual(run["months"], [f"{self.day:%Y-%m}"])
+        self.assertEqual(run["rows"]["booking"], 3)
+        self.assertEqual(run["rows"]["passenger"], 3)
+        bookings = snapshots.read_table("booking")
+        self.assertEqual(bookings.column("id").to_pylist(), [b.pk for b in first])
+        self.assertEqual(bookings.column("status").to_pylist(), ["CONFIRMED"] * 3)
+        self.assertEqual(sorted(snapshots.read_table("passenger").column("age").to_pylist()), [30, 40, 50])
+
+        # nothing changed since (the rows predate the run's overlap window): no month rewritten
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        Booking.objects.update(updated_at=an_hour_ago)
+        DailyTrainAvailability.objects.update(updated_at=an_hour_ago)
+        self.assertEqual(snapshots.take_snapshot()["months"], [])
+
+        Booking.objects.filter(pk=first[0].pk).update(status="CANCELLED", updated_at=timezone.now())
+        self.assertEqual(snapshots.take_snapshot()["rows"]["booking"], 3)
+        self.assertEqual(snapshots.read_table("booking").column("status").to_pylist()[0], "CANCELLED")
+
+        run = snapshots.take_snapshot(fmt="parquet")
+        self.assertTrue(run["full"])
+        self.assertEqual(snapshots.read_table("booking").num_rows, 3)
+        self.assertEqual(
+            [p.name for p in snapshots.snapshot_dir().glob("booking/*/data.*")], ["data.parquet"]
+        )
+
+
+class RunningDayTests(SeatMapFixture, TestCase):
+    """Search and booking skip trains on days they don't run."""
+
+    def setUp(self):
+        super().setUp()
+        caching.search_cache().clear()
+        self.train.running_days = Train.DAILY & ~(1 << self.day.weekday())
+        self.train.save()
+        self.src, self.dst = Station.objects.get(code="ADI"), Station.objects.get(code="MMCT")
+
+    def add_special_run(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            TrainRunException.objects.create(train=self.train, date=self.day, runs=True, note="special")
+
+    def found(self, day):
+        return [r["train"].number for r in search.find_trains(self.src, self.dst, day)]
+
+    def book_request(self):
+        self.client.force_login(self.user)
+        return self.client.post(
+            reverse("book_train", args=[self.train.pk]),
+            {
+                "source": "ADI",
+                "destination": "MMCT",
+                "date": self.day.isoformat(),
+                "berth_code": "SL",
+                "form-TOTAL_FORMS": "1",
+                "form-INITIAL_FORMS": "0",
+                "form-0-name": "Asha",
+                "form-0-age": "34",
+                "form-0-gender": "F",
+            },
+        )
+
+    def test_search(self):
+        self.assertEqual(self.found(self.day), [])
+        self.assertEqual(self.found(self.day + timedelta(days=1)), ["19011"])
+        self.add_special_run()
+        self.assertEqual(self.found(self.day), ["19011"])
+
+    def test_booking(self):
+        response = self.book_request()
+        self.assertRedirects(response, reverse("search_trains"), fetch_redirect_response=False)
+        self.assertFalse(Booking.objects.exists())
+        self.assertFalse(DailyTrainAvailability.objects.exists())
+
+        self.add_special_run()
+        response = self.book_request()
+        booking = Booking.objects.get()
+        self.assertRedirects(
+            response, reverse("booking_preview", args=[booking.pk]), fetch_redirect_response=False
+        )
+
+
+class LockWaitTests(SeatMapFixture, TransactionTestCase):
+    """The write lock wait is recorded when a seat map write begins the transaction."""
+
+    def setUp(self):
+        self.setUpTestData()
+        super().setUp()
+
+    def test_outermost_transaction_only(self):
+        with mock.patch.object(metrics.LOCK_WAIT_SECONDS, "observe") as observe:
+            self.hold(0, 1)
+            with transaction.atomic():  # e.g. cancel_booking around release_booking
+                self.hold(1, 2)
+        self.assertEqual(len(observe.call_args_list), 1)
+        self.assertEqual(observe.call_args.kwargs, {"op": "hold"})
+
+
+class PopulateAvailabilityTests(SeatMapFixture, TransactionTestCase):
+    """populate_daily_availability fills the running days of the window, once."""
+
+    def setUp(self):
+        self.setUpTestData()
+        super().setUp()
+        self.today = date.today()
+        self.idle_day = self.today + timedelta(days=2)
+        self.weekly = Train.objects.create(
+            number="22953", name="Gujarat Mail", running_days=Train.DAILY & ~(1 << self.idle_day.weekday())
+        )
+        TrainBerthAvailability.objects.create(train=self.weekly, berth_type=self.berth, capacity=4)
+
+    def populate(self, *args):
+        out = StringIO()
+        call_command("populate_daily_availability", "--days=7", *args, stdout=out)
+        return out.getvalue()
+
+    def rows(self):
+        return set(DailyTrainAvailability.objects.values_list("train_id", "date"))
+
+    def test_idempotent(self):
+        self.assertIn("13 rows inserted, 0 already present", self.populate())
+        self.assertNotIn((self.weekly.pk, self.idle_day), self.rows())
+        self.assertIn("0 rows inserted, 13 already present", self.populate())
+        self.assertEqual(DailyTrainAvailability.objects.count(), 13)
+
+    def test_counts_rows_inserted_meanwhile_as_present(self):
+        islice = populate_daily_availability.islice
+
+        def concurrent_run(rows, size):
+            # another run inserts a row after this one read what is present
+            if not DailyTrainAvailability.objects.exists():
+                DailyTrainAvailability.objects.create(
+                    train=self.train, berth_type=self.berth, date=self.today, available_seats=2
+                )
+            return islice(rows, size)
+
+        with mock.patch.object(populate_daily_availability, "islice", side_effect=concurrent_run):
+            self.assertIn("12 rows inserted, 1 already present", self.populate())
+
+    def test_rolling_window(self):
+        DailyTrainAvailability.objects.create(
+            train=self.train, berth_type=self.berth, date=self.today - timedelta(days=1), available_seats=2
+        )
+        self.assertIn("13 rows inserted, 0 already present, 1 rows dropped", self.populate("--drop-past"))
+        self.assertEqual(min(d for _, d in self.rows()), self.today)
+
+    def test_drop_not_running(self):
+        for train in (self.train, self.weekly):
+            DailyTrainAvailability.objects.create(
+                train=train, berth_type=self.berth, date=self.idle_day, available_seats=2
+            )
+        self.train.running_days = self.weekly.running_days
+        self.train.save()
+        stations = list(Station.objects.order_by("pk"))
+        Booking.objects.create(
+            user=self.user, train=self.weekly, source=stations[0], destination=stations[-1],
+            date_of_journey=self.idle_day, berth_type=self.berth, passengers_count=1,
+        )
+        self.assertIn("1 rows dropped", self.populate("--drop-not-running"))
+        # the booked row stays
+        self.assertEqual(
+            {t for t, d in self.rows() if d == self.idle_day}, {self.weekly.pk}
+        )
+
+    def test_workers(self):
+        # one shard at a time: the in-memory test database locks whole tables
+        # across connections instead of waiting for them
+        one_at_a_time = mock.patch.object(
+            populate_daily_availability, "ThreadPoolExecutor", lambda max_workers: ThreadPoolExecutor(1)
+        )
+        with one_at_a_time:
+            self.assertIn("13 rows inserted", self.populate("--workers=2", "--chunk-size=3"))
+            self.assertEqual(len(self.rows()), 13)
+            self.assertIn("0 rows inserted, 13 already present", self.populate("--workers=2"))
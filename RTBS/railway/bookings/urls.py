@@ -1,21 +1,57 @@
 # bookings/urls.py
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, views
+
+# read-heavy views have async twins for ASGI deployments (see bookings/async_views.py)
+read_views = {
+    'search_trains': views.search_trains,
+    'ticket_success': views.ticket_success,
+    'my_bookings': views.my_bookings,
+    'api_search': api.search,
+    'api_availability': api.availability,
+    'api_fare_quote': api.fare_quote,
+    'api_pnr_status': api.pnr_status,
+}
+if settings.ASYNC_VIEWS:
+    from . import async_views
+
+    read_views.update({
+        'search_trains': async_views.search_trains,
+        'ticket_success': async_views.ticket_success,
+        'my_bookings': async_views.my_bookings,
+        'api_search': async_views.api_search,
+        'api_availability': async_views.api_availability,
+        'api_fare_quote': async_views.api_fare_quote,
+        'api_pnr_status': async_views.api_pnr_status,
+    })
 
 urlpatterns = [
     path('', views.home, name='home'),
-    path('search/', views.search_trains, name='search_trains'),
+    path('search/', read_views['search_trains'], name='search_trains'),
     path('book/<int:train_id>/', views.book_train, name='book_train'),
     path('preview/<int:booking_id>/', views.booking_preview, name='booking_preview'),
     path('mock-pay/<int:booking_id>/', views.mock_pay, name='mock_pay'),
-    path('ticket/<int:booking_id>/', views.ticket_success, name='ticket_success'),
+    path('ticket/<int:booking_id>/', read_views['ticket_success'], name='ticket_success'),
     path('ticket/<int:booking_id>/download/', views.download_ticket, name='download_ticket'),
+    path('booking/<int:booking_id>/cancel/', views.cancel_booking, name='cancel_booking'),
     path('ticket/<int:booking_id>/download-txt/', views.download_ticket, name='download_ticket_txt'),
-    path('my-bookings/', views.my_bookings, name='my_bookings'),
+    path('my-bookings/', read_views['my_bookings'], name='my_bookings'),
     path('profile/', views.profile_view, name='profile'),
     path('register/', views.register, name='register'),
 
+    path('api/search/', read_views['api_search'], name='api_search'),
+    path('api/availability/', read_views['api_availability'], name='api_availability'),
+    path('api/fare/', read_views['api_fare_quote'], name='api_fare_quote'),
+    path('api/pnr/<int:pnr>/', read_views['api_pnr_status'], name='api_pnr_status'),
+
     path('admin-dashboard/', views.admin_dashboard, name='admin_dashboard'),
     path('admin-dashboard/export-bookings-csv/', views.export_bookings_csv, name='admin_export_bookings_csv'),
     path('admin-dashboard/export-bookings-pdf/', views.export_bookings_pdf, name='admin_export_bookings_pdf'),
+    path('admin-dashboard/exports/<int:job_id>/', views.export_job, name='admin_export_job'),
+    path('admin-dashboard/exports/<int:job_id>/download/', views.export_job_download, name='admin_export_job_download'),
+    path('admin-dashboard/analytics-snapshot/', views.analytics_snapshot, name='admin_analytics_snapshot'),
+    path('admin-dashboard/profiles/', views.request_profiles, name='admin_request_profiles'),
+    path('admin-dashboard/profiles/<str:name>/', views.request_profile_download, name='admin_request_profile_download'),
+    path('metrics/', views.prometheus_metrics, name='metrics'),
 ]
\ No newline at end of file
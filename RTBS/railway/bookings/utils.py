@@ -1,7 +1,10 @@
-
 from decimal import Decimal, ROUND_HALF_UP
 from django.conf import settings
 
+from .metrics import FARE_SECONDS
+
+
+@FARE_SECONDS.time(fn='calculate_fare')
 def calculate_fare(distance_km: int, price_per_km: Decimal, passengers: int):
     base_per = (Decimal(distance_km) * Decimal(price_per_km)).quantize(Decimal('0.01'), ROUND_HALF_UP)
     total_base = (base_per * passengers).quantize(Decimal('0.01'), ROUND_HALF_UP)
@@ -17,3 +20,50 @@ def calculate_fare(distance_km: int, price_per_km: Decimal, passengers: int):
         'convenience': convenience,
         'total': total
     }
+
+
+def _div_half_up(num: int, den: int) -> int:
+    # integer division rounded like Decimal ROUND_HALF_UP (num >= 0, den > 0)
+    q, r = divmod(num, den)
+    return q + 1 if 2 * r >= den else q
+
+
+def _paise(amount: int) -> Decimal:
+    return Decimal(amount).scaleb(-2)
+
+
+@FARE_SECONDS.time(fn='calculate_fares')
+def calculate_fares(pairs, passengers: int = 1):
+    """
+    Batch version of calculate_fare for a list of (distance_km, price_per_km) pairs.
+
+    Works in integer paise on exact fractions, so every value matches
+    calculate_fare (ROUND_HALF_UP to 0.01) while each distinct pair is only
+    computed once.
+    """
+    gst_n, gst_d = Decimal(settings.TAX_CONFIG['GST_PCT']).as_integer_ratio()
+    svc_n, svc_d = Decimal(settings.TAX_CONFIG['SERVICE_PCT']).as_integer_ratio()
+    fee_n, fee_d = Decimal(settings.TAX_CONFIG['CONVENIENCE_FEE']).as_integer_ratio()
+    convenience = _div_half_up(fee_n * 100, fee_d)
+
+    computed = {}
+    out = []
+    for distance_km, price_per_km in pairs:
+        key = (distance_km, price_per_km)
+        fare = computed.get(key)
+        if fare is None:
+            price_n, price_d = Decimal(price_per_km).as_integer_ratio()
+            base_per = _div_half_up(int(distance_km) * price_n * 100, price_d)
+            total_base = base_per * passengers
+            gst = _div_half_up(total_base * gst_n, gst_d * 100)
+            service = _div_half_up(total_base * svc_n, svc_d * 100)
+            fare = computed[key] = {
+                'base_per': _paise(base_per),
+                'total_base': _paise(total_base),
+                'gst': _paise(gst),
+                'service': _paise(service),
+                'convenience': _paise(convenience),
+                'total': _paise(total_base + gst + service + convenience),
+            }
+        out.append(fare)
+    return out
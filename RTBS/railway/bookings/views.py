@@ -1,24 +1,26 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
 from django.db import transaction
-from django.db.models import OuterRef, Subquery, F, Count, Sum
-from django.db.models.functions import TruncDate
+from django.db.models import F, Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.core.paginator import Paginator
 from django.utils import timezone
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.forms import formset_factory
-from django.http import HttpResponse
-from django.template.loader import render_to_string
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
 from django.core.serializers.json import DjangoJSONEncoder
+from django.core.exceptions import ImproperlyConfigured
 from django.contrib.auth import login, get_user_model
-from io import BytesIO
+from django.contrib.auth.views import redirect_to_login
+from django.conf import settings
 from datetime import date, timedelta
+from functools import partial
 import csv
-import io
+import hmac
 import json
-import pandas as pd
-import numpy as np
-from sklearn.linear_model import LinearRegression
-from xhtml2pdf import pisa  # type: ignore
+import os
+import zlib
 from .models import (
     Station,
     Train,
@@ -28,9 +30,20 @@ from .models import (
     Passenger,
     Payment,
     TrainBerthAvailability,
+    BerthType,
+    DailyBookingStats,
+    RouteBookingStats,
+    CustomerBookingStats,
+    BerthBookingStats,
+    PdfExportJob,
 )
 from .forms import PassengerForm, RegisterForm
 from .utils import calculate_fare
+from .search import find_trains
+from .routes import route_index
+from . import database, documents, exports, holds, inventory, metrics, rollups, schedule
+from .seats import seat_label
+from .middleware import query_budget
 from django.utils import timezone
 from django.db.models import Count
 
@@ -43,6 +56,8 @@ def home(request):
     return redirect("search_trains")
 
 
+@database.read_only
+@query_budget(queries=12)
 def search_trains(request):
     stations = Station.objects.order_by("name")
     results = []
@@ -79,54 +94,8 @@ def search_trains(request):
 
         src = get_object_or_404(Station, code=src_code)
         dst = get_object_or_404(Station, code=dst_code)
-        weekday = journey_date.weekday()
-
-        src_seq_qs = RouteStop.objects.filter(train=OuterRef("pk"), station=src).values(
-            "sequence"
-        )[:1]
-        dst_seq_qs = RouteStop.objects.filter(train=OuterRef("pk"), station=dst).values(
-            "sequence"
-        )[:1]
-
-        trains = (
-            Train.objects.annotate(
-                src_seq=Subquery(src_seq_qs), dst_seq=Subquery(dst_seq_qs)
-            )
-            .filter(src_seq__isnull=False, dst_seq__isnull=False)
-            .filter(src_seq__lt=F("dst_seq"))
-        )
 
-        for t in trains:
-            berth_info = []
-            for tb in t.berths.all():
-                try:
-                    dta = DailyTrainAvailability.objects.get(
-                        train=t, berth_type=tb.berth_type, date=journey_date
-                    )
-                    seats_left = dta.available_seats
-                except DailyTrainAvailability.DoesNotExist:
-                    seats_left = tb.capacity
-                try:
-                    src_rs = RouteStop.objects.get(train=t, station=src)
-                    dst_rs = RouteStop.objects.get(train=t, station=dst)
-                except RouteStop.DoesNotExist:
-                    continue
-                distance = dst_rs.distance - src_rs.distance
-                fare_calc = calculate_fare(
-                    distance_km=distance,
-                    price_per_km=tb.berth_type.price_per_km,
-                    passengers=1,
-                )
-                berth_info.append(
-                    {
-                        "berth": tb.berth_type,
-                        "seats_left": seats_left,
-                        "fare_per_passenger": fare_calc["base_per"],
-                        "fare_total_preview": fare_calc["total"],
-                    }
-                )
-            if berth_info:
-                results.append({"train": t, "berths": berth_info})
+        results = find_trains(src, dst, journey_date)
         if not results:
             messages.info(request, "No trains found for the selected route/date.")
 
@@ -143,6 +112,8 @@ def search_trains(request):
 
 
 @login_required
+@database.retry_on_busy
+@query_budget(queries=35)
 def book_train(request, train_id):
     from .models import DailyTrainAvailability, TrainBerthAvailability
 
@@ -175,7 +146,9 @@ def book_train(request, train_id):
 
         # find berth availability record on the train
         try:
-            tb = train.berths.get(berth_type__code=berth_code)
+            tb = train.berths.select_related("berth_type").get(
+                berth_type__code=berth_code
+            )
         except TrainBerthAvailability.DoesNotExist:
             messages.error(request, "Selected berth invalid for this train.")
             return redirect("search_trains")
@@ -228,73 +201,81 @@ def book_train(request, train_id):
                 },
             )
 
-        # lock availability and create booking
-        with transaction.atomic():
-            (
-                dta,
-                created,
-            ) = DailyTrainAvailability.objects.select_for_update().get_or_create(
-                train=train,
-                berth_type=tb.berth_type,
-                date=journey_date,
-                defaults={"available_seats": tb.capacity},
-            )
-            if dta.available_seats < num_passengers:
-                messages.error(
-                    request,
-                    f"Only {dta.available_seats} seats available for {tb.berth_type.code} on {journey_date}.",
-                )
-                return render(
-                    request,
-                    "bookings/book.html",
-                    {
-                        "train": train,
-                        "formset": formset,
-                        "source": src_code,
-                        "destination": dst_code,
-                        "date": date_str,
-                        "berth_code": berth_code,
-                    },
-                )
-
-            # compute distance, fare and create Booking
-            try:
-                src_rs = RouteStop.objects.get(train=train, station=src)
-                dst_rs = RouteStop.objects.get(train=train, station=dst)
-            except RouteStop.DoesNotExist:
-                messages.error(request, "Train does not stop at the selected stations.")
-                return redirect("search_trains")
-
-            distance = dst_rs.distance - src_rs.distance
-            fare = calculate_fare(
-                distance_km=distance,
-                price_per_km=tb.berth_type.price_per_km,
-                passengers=num_passengers,
-            )
-
-            booking = Booking.objects.create(
-                user=request.user,
-                train=train,
-                source=src,
-                destination=dst,
-                date_of_journey=journey_date,
-                berth_type=tb.berth_type,
-                passengers_count=num_passengers,
-                total_fare=fare["total"],
-                status="PENDING",
-            )
+        match = route_index.match(train.pk, src.pk, dst.pk)
+        if match is None:
+            messages.error(request, "Train does not stop at the selected stations.")
+            return redirect("search_trains")
+        if not schedule.runs_on(train.pk, journey_date):
+            messages.error(request, f"Train {train.number} does not run on {journey_date}.")
+            return redirect("search_trains")
+        seg_from, seg_to = inventory.segment_span(match)
 
-            # create passengers
-            for p in passengers_data:
-                Passenger.objects.create(
-                    booking=booking, name=p["name"], age=p["age"], gender=p["gender"]
-                )
+        # everything that does not need the seat map is prepared up front
+        fare = calculate_fare(
+            distance_km=match.distance,
+            price_per_km=tb.berth_type.price_per_km,
+            passengers=num_passengers,
+        )
+        booking = Booking(
+            user=request.user,
+            train=train,
+            source=src,
+            destination=dst,
+            date_of_journey=journey_date,
+            berth_type=tb.berth_type,
+            passengers_count=num_passengers,
+            total_fare=fare["total"],
+            status="PENDING",
+            seg_from=seg_from,
+            seg_to=seg_to,
+        )
+        passengers = [
+            Passenger(name=p["name"], age=p["age"], gender=p["gender"])
+            for p in passengers_data
+        ]
 
-            # reduce availability (hold seats until payment)
-            dta.available_seats -= num_passengers
-            dta.save()
+        def save_booking(seats):
+            booking.save()
+            for p, seat in zip(passengers, seats):
+                p.booking = booking
+                p.seat_index = seat
+            Passenger.objects.bulk_create(passengers)
 
-        return redirect("booking_preview", booking_id=booking.pk)
+        # hold seats until payment: one conditional UPDATE + two INSERTs
+        try:
+            inventory.hold_seats(
+                train.pk,
+                tb.berth_type,
+                journey_date,
+                tb.capacity,
+                seg_from,
+                seg_to,
+                [p["age"] for p in passengers_data],
+                save_booking,
+            )
+        except inventory.SeatsUnavailable as exc:
+            messages.error(
+                request,
+                f"Only {exc.available} seats available for {tb.berth_type.code} on {journey_date}.",
+            )
+        except inventory.InventoryBusy:
+            messages.error(
+                request, "Seats are being booked heavily right now. Please try again."
+            )
+        else:
+            return redirect("booking_preview", booking_id=booking.pk)
+        return render(
+            request,
+            "bookings/book.html",
+            {
+                "train": train,
+                "formset": formset,
+                "source": src_code,
+                "destination": dst_code,
+                "date": date_str,
+                "berth_code": berth_code,
+            },
+        )
 
     src = request.GET.get("source") or None
     dst = request.GET.get("destination") or None
@@ -320,49 +301,94 @@ def book_train(request, train_id):
 @login_required
 def booking_preview(request, booking_id):
     booking = get_object_or_404(Booking, pk=booking_id, user=request.user)
-    return render(request, "bookings/preview.html", {"booking": booking})
+    return render(
+        request,
+        "bookings/preview.html",
+        {"booking": booking, "hold_deadline": holds.hold_deadline(booking)},
+    )
 
 
 @login_required
+@database.retry_on_busy
+@query_budget(queries=25)
 def mock_pay(request, booking_id):
     booking = get_object_or_404(Booking, pk=booking_id, user=request.user)
     if booking.status != "PENDING":
         messages.info(request, "Booking already processed.")
         return redirect("my_bookings")
+    if holds.is_expired(booking):
+        try:
+            holds.expire_booking(booking)
+        except inventory.InventoryBusy:
+            pass  # still PENDING; the expire_holds worker releases it later
+        messages.warning(
+            request, "Seat hold expired before payment. Please book again."
+        )
+        return redirect("my_bookings")
     with transaction.atomic():
+        # only one confirmation can move the booking out of PENDING
+        if not Booking.objects.filter(pk=booking.pk, status="PENDING").update(
+            status="CONFIRMED", updated_at=timezone.now()
+        ):
+            messages.info(request, "Booking already processed.")
+            return redirect("my_bookings")
+        rollups.status_changed(booking, "PENDING", "CONFIRMED")
         payment = Payment.objects.create(
             booking=booking,
             amount=booking.total_fare,
             status="SUCCESS",
             txn_id=f"MOCK{booking.pk}",
         )
-        booking.status = "CONFIRMED"
-        booking.save()
-        existing_passengers = Passenger.objects.filter(
-            booking__train=booking.train,
-            booking__date_of_journey=booking.date_of_journey,
-            booking__berth_type=booking.berth_type,
-        ).count()
-        start_idx = existing_passengers - booking.passengers_count + 1
-        if start_idx < 1:
-            start_idx = 1
+        # seats were held in the seat map by book_train
         prefix = booking.berth_type.code
-        i = start_idx
-        for p in booking.passengers.all():
-            p.seat_number = f"{prefix}-{i:03d}"
-            p.save()
-            i += 1
+        passengers = list(booking.passengers.all())
+        for p in passengers:
+            if p.seat_index is not None:
+                p.seat_number = seat_label(prefix, p.seat_index)
+        Passenger.objects.bulk_update(passengers, ["seat_number"])
+        # ticket PDF is rendered in the background, ready for download
+        transaction.on_commit(partial(documents.prerender_ticket, booking.pk))
     messages.success(request, "Payment successful. Booking confirmed.")
     return redirect("ticket_success", booking_id=booking.pk)
 
 
 @login_required
+@query_budget(queries=10)
 def ticket_success(request, booking_id):
     booking = get_object_or_404(Booking, pk=booking_id, user=request.user)
     return render(request, "bookings/ticket.html", {"booking": booking})
 
 
 @login_required
+@database.retry_on_busy
+@query_budget(queries=25)
+def cancel_booking(request, booking_id):
+    booking = get_object_or_404(Booking, pk=booking_id, user=request.user)
+    if request.method != "POST":
+        return redirect("my_bookings")
+    try:
+        with transaction.atomic():
+            # conditional on the status we loaded, so the rollups know what it was
+            if booking.status not in ("PENDING", "CONFIRMED") or not Booking.objects.filter(
+                pk=booking.pk, status=booking.status
+            ).update(status="CANCELLED", updated_at=timezone.now()):
+                messages.info(request, "Booking already cancelled or being processed.")
+                return redirect("my_bookings")
+            rollups.status_changed(booking, booking.status, "CANCELLED")
+            inventory.release_booking(booking)
+    except inventory.InventoryBusy:
+        # the status change was rolled back with the release
+        messages.error(
+            request, "Seats are being booked heavily right now. Please try again."
+        )
+        return redirect("my_bookings")
+    messages.success(request, "Booking cancelled. Seats have been released.")
+    return redirect("my_bookings")
+
+
+@login_required
+@database.read_only
+@query_budget(queries=6)
 def my_bookings(request):
     bookings = (
         request.user.bookings.select_related(
@@ -409,45 +435,23 @@ def register(request):
     return render(request, "bookings/register.html", {"form": form})
 
 
+@login_required
 def download_ticket(request, booking_id):
-    booking = get_object_or_404(Booking, pk=booking_id, user=request.user)
-    passengers = booking.passengers.all()
-
-    # Prepare ticket context
-    context = {
-        "pnr": booking.pk,
-        "booking_date": booking.created_at.strftime("%d-%m-%Y"),
-        "train_number": booking.train.number,
-        "train_name": booking.train.name,
-        "source": f"{booking.source.name} ({booking.source.code})",
-        "destination": f"{booking.destination.name} ({booking.destination.code})",
-        "date_of_journey": booking.date_of_journey.strftime("%d-%m-%Y"),
-        "departure_time": (
-            booking.train.stops.filter(station=booking.source)
-            .first()
-            .departure.strftime("%H:%M")
-            if booking.train.stops.filter(station=booking.source).exists()
-            else "N/A"
-        ),
-        "class_name": booking.berth_type.name,
-        "berth_code": booking.berth_type.code,
-        "passengers": passengers,
-        "total_fare": booking.total_fare,
-        "status": booking.status,
-    }
-
-    html = render_to_string("bookings/ticket_template.html", context)
-
-    # Generate PDF
-    response = HttpResponse(content_type="application/pdf")
-    response["Content-Disposition"] = f'attachment; filename="ticket_{booking.pk}.pdf"'
-    pisa_status = pisa.CreatePDF(
-        io.BytesIO(html.encode("utf-8")), dest=response, encoding="utf-8"
+    booking = get_object_or_404(
+        Booking.objects.select_related("train", "source", "destination", "berth_type"),
+        pk=booking_id,
+        user=request.user,
     )
-
-    if pisa_status.err:
+    # usually rendered in the background when the payment went through
+    pdf = documents.ticket_pdf(booking)
+    if pdf is None:
         return HttpResponse("Error generating ticket", status=500)
-    return response
+    return FileResponse(
+        pdf,
+        as_attachment=True,
+        filename=f"ticket_{booking.pk}.pdf",
+        content_type="application/pdf",
+    )
 
 
 # Allow only staff/admin users to access
@@ -455,149 +459,171 @@ def staff_required(view_func):
     return user_passes_test(lambda u: u.is_staff)(view_func)
 
 
+# sort keys accepted by the dashboard train table (prefix "-" for descending)
+TRAIN_PANEL_SORTS = {
+    "number": "number",
+    "name": "name",
+    "stops": "stops_count",
+    "available": "total_available",
+    "capacity": "total_capacity",
+}
+TRAIN_PANEL_PAGE_SIZE = 25
+
+
+def _train_availability_page(sel_date, sort, page):
+    """
+    One page of the dashboard train table: stops, seats left on sel_date and
+    capacity per train running on sel_date. Each train row is summed by
+    correlated subqueries in a single SELECT (berths without an availability
+    row count as fully free), so a page costs one COUNT plus one SELECT however
+    many trains there are.
+    """
+    sort = sort if (sort or "").lstrip("-") in TRAIN_PANEL_SORTS else "number"
+    field = TRAIN_PANEL_SORTS[sort.lstrip("-")]
+
+    def per_train(qs, total):
+        return Coalesce(
+            Subquery(
+                qs.filter(train=OuterRef("pk"))
+                .values("train")
+                .annotate(total=total)
+                .values("total")
+            ),
+            0,
+        )
+
+    seats_left = DailyTrainAvailability.objects.filter(
+        train=OuterRef("train"), berth_type=OuterRef("berth_type"), date=sel_date
+    ).values("available_seats")[:1]
+    trains = (
+        schedule.running_on(Train.objects.all(), sel_date)
+        .annotate(
+            stops_count=per_train(RouteStop.objects.order_by(), Count("pk")),
+            total_capacity=per_train(
+                TrainBerthAvailability.objects.all(), Sum("capacity")
+            ),
+            total_available=per_train(
+                TrainBerthAvailability.objects.annotate(
+                    left=Coalesce(Subquery(seats_left), F("capacity"))
+                ),
+                Sum("left"),
+            ),
+        )
+        .order_by(("-" if sort.startswith("-") else "") + field, "pk")
+        .values("number", "name", "stops_count", "total_available", "total_capacity")
+    )
+    return Paginator(trains, TRAIN_PANEL_PAGE_SIZE).get_page(page), sort
+
+
 @staff_required
+@database.read_only
+@query_budget(queries=16)
 def admin_dashboard(request):
 
     # 1) selected date (safe fallback)
     date_str = request.GET.get("date")
     try:
-        sel_date = pd.to_datetime(date_str).date() if date_str else date.today()
+        sel_date = date.fromisoformat(date_str) if date_str else date.today()
     except Exception:
         sel_date = date.today()
 
-    # 2) trains + availability for selected date
-    trains = Train.objects.prefetch_related("berths", "stops").order_by("number")
-    trains_data = []
-    for t in trains:
-        total_capacity = 0
-        total_available = 0
-        for tb in t.berths.all():
-            cap = tb.capacity or 0
-            total_capacity += cap
-            try:
-                dta = DailyTrainAvailability.objects.get(
-                    train=t, berth_type=tb.berth_type, date=sel_date
-                )
-                total_available += dta.available_seats
-            except DailyTrainAvailability.DoesNotExist:
-                total_available += cap
-        trains_data.append(
-            {
-                "number": t.number,
-                "name": t.name,
-                "stops_count": t.stops.count(),
-                "total_available": total_available,
-                "total_capacity": total_capacity,
-            }
-        )
+    # 2) trains + availability for selected date, one page at a time
+    trains_page, trains_sort = _train_availability_page(
+        sel_date, request.GET.get("sort"), request.GET.get("page")
+    )
 
-    # 3) bookings time-series (last 30 days)
+    # 3) bookings time-series (last 30 days), from the rollups (bookings/rollups.py)
     start_date = date.today() - timedelta(days=30)
-    bookings_qs = Booking.objects.filter(created_at__gte=start_date).order_by(
-        "created_at"
-    )
-    bookings_by_date = (
-        bookings_qs.annotate(day=TruncDate("created_at"))
-        .values("day")
-        .annotate(count=Count("pk"), revenue=Sum("total_fare"))
-        .order_by("day")
-    )
+    bookings_by_date = DailyBookingStats.objects.filter(
+        day__gte=start_date, bookings__gt=0
+    ).order_by("day")
 
-    labels_dates = [b["day"].isoformat() for b in bookings_by_date]
-    counts_dates = [b["count"] for b in bookings_by_date]
-    revenue_dates = [float(b["revenue"] or 0) for b in bookings_by_date]
+    labels_dates = [b.day.isoformat() for b in bookings_by_date]
+    counts_dates = [b.bookings for b in bookings_by_date]
+    revenue_dates = [float(b.revenue) for b in bookings_by_date]
 
     # 4) revenue by route (top 5)
-    revenue_by_route_qs = (
-        Booking.objects.values("source__code", "destination__code")
-        .annotate(total_revenue=Sum("total_fare"), bookings=Count("pk"))
-        .order_by("-total_revenue")[:5]
-    )
+    revenue_by_route_qs = RouteBookingStats.objects.values(
+        "source__code", "destination__code", "revenue", "bookings"
+    ).order_by("-revenue")[:5]
     revenue_by_route = [
         {
             "route": f"{r['source__code']} → {r['destination__code']}",
-            "revenue": float(r["total_revenue"] or 0),
+            "revenue": float(r["revenue"]),
             "bookings": r["bookings"],
         }
         for r in revenue_by_route_qs
     ]
 
     # 5) top customers (by bookings)
-    top_customers_qs = (
-        Booking.objects.values("user__username")
-        .annotate(bookings=Count("pk"), revenue=Sum("total_fare"))
-        .order_by("-bookings")[:5]
-    )
+    top_customers_qs = CustomerBookingStats.objects.values(
+        "user__username", "bookings", "revenue"
+    ).order_by("-bookings")[:5]
     top_customers = [
         {
             "username": t["user__username"],
             "bookings": t["bookings"],
-            "revenue": float(t["revenue"] or 0),
+            "revenue": float(t["revenue"]),
         }
         for t in top_customers_qs
     ]
 
     # 6) berth distribution
-    berth_qs = Booking.objects.values("berth_type__name").annotate(count=Count("pk"))
+    berth_qs = BerthBookingStats.objects.filter(bookings__gt=0).values(
+        "berth_type__name", "bookings"
+    )
     berth_stats = [
-        {"berth": b["berth_type__name"] or "—", "count": b["count"]} for b in berth_qs
+        {"berth": b["berth_type__name"] or "—", "count": b["bookings"]}
+        for b in berth_qs
     ]
 
-    # --- 7) Simple 7-day forecast ---
-    forecast_labels, forecast_values = [], []
-
+    # 7) 7-day forecast and upcoming sell-outs, precomputed by fit_forecasts
     today = timezone.localdate()
 
     # Future bookings count per date
     future_bookings_dict = dict(
-        Booking.objects.filter(created_at__date__gte=today)
-        .values_list("created_at__date")
-        .annotate(total=Count("id"))
+        DailyBookingStats.objects.filter(day__gte=today).values_list("day", "bookings")
     )
 
-    if len(counts_dates) >= 3:
-        # Build daily history
-        df = pd.DataFrame({"date": pd.to_datetime(labels_dates), "count": counts_dates})
-        df = df.set_index("date").resample("D").sum().fillna(0)
-
-        epoch = pd.Timestamp("1970-01-01")
-        df["daynum"] = (df.index - epoch).days
-        X, y = df[["daynum"]], df["count"]
-
-        # Fit regression
-        model = LinearRegression().fit(X, y)
-
-        # Predict next 7 days
-        last_date = df.index[-1]
-        future_dates = [last_date + pd.Timedelta(days=i) for i in range(1, 8)]
-        X_future = np.array([(d - epoch).days for d in future_dates]).reshape(-1, 1)
-        forecast_raw = model.predict(X_future)
-        forecast_raw = np.clip(forecast_raw, 0, None)  # no negatives
-
-        for i, d in enumerate(future_dates):
-            date_only = d.date()
-            pred = forecast_raw[i]
-
-            # Weekend boost
-            if d.weekday() in [5, 6]:  # Sat/Sun
-                pred *= 1.25
+    from . import forecasting  # numpy loads on first use
 
+    forecast = forecasting.current()
+    forecast_labels, forecast_values, sellouts = [], [], []
+    if forecast is not None:
+        for day, pred in forecast.daily(today):
             # Ensure prediction > already booked
-            already_booked = future_bookings_dict.get(date_only, 0)
+            already_booked = future_bookings_dict.get(day, 0)
             if pred <= already_booked:
                 pred = already_booked + 1
-
-            forecast_labels.append(date_only.isoformat())
+            forecast_labels.append(day.isoformat())
             forecast_values.append(round(pred, 2))
 
-    # 8) recent users
+        upcoming = forecast.upcoming_sellouts(limit=8)
+        trains = Train.objects.in_bulk({t for t, _, _, _ in upcoming})
+        berths = BerthType.objects.in_bulk({b for _, b, _, _ in upcoming})
+        sellouts = [
+            {
+                "train": trains.get(t),
+                "berth": berths.get(b),
+                "date": day,
+                "sellout": sellout,
+            }
+            for t, b, day, sellout in upcoming
+        ]
+
+    # 8) seat holds
+    hold_stats = holds.hold_metrics()
+
+    # 9) recent users
     User = get_user_model()
     users_qs = User.objects.order_by("-date_joined")[:20]
 
     # prepare context (chart data serialized to JSON strings)
     context = {
         "sel_date": sel_date.isoformat(),
-        "trains_data": trains_data,
+        "trains_data": trains_page.object_list,
+        "trains_page": trains_page,
+        "trains_sort": trains_sort,
         "chart_labels_dates": json.dumps(labels_dates, cls=DjangoJSONEncoder),
         "chart_counts_dates": json.dumps(counts_dates),
         "chart_revenue_dates": json.dumps(revenue_dates),
@@ -607,30 +633,27 @@ def admin_dashboard(request):
         "forecast_labels": json.dumps(forecast_labels),
         "forecast_values": json.dumps(forecast_values),
         "users": users_qs,
+        "hold_stats": hold_stats,
+        "sellouts": sellouts,
+        "forecast_version": forecast.version if forecast else None,
     }
 
     return render(request, "bookings/admin_dashboard.html", context)
 
 
-@staff_required
-def export_bookings_csv(request):
-    """Export bookings as CSV."""
-    date_str = request.GET.get("date")
-    qs = Booking.objects.select_related(
-        "user", "train", "source", "destination", "berth_type"
-    )
-    if date_str:
-        try:
-            sel_date = date.fromisoformat(date_str)
-            qs = qs.filter(date_of_journey=sel_date)
-        except:
-            pass
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = (
-        f'attachment; filename="bookings_{date_str or "all"}.csv"'
-    )
-    writer = csv.writer(response)
-    writer.writerow(
+class _Echo:
+    """csv.writer target that hands back each written line."""
+
+    def write(self, value):
+        return value
+
+
+CSV_EXPORT_CHUNK = 2000
+
+
+def _csv_lines(qs):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(
         [
             "ID",
             "User",
@@ -644,68 +667,159 @@ def export_bookings_csv(request):
             "Created",
         ]
     )
-    for b in qs:
-        writer.writerow(
-            [
-                b.pk,
-                b.user.username if b.user else "",
-                f"{b.train.number} {b.train.name}" if b.train else "",
-                b.source.code if b.source else "",
-                b.destination.code if b.destination else "",
-                b.date_of_journey,
-                b.passengers_count,
-                float(b.total_fare or 0),
-                b.status,
-                b.created_at,
-            ]
+    rows = qs.values_list(
+        "pk",
+        "user__username",
+        "train__number",
+        "train__name",
+        "source__code",
+        "destination__code",
+        "date_of_journey",
+        "passengers_count",
+        "total_fare",
+        "status",
+        "created_at",
+    ).iterator(chunk_size=CSV_EXPORT_CHUNK)
+    batch = []
+    for pk, user, number, name, src, dst, day, count, fare, status, created in rows:
+        batch.append(
+            writer.writerow(
+                [
+                    pk,
+                    user,
+                    f"{number} {name}",
+                    src,
+                    dst,
+                    day,
+                    count,
+                    float(fare or 0),
+                    status,
+                    created,
+                ]
+            )
+        )
+        if len(batch) == CSV_EXPORT_CHUNK:
+            yield "".join(batch)
+            batch = []
+    if batch:
+        yield "".join(batch)
+
+
+def _gzip_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for chunk in chunks:
+        if data := compressor.compress(chunk.encode("utf-8")):
+            yield data
+    yield compressor.flush()
+
+
+@staff_required
+def export_bookings_csv(request):
+    """
+    Export bookings as CSV, streamed: rows are read CSV_EXPORT_CHUNK at a time as tuples
+    and written out as they come, so memory stays flat however many bookings
+    match. ?gzip=1 returns a .csv.gz compressed on the fly.
+    """
+    date_str = request.GET.get("date")
+    qs = exports.filter_bookings(dict(request.GET.lists()), Booking.objects.order_by("pk"))
+    filename = f"bookings_{date_str or 'all'}.csv"
+    lines = _csv_lines(qs)
+    if request.GET.get("gzip") == "1":
+        response = StreamingHttpResponse(
+            _gzip_stream(lines), content_type="application/gzip"
         )
+        filename += ".gz"
+    else:
+        response = StreamingHttpResponse(lines, content_type="text/csv")
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
     return response
 
 
 @staff_required
+@require_POST
 def export_bookings_pdf(request):
-    date_str = request.GET.get("date")
-    qs = Booking.objects.select_related(
-        "user", "train", "source", "destination", "berth_type"
+    """Start a background PDF export of the filtered bookings (POSTed filters) and show its progress."""
+    exports.fail_stale_jobs()
+    exports.prune_jobs()
+    job = exports.create_job(dict(request.POST.lists()), user=request.user)
+    exports.start_job(job)
+    return redirect("admin_export_job", job_id=job.pk)
+
+
+@staff_required
+def export_job(request, job_id):
+    exports.fail_stale_jobs()
+    job = get_object_or_404(PdfExportJob, pk=job_id)
+    return render(request, "bookings/export_job.html", {"job": job})
+
+
+@staff_required
+def export_job_download(request, job_id):
+    job = get_object_or_404(PdfExportJob, pk=job_id, status="DONE")
+    try:
+        pdf = open(exports.job_file(job), "rb")
+    except FileNotFoundError:
+        raise Http404("The export file has been deleted.")  # pruned meanwhile
+    return FileResponse(
+        pdf,
+        as_attachment=True,
+        filename=f"bookings_export_{job.pk}.pdf",
+        content_type="application/pdf",
     )
-    if date_str:
+
+
+@staff_required
+def analytics_snapshot(request):
+    """GET: snapshot manifest. POST: bring the snapshot up to date (?full=1 rewrites it)."""
+    from . import snapshots
+
+    if request.method == "POST":
         try:
-            sel_date = date.fromisoformat(date_str)
-            qs = qs.filter(date_of_journey=sel_date)
-        except:
-            pass
-    bookings = []
-    for b in qs[:500]:
-        bookings.append(
-            {
-                "id": b.pk,
-                "user": b.user.username if b.user else "",
-                "train": f"{b.train.number} {b.train.name}" if b.train else "",
-                "source": b.source.code if b.source else "",
-                "destination": b.destination.code if b.destination else "",
-                "date_of_journey": b.date_of_journey,
-                "passengers": b.passengers_count,
-                "fare": float(b.total_fare or 0),
-                "status": b.status,
-                "created_at": b.created_at,
-            }
-        )
-    pdf_bytes, err = _render_pdf_from_template(
-        "bookings/admin_bookings_pdf.html", {"bookings": bookings}
-    )
-    if err:
-        return HttpResponse("Error generating PDF", status=500)
-    response = HttpResponse(pdf_bytes, content_type="application/pdf")
-    response["Content-Disposition"] = (
-        f'attachment; filename="bookings_{date_str or "all"}.pdf"'
+            run = snapshots.take_snapshot(full=request.POST.get("full") == "1")
+        except ImproperlyConfigured as exc:
+            return JsonResponse({"error": str(exc)}, status=501)
+        return JsonResponse(run)
+    return JsonResponse(snapshots.read_manifest())
+
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def prometheus_metrics(request):
+    """
+    Metrics of this worker process in the Prometheus text format
+    (bookings/metrics.py). Staff only; scrapers send
+    "Authorization: Bearer <METRICS_TOKEN>" instead of a session.
+    """
+    token = settings.METRICS_TOKEN
+    # bytes: compare_digest rejects str with non-ASCII characters
+    authorization = request.headers.get("Authorization", "").encode()
+    if not (token and hmac.compare_digest(authorization, f"Bearer {token}".encode())):
+        if not is_admin(request.user):
+            return redirect_to_login(request.get_full_path())
+    return HttpResponse(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+@staff_required
+def request_profiles(request):
+    """Hot frames and queries per view over the requests this worker profiled; POST clears them."""
+    from . import profiling
+
+    if request.method == "POST":
+        profiling.reset()
+        return redirect("admin_request_profiles")
+    return render(
+        request,
+        "bookings/profiles.html",
+        {"views": profiling.summaries(), "files": profiling.recent_files(), "pid": os.getpid()},
     )
-    return response
 
 
-def _render_pdf_from_template(template_src, context_dict):
-    html = render_to_string(template_src, context_dict)
-    result = BytesIO()
-    pdf_status = pisa.CreatePDF(html, dest=result)
-    if pdf_status.err:
-        return None, pdf_status.err
-    return result.getvalue(), None
+@staff_required
+def request_profile_download(request, name):
+    from . import profiling
+
+    path = profiling.profile_dir() / name
+    if os.path.basename(name) != name or not path.is_file():
+        raise Http404("No such profile.")
+    return FileResponse(open(path, "rb"), as_attachment=True, filename=name)
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -20,10 +21,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'bookings.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'bookings.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -50,10 +53,86 @@ WSGI_APPLICATION = 'railway.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('RAILWAY_DB_PATH', BASE_DIR / 'db.sqlite3'),
     }
 }
 
+# SQLite tuned for concurrent workers (bookings/database.py): WAL journal,
+# writers queueing for the lock for up to 20s, and read-only views reading
+# through "replica" connections. Opt-in with RAILWAY_SQLITE_TUNED=1 for
+# deployments: WAL mode is written into the database file, so by default the
+# checked-in db.sqlite3 keeps SQLite's defaults (compare both with
+# benchmarks/booking_concurrency.py).
+SQLITE_TUNED = os.environ.get('RAILWAY_SQLITE_TUNED', '0') == '1'
+SQLITE_PRAGMAS = (
+    'PRAGMA synchronous=NORMAL; PRAGMA mmap_size=268435456; '
+    'PRAGMA cache_size=-65536; PRAGMA temp_store=MEMORY'
+)
+if SQLITE_TUNED:
+    DATABASES['default']['OPTIONS'] = {
+        'init_command': 'PRAGMA journal_mode=WAL; ' + SQLITE_PRAGMAS,
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': 20,
+    }
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        # read_uncommitted only matters for shared-cache databases: the in-memory
+        # test database, where the mirror must see the TestCase's transaction
+        'OPTIONS': {
+            'init_command': 'PRAGMA query_only=ON; PRAGMA read_uncommitted=ON; ' + SQLITE_PRAGMAS,
+            'timeout': 20,
+        },
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['bookings.database.ReadReplicaRouter']
+
+# serve the async versions of the read-heavy views (bookings/async_views.py);
+# railway/asgi.py turns this on, WSGI deployments keep the sync views
+ASYNC_VIEWS = os.environ.get('RAILWAY_ASYNC_VIEWS') == '1'
+
+# persistent connections, health-checked before reuse. Seconds per alias from
+# RAILWAY_CONN_MAX_AGE_<ALIAS>, else RAILWAY_CONN_MAX_AGE ("none": unlimited).
+# The default is 0 (a connection per request) under ASGI, where connections
+# live in executor threads, and 60 otherwise.
+for _alias, _db in DATABASES.items():
+    _age = os.environ.get(
+        f'RAILWAY_CONN_MAX_AGE_{_alias.upper()}',
+        os.environ.get('RAILWAY_CONN_MAX_AGE', '0' if ASYNC_VIEWS else '60'),
+    )
+    _db['CONN_MAX_AGE'] = None if _age.lower() == 'none' else int(_age)
+    _db['CONN_HEALTH_CHECKS'] = True
+
+# per-request query budget (bookings/middleware.py): the default, overrides by
+# URL name (views can also set theirs with @query_budget), and whether going
+# over raises instead of logging (the tests turn it on)
+QUERY_BUDGET = {'queries': 50, 'time_ms': 1000}
+QUERY_BUDGETS = {}
+QUERY_BUDGET_RAISE = False
+
+# "search" holds search results (bookings/caching.py). Local-memory caches are
+# LRU per process; set SEARCH_CACHE_DIR to share one file-based cache instead.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'railway-default',
+    },
+    'search': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'railway-search',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+if os.environ.get('SEARCH_CACHE_DIR'):
+    CACHES['search'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ['SEARCH_CACHE_DIR'],
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+
+# seconds to keep cached route/fare search results and seat availability snapshots
+SEARCH_CACHE_TTL = 60 * 60
+SEARCH_AVAILABILITY_TTL = 30
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -102,3 +181,34 @@ TAX_CONFIG = {
 LOGOUT_REDIRECT_URL = '/'
 LOGIN_REDIRECT_URL = '/'
 
+
+# seconds a PENDING booking keeps its seats before `expire_holds` releases them
+SEAT_HOLD_TTL = 15 * 60
+
+# seconds before the in-memory route index (bookings/routes.py) is rebuilt from RouteStop
+ROUTE_INDEX_TTL = 300
+
+# rendered ticket / export PDFs (bookings/documents.py), named by a hash of their HTML
+PDF_CACHE_DIR = Path(os.environ.get('PDF_CACHE_DIR', BASE_DIR / 'pdf_cache'))
+# xhtml2pdf processes per web worker; 0 renders in the request instead
+PDF_WORKERS = 2
+# bulk bookings PDF export (bookings/exports.py): rows per rendered chunk, and
+# render processes per export (None: one per CPU)
+PDF_EXPORT_CHUNK_ROWS = 500
+PDF_EXPORT_WORKERS = None
+
+# columnar analytics snapshot (bookings/snapshots.py, needs pyarrow)
+SNAPSHOT_DIR = Path(os.environ.get('SNAPSHOT_DIR', BASE_DIR / 'snapshots'))
+# versioned demand forecasts written by `manage.py fit_forecasts` (bookings/forecasting.py)
+FORECAST_DIR = Path(os.environ.get('FORECAST_DIR', BASE_DIR / 'forecasts'))
+
+# /metrics/ (bookings/metrics.py) is for staff; a scraper sends this bearer token instead
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# staff can profile a request with an X-Profile header or ?_profile= (bookings/profiling.py);
+# RAILWAY_PROFILING=0 removes the middleware. Samples every PROFILE_INTERVAL seconds;
+# only the newest PROFILE_FILES_KEPT profile files stay in PROFILE_DIR.
+PROFILING = os.environ.get('RAILWAY_PROFILING', '1') == '1'
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR', BASE_DIR / 'profiles'))
+PROFILE_INTERVAL = 0.001
+PROFILE_FILES_KEPT = int(os.environ.get('PROFILE_FILES_KEPT', 200))
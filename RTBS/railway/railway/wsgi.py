@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'railway.settings')
 
 application = get_wsgi_application()
+
+# bookings.forecasting (numpy) and bookings.pdf (xhtml2pdf)
+# are imported on first use. With `gunicorn --preload` and
+# RAILWAY_PRELOAD_HEAVY=1 the master imports them once instead, and forked
+# workers share those pages copy-on-write rather than each loading them.
+if os.environ.get('RAILWAY_PRELOAD_HEAVY') == '1':
+    import bookings.forecasting  # noqa: F401
+    import bookings.pdf  # noqa: F401